@@ -0,0 +1,306 @@
+# alert_daemon.py
+"""
+无界面告警进程：复用打分引擎与风险雷达规则，在每次数据刷新后评估状态，
+与上次持久化的状态比较，只把“状态切换”推送到 sink（本地 webhook / 文件 / stdout）。
+
+用法示例:
+    python alert_daemon.py --once --sink stdout
+    python alert_daemon.py --interval 3600 --sink webhook=http://127.0.0.1:8765/alerts --sink file=alerts.jsonl
+    python alert_daemon.py --once --panel-file panel.pkl --sink stdout      # 离线面板 (测试用)
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import urllib.request
+from datetime import datetime, timezone
+
+import pandas as pd
+
+from risk_rules import RISK_RULES, latest_rule_state
+from rolling_stats import tail_rows
+from score_engine import MODULE_WEIGHTS, compute_module_frames, latest_module_scores
+from shared_store import SourceMerger, ingest_panel, panel_version
+
+# ==========================================
+# 0. 参数
+# ==========================================
+# 评估只需要最新一行：最长的滚动窗口为 1260 个交易日 (~5 年) 外加差分回看，
+# 取最近 7 年即可得到与全量计算一致的最新值。
+ALERT_LOOKBACK_YEARS = 7
+# 滚动分位只算最后若干行（窗口仍取完整回看期），其余行不参与评估
+ALERT_TAIL_ROWS = 32
+# 每个 sink 的待补发队列上限：超出时丢弃最旧的事件 (并记日志)
+ALERT_PENDING_MAX = 500
+
+# 模块得分分档 (上界, 标签)：跨档即视为阈值切换
+SCORE_BANDS = [(40, '偏紧'), (60, '中性'), (float('inf'), '宽松')]
+
+DEFAULT_STATE_PATH = 'alert_state.json'
+
+
+def score_band(value):
+    if value is None or pd.isna(value):
+        return None
+    for upper, label in SCORE_BANDS:
+        if value < upper:
+            return label
+    return SCORE_BANDS[-1][1]
+
+
+# ==========================================
+# 1. 状态评估 / 比较
+# ==========================================
+def evaluate_state(panel, lookback_years=ALERT_LOOKBACK_YEARS, tail=ALERT_TAIL_ROWS):
+    """
+    对面板最新一行评估：规则触发状态 + 各模块得分与分档。
+    模块分取各模块表自身的最后一行（与仪表盘一致）；滚动分位只计算最后 tail 行。
+    """
+    panel = panel.sort_index()
+    if lookback_years:
+        panel = panel.loc[panel.index[-1] - pd.DateOffset(years=lookback_years):]
+    if tail:
+        with tail_rows(tail):
+            frames = compute_module_frames(panel)
+    else:
+        frames = compute_module_frames(panel)
+    fired = latest_rule_state(panel, frames)
+
+    latest = latest_module_scores(frames)
+    scores = {'Total': latest['Total']}
+    for key in MODULE_WEIGHTS:
+        scores[key] = latest[key]
+    return {
+        'as_of': panel.index[-1].strftime('%Y-%m-%d'),
+        'rules': fired,
+        'scores': {key: round(val, 2) for key, val in scores.items()},
+        'bands': {key: score_band(val) for key, val in scores.items()},
+    }
+
+
+def diff_states(prev, curr):
+    """比较两次状态，返回切换事件列表（首次运行 prev 为空时不产生事件）"""
+    if not prev:
+        return []
+    events = []
+    for rule, on in curr['rules'].items():
+        was = prev.get('rules', {}).get(rule)
+        if was is not None and was != on:
+            spec = RISK_RULES[rule]
+            events.append({
+                'type': 'rule', 'key': rule, 'name': spec['name'], 'module': spec['module'],
+                'level': spec['level'], 'from': was, 'to': on,
+                'status': '触发' if on else '解除',
+            })
+    for key, band in curr['bands'].items():
+        was = prev.get('bands', {}).get(key)
+        if was is not None and band is not None and was != band:
+            events.append({
+                'type': 'band', 'key': key, 'from': was, 'to': band,
+                'score': curr['scores'].get(key),
+            })
+    for ev in events:
+        ev['as_of'] = curr['as_of']
+    return events
+
+
+def load_state(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_state(path, state):
+    """先写临时文件再替换，避免进程中断留下半个 JSON"""
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+# ==========================================
+# 2. 推送 Sink
+# ==========================================
+class StdoutSink:
+    key = 'stdout'
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+
+    def send(self, events):
+        for ev in events:
+            self.stream.write(json.dumps(ev, ensure_ascii=False) + "\n")
+        self.stream.flush()
+
+
+class FileSink:
+    """按行追加 JSON (jsonl)"""
+
+    def __init__(self, path):
+        self.path = path
+        self.key = f"file={path}"
+
+    def send(self, events):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            for ev in events:
+                f.write(json.dumps(ev, ensure_ascii=False) + "\n")
+
+
+class WebhookSink:
+    """一次 POST 推送本轮全部事件: {"events": [...]}"""
+
+    def __init__(self, url, timeout=10):
+        self.url = url
+        self.timeout = timeout
+        self.key = f"webhook={url}"
+
+    def send(self, events):
+        body = json.dumps({'events': events}, ensure_ascii=False).encode('utf-8')
+        req = urllib.request.Request(
+            self.url, data=body, method='POST',
+            headers={'Content-Type': 'application/json; charset=utf-8'},
+        )
+        with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+            resp.read()
+
+
+def build_sink(spec):
+    """stdout | file=路径 | webhook=URL"""
+    kind, _, target = spec.partition('=')
+    if kind == 'stdout':
+        return StdoutSink()
+    if kind == 'file' and target:
+        return FileSink(target)
+    if kind == 'webhook' and target:
+        return WebhookSink(target)
+    raise ValueError(f"无法识别的 sink: {spec}")
+
+
+# ==========================================
+# 3. 主循环
+# ==========================================
+class AlertDaemon:
+    """
+    每轮：取面板 → 计算数据版本 → 版本未变且无待补发事件时直接跳过 (毫秒级)
+    → 版本变化时评估最新状态 → 与持久化状态比较 → 推送切换事件 → 保存状态。
+    推送失败的事件按 sink 留在状态文件的 pending 队列里，下一轮先补发，送达后才移除；
+    每个队列最多保留 ALERT_PENDING_MAX 个事件。
+    """
+
+    def __init__(self, loader, sinks, state_path=DEFAULT_STATE_PATH, lookback_years=ALERT_LOOKBACK_YEARS, log=None):
+        self.loader = loader
+        self.sinks = list(sinks)
+        self.state_path = state_path
+        self.lookback_years = lookback_years
+        self.log = log or (lambda msg: print(msg, file=sys.stderr))
+
+    def _deliver(self, pending, events):
+        """按 sink 推送 (待补发 + 本轮) 事件；返回仍未送达的队列"""
+        keys = [getattr(sink, 'key', type(sink).__name__) for sink in self.sinks]
+        carried = {key: list(pending.get(key, [])) for key in keys}
+        remaining = {}
+        # 已不在配置里的 sink (如 webhook 换了 URL)：队列转给同类 sink，没有同类时原样保留
+        for key, queue in pending.items():
+            if key in carried or not queue:
+                continue
+            heirs = [k for k in keys if k.partition('=')[0] == key.partition('=')[0]]
+            if heirs:
+                self.log(f"sink {key} 已不在配置中，{len(queue)} 个待补发事件转交 {', '.join(heirs)}")
+                for k in heirs:
+                    carried[k] = list(queue) + carried[k]
+            else:
+                self.log(f"sink {key} 已不在配置中且无同类 sink，{len(queue)} 个待补发事件继续保留")
+                remaining[key] = self._capped(key, list(queue))
+
+        for sink, key in zip(self.sinks, keys):
+            queue = carried[key] + list(events)
+            if not queue:
+                continue
+            try:
+                sink.send(queue)
+            except Exception as e:
+                self.log(f"推送失败 ({key})，{len(queue)} 个事件留待下轮补发: {e}")
+                remaining[key] = self._capped(key, queue)
+        return remaining
+
+    def _capped(self, key, queue):
+        """待补发队列超过上限时丢弃最旧的事件"""
+        if len(queue) <= ALERT_PENDING_MAX:
+            return queue
+        self.log(f"待补发队列 ({key}) 超过上限 {ALERT_PENDING_MAX}，丢弃最旧的 {len(queue) - ALERT_PENDING_MAX} 个事件")
+        return queue[-ALERT_PENDING_MAX:]
+
+    def run_once(self):
+        """执行一轮，返回本轮新产生的事件列表"""
+        panel = self.loader()
+        if panel is None or panel.empty:
+            self.log("数据为空，保留上次状态")
+            return []
+
+        prev = load_state(self.state_path)
+        pending = prev.get('pending', {})
+        version = panel_version(panel)
+        if prev.get('version') == version:
+            if not pending:
+                return []
+            state, events = prev, []
+        else:
+            state = evaluate_state(panel, self.lookback_years)
+            state['version'] = version
+            state['checked_at'] = datetime.now(timezone.utc).isoformat(timespec='seconds')
+            events = diff_states(prev, state)
+
+        remaining = self._deliver(pending, events)
+        state = {key: val for key, val in state.items() if key != 'pending'}
+        if remaining:
+            state['pending'] = remaining
+        save_state(self.state_path, state)
+        return events
+
+    def run_forever(self, interval):
+        while True:
+            started = time.time()
+            try:
+                events = self.run_once()
+                self.log(f"[{datetime.now():%Y-%m-%d %H:%M:%S}] 本轮事件 {len(events)} 个，用时 {time.time() - started:.2f}s")
+            except Exception as e:
+                self.log(f"本轮评估失败: {e}")
+            time.sleep(max(interval - (time.time() - started), 1))
+
+
+def _panel_loader(args):
+    if args.panel_file:
+        from config import SERIES_UNITS, SOURCE_RULES
+        path = args.panel_file
+        read = lambda: pd.read_pickle(path) if path.endswith('.pkl') else pd.read_csv(path, index_col=0, parse_dates=True)
+        return lambda: ingest_panel(read(), SERIES_UNITS, SOURCE_RULES)
+
+    from config import API_KEY, SERIES_IDS, SOURCE_RULES
+    from data_engine import fetch_mixed_data
+    merger = SourceMerger(SOURCE_RULES)
+    return lambda: fetch_mixed_data(API_KEY, SERIES_IDS, start_date=args.start_date, merger=merger)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="宏观风险雷达告警进程")
+    parser.add_argument('--sink', action='append', default=[], help="stdout | file=路径 | webhook=URL，可重复")
+    parser.add_argument('--state', default=DEFAULT_STATE_PATH, help="状态文件路径")
+    parser.add_argument('--interval', type=int, default=3600, help="轮询间隔 (秒)")
+    parser.add_argument('--once', action='store_true', help="只运行一轮")
+    parser.add_argument('--start-date', default='2010-01-01')
+    parser.add_argument('--panel-file', help="离线面板文件 (.pkl / .csv)，代替在线拉取")
+    args = parser.parse_args(argv)
+
+    sinks = [build_sink(spec) for spec in (args.sink or ['stdout'])]
+    daemon = AlertDaemon(_panel_loader(args), sinks, state_path=args.state)
+    if args.once:
+        daemon.run_once()
+    else:
+        daemon.run_forever(args.interval)
+
+
+if __name__ == '__main__':
+    main()
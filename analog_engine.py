@@ -0,0 +1,208 @@
+# analog_engine.py
+import numpy as np
+import pandas as pd
+
+from score_engine import align_weekly
+from shared_store import versioned_cache
+
+# ==========================================
+# 历史相似情景 (Analog) 引擎
+# ==========================================
+# 以 A-G 七个模块得分 (可附加原始特征) 组成的向量刻画宏观状态：
+# 特征标准化后做向量化 kNN，近邻之间保持最小时间间隔 (避免同一段行情被重复选中)，
+# 再对 SPX / BTC / GLD 做一次批量前瞻收益查表，得到近邻之后的收益分布。
+# 模块得分保留缺失（不用回测口径的 50 填充）：某日尚未上线的模块不参与该日的距离计算。
+
+ANALOG_FEATURES = [f'Score_{key}' for key in 'ABCDEFG']
+ANALOG_HORIZONS = {'1M': 21, '3M': 63, '6M': 126}
+# 查询日与候选日至少要有这么多个共同有效维度才参与比较
+ANALOG_MIN_DIMS = 4
+
+
+def analog_features(frames, index):
+    """
+    日频 A-G 模块得分 (Score_A..G)，保留缺失：各模块按日期前向对齐，候选日只含当日已有的数据；
+    周频 A 仅最后一天（默认查询行）取 A 表最后一行。模块尚未上线的日期为 NaN。
+    """
+    features = pd.DataFrame(index=index)
+    for col in ANALOG_FEATURES:
+        frame = frames.get(col[-1])
+        if frame is None or frame.empty or 'Total_Score' not in frame.columns:
+            features[col] = np.nan
+        elif col == 'Score_A':
+            features[col] = align_weekly(frame['Total_Score'], index)
+        else:
+            features[col] = frame['Total_Score'].dropna().reindex(index, method='ffill')
+    return features.astype(np.float64)
+
+
+def _spaced_pick(order, stamps, gap_ns, k):
+    """按距离顺序挑选，跳过与已选日期间隔不足的候选"""
+    chosen = []
+    for i in order:
+        if chosen and np.min(np.abs(stamps[chosen] - stamps[i])) < gap_ns:
+            continue
+        chosen.append(int(i))
+        if len(chosen) == k:
+            break
+    return chosen
+
+
+class AnalogIndex:
+    """
+    特征矩阵索引：标准化后存为 (日期 × 特征) float64 连续块，缺失保留为 NaN。
+    距离只在查询日与候选日共同有效的维度上计算，再按查询日有效维度数等比放大，
+    共同维度少于 min_dims 的候选不参与比较。
+    """
+
+    def __init__(self, features, weights=None, min_dims=ANALOG_MIN_DIMS):
+        features = features.dropna(how='all')
+        self.dates = features.index
+        self.columns = list(features.columns)
+        self.raw = features
+        self.min_dims = min(min_dims, len(self.columns))
+        mean = features.mean()
+        scale = features.std(ddof=0).replace(0, 1.0).fillna(1.0)
+        w = pd.Series(1.0, index=self.columns)
+        if weights:
+            w = w.mul(pd.Series(weights), fill_value=1.0).reindex(self.columns)
+        self.matrix = np.ascontiguousarray(((features - mean) / scale * w).to_numpy(dtype=np.float64))
+        self.valid = ~np.isnan(self.matrix)
+
+    @property
+    def empty(self):
+        return len(self.dates) == 0
+
+    def query(self, k=5, min_gap=90, at=None):
+        """
+        查找与 at (默认最新一行) 最相似的 k 个历史日期。
+        近邻必须早于查询日 min_gap 天以上，且彼此间隔不少于 min_gap 天。
+        返回 DataFrame: index=日期, 列 = 距离 + 各特征原值（当日未上线的维度为空）。
+        """
+        cols = ['距离'] + self.columns
+        if self.empty:
+            return pd.DataFrame(columns=cols)
+        pos = len(self.dates) - 1 if at is None else int(self.dates.get_indexer([pd.Timestamp(at)], method='pad')[0])
+        if pos < 0:
+            return pd.DataFrame(columns=cols)
+
+        gap = pd.Timedelta(days=min_gap)
+        n_cand = int(self.dates.searchsorted(self.dates[pos] - gap, side='right'))
+        q_valid = self.valid[pos]
+        if n_cand == 0 or q_valid.sum() < self.min_dims:
+            return pd.DataFrame(columns=cols)
+
+        common = self.valid[:n_cand] & q_valid
+        n_common = common.sum(axis=1)
+        diff = np.where(common, self.matrix[:n_cand] - np.where(q_valid, self.matrix[pos], 0.0), 0.0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            dist = np.sqrt(np.einsum('ij,ij->i', diff, diff) * q_valid.sum() / n_common)
+        live = np.flatnonzero(n_common >= self.min_dims)
+        if len(live) == 0:
+            return pd.DataFrame(columns=cols)
+
+        # 先取足够多的候选再按时间间隔去重（候选不足时退化为全排序）
+        m = min(len(live), max(k * 40, 200))
+        cand = live[np.argpartition(dist[live], m - 1)[:m]] if m < len(live) else live
+        cand = cand[np.argsort(dist[cand], kind='stable')]
+        stamps = self.dates.asi8
+        chosen = _spaced_pick(cand, stamps, gap.value, k)
+        if len(chosen) < k and m < len(live):
+            chosen = _spaced_pick(live[np.argsort(dist[live], kind='stable')], stamps, gap.value, k)
+
+        out = self.raw.iloc[chosen].copy()
+        out.insert(0, '距离', dist[chosen])
+        return out
+
+
+def build_analog_index(features, extra=None, weights=None):
+    """由模块得分表 (Score_A..G，见 analog_features) 构建索引；extra 为可选的原始特征 (按日期对齐后前向填充)"""
+    if features is None or features.empty:
+        return AnalogIndex(pd.DataFrame(columns=ANALOG_FEATURES))
+    cols = [c for c in ANALOG_FEATURES if c in features.columns]
+    features = features[cols].astype(np.float64)
+    if extra is not None and not extra.empty:
+        features = features.join(extra.reindex(features.index, method='ffill').astype(np.float64))
+    return AnalogIndex(features, weights=weights)
+
+
+# ---------- 按数据版本缓存 ----------
+_INDEX_CACHE = versioned_cache('analog_index')
+
+
+def analog_index(frames, index, version=None):
+    """A-G 模块得分索引；version 非空时进程内缓存"""
+    return _INDEX_CACHE.get(version, lambda: build_analog_index(analog_features(frames, index)))
+
+
+def forward_return_table(prices, anchors, horizons=None):
+    """
+    批量前瞻收益 (%)：prices 为 (日期 × 资产) 价格表，anchors 为锚点日期。
+    锚点价格取锚点当日或之前最近一个有效价，未来价格取锚点起第 h 个交易日；
+    剩余样本不足 h 天的记为 NaN。返回 index=锚点, 列 = (资产, 期限)。
+    """
+    horizons = horizons or ANALOG_HORIZONS
+    anchors = pd.DatetimeIndex(anchors)
+    labels = list(horizons.keys())
+    steps = np.array([horizons[h] for h in labels], dtype=np.int64)
+    cols = pd.MultiIndex.from_product([list(prices.columns), labels], names=['资产', '期限'])
+    out = np.full((len(anchors), len(cols)), np.nan)
+
+    for j, asset in enumerate(prices.columns):
+        s = prices[asset].dropna()
+        s = s[s > 0]
+        if s.empty or len(anchors) == 0:
+            continue
+        vals = s.to_numpy(dtype=np.float64)
+        base_pos = s.index.searchsorted(anchors, side='right') - 1
+        start_pos = s.index.searchsorted(anchors, side='left')
+        fut_pos = start_pos[:, None] + steps[None, :] - 1
+        ok = (base_pos[:, None] >= 0) & (fut_pos < len(vals))
+        base = vals[np.clip(base_pos, 0, len(vals) - 1)][:, None]
+        fut = vals[np.clip(fut_pos, 0, len(vals) - 1)]
+        out[:, j * len(labels):(j + 1) * len(labels)] = np.where(ok, (fut / base - 1) * 100, np.nan)
+
+    return pd.DataFrame(out, index=anchors, columns=cols)
+
+
+def summarize_forward_returns(table):
+    """近邻前瞻收益分布：样本数 / 均值 / 中位数 / 胜率 / 最差 / 最好"""
+    cols = ['资产', '期限', '样本数', '均值(%)', '中位数(%)', '胜率', '最差(%)', '最好(%)']
+    if table.empty:
+        return pd.DataFrame(columns=cols)
+    count = table.count()
+    summary = pd.DataFrame({
+        '样本数': count,
+        '均值(%)': table.mean(),
+        '中位数(%)': table.median(),
+        '胜率': (table > 0).sum() / count.replace(0, np.nan),
+        '最差(%)': table.min(),
+        '最好(%)': table.max(),
+    })
+    return summary.rename_axis(['资产', '期限']).reset_index()[cols]
+
+
+def find_analogs(index, prices, k=5, min_gap=90, horizons=None, at=None):
+    """一次完成：kNN (index 见 analog_index) → 前瞻收益查表 → 分布汇总"""
+    neighbors = index.query(k=k, min_gap=min_gap, at=at)
+    table = forward_return_table(prices, neighbors.index, horizons)
+    return neighbors, table, summarize_forward_returns(table)
+
+
+def analog_context(neighbors, table, summary, horizon='3M'):
+    """供 AI 上下文使用的精简结构"""
+    if neighbors.empty:
+        return {'last_similar': [], 'what_happened_next': 'Not enough history'}
+    rows = summary[summary['期限'] == horizon]
+    parts = []
+    for _, r in rows.iterrows():
+        if r['样本数'] > 0:
+            parts.append(
+                f"{r['资产']} {horizon} fwd: mean {r['均值(%)']:.1f}%, median {r['中位数(%)']:.1f}%, "
+                f"win {r['胜率']:.0%} (n={int(r['样本数'])})"
+            )
+    return {
+        'last_similar': [d.strftime('%Y-%m-%d') for d in neighbors.index],
+        'similarity_distance': [round(float(x), 2) for x in neighbors['距离']],
+        'what_happened_next': '; '.join(parts) if parts else 'Not enough history',
+    }
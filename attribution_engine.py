@@ -0,0 +1,174 @@
+# attribution_engine.py
+from collections import OrderedDict
+
+import pandas as pd
+
+from score_engine import MODULE_WEIGHTS
+from shared_store import versioned_cache
+
+# ==========================================
+# 因子归因：全历史贡献矩阵
+# ==========================================
+# 仪表盘 “Lift / Drag” 原先对每个因子单独取最新值和一周前的值（逐个 get_indexer），
+# 只能得到最新一周的变化。这里把 A-G 全部因子（含 TGA / 吸收惩罚效应）写成
+# 日期 × 因子 的加权贡献矩阵，周 / 月 / 年变化一次向量化求出，结果按数据版本缓存。
+# 贡献 = 模块内加权得分 × 模块权重，单位为总分点数。
+# additive=False 的条目是惩罚的“效应”视角，其数值已含在同模块其他因子里，不参与模块求和。
+
+
+def _a_base(df):
+    return (
+        df['Score_NetLiq_Adj'] * 0.45 + df['Score_TGA'] * 0.20 +
+        df['Score_RRP'] * 0.25 + df['Score_Reserves'] * 0.10
+    )
+
+
+def _b_residual(df):
+    return 1 - df['SRF_Weight']
+
+
+ATTRIBUTION_FACTORS = OrderedDict([
+    # A 模块
+    ('Net Liquidity', {'module': 'A', 'bucket': 'Flow',
+                       'calc': lambda df: df['Score_NetLiq_Adj'] * 0.45 * df['TGA_Penalty_Total']}),
+    ('TGA', {'module': 'A', 'bucket': 'Flow',
+             'calc': lambda df: df['Score_TGA'] * 0.20 * df['TGA_Penalty_Total']}),
+    ('ON RRP', {'module': 'A', 'bucket': 'Flow',
+                'calc': lambda df: df['Score_RRP'] * 0.25 * df['TGA_Penalty_Total']}),
+    ('Reserves', {'module': 'A', 'bucket': 'Level',
+                  'calc': lambda df: df['Score_Reserves'] * 0.10 * df['TGA_Penalty_Total']}),
+    ('TGA Penalty', {'module': 'A', 'bucket': 'Penalty', 'additive': False,
+                     'calc': lambda df: _a_base(df) * (df['TGA_Penalty_Total'] - 1.0)}),
+    ('Sink Penalty', {'module': 'A', 'bucket': 'Penalty', 'additive': False,
+                      'calc': lambda df: (df['Score_NetLiq_Adj'] - df['Score_NetLiq']) * 0.45 * df['TGA_Penalty_Total']}),
+
+    # B 模块
+    ('SOFR Policy', {'module': 'B', 'bucket': 'Level', 'calc': lambda df: df['Score_Policy'] * 0.40}),
+    ('F1 Friction', {'module': 'B', 'bucket': 'Flow', 'calc': lambda df: df['Score_F1'] * _b_residual(df) * 0.40 * 0.60}),
+    ('F2 Friction', {'module': 'B', 'bucket': 'Flow', 'calc': lambda df: df['Score_F2'] * _b_residual(df) * 0.30 * 0.60}),
+    ('F3 Friction', {'module': 'B', 'bucket': 'Flow', 'calc': lambda df: df['Score_F3'] * _b_residual(df) * 0.30 * 0.60}),
+    ('SRF', {'module': 'B', 'bucket': 'Penalty', 'calc': lambda df: df['Score_SRF'] * df['SRF_Weight'] * 0.60}),
+
+    # C 模块
+    ('10Y Nominal Rate', {'module': 'C', 'bucket': 'Level', 'calc': lambda df: df['Score_10Y'] * 0.20}),
+    ('2Y Rate', {'module': 'C', 'bucket': 'Level', 'calc': lambda df: df['Score_2Y'] * 0.10}),
+    ('30Y Rate', {'module': 'C', 'bucket': 'Level', 'calc': lambda df: df['Score_30Y'] * 0.10}),
+    ('2s10s Curve', {'module': 'C', 'bucket': 'Flow', 'calc': lambda df: df['Score_Curve_2s10s'] * 0.30}),
+    ('3m10s Curve', {'module': 'C', 'bucket': 'Flow', 'calc': lambda df: df['Score_Curve_3m10s'] * 0.30}),
+    ('Curve Penalty', {'module': 'C', 'bucket': 'Penalty', 'calc': lambda df: df['Total_Score'] - df['Total_Score1']}),
+
+    # D 模块
+    ('10Y Real Rate', {'module': 'D', 'bucket': 'Level', 'calc': lambda df: df['Score_Real_10Y'] * 0.40}),
+    ('5Y Real Rate', {'module': 'D', 'bucket': 'Level', 'calc': lambda df: df['Score_Real_5Y'] * 0.30}),
+    ('10Y Breakeven', {'module': 'D', 'bucket': 'Flow', 'calc': lambda df: df['Score_Breakeven'] * 0.30}),
+
+    # E 模块
+    ('DXY', {'module': 'E', 'bucket': 'Flow', 'calc': lambda df: df['Score_DXY'] * 0.20}),
+    ('Broad USD', {'module': 'E', 'bucket': 'Flow', 'calc': lambda df: df['Score_USD'] * 0.20}),
+    ('Yen/Carry', {'module': 'E', 'bucket': 'Flow', 'calc': lambda df: df['Score_Yen_Total'] * 0.30}),
+    ('Energy', {'module': 'E', 'bucket': 'Flow', 'calc': lambda df: df['Score_Energy'] * 0.30}),
+
+    # F / G 模块
+    ('HY Credit', {'module': 'F', 'bucket': 'Level', 'calc': lambda df: df['Score_HY_Level'] * 0.50}),
+    ('BAA10Y', {'module': 'F', 'bucket': 'Level', 'calc': lambda df: df['Score_BAA_Level'] * 0.20}),
+    ('HY Trend', {'module': 'F', 'bucket': 'Flow', 'calc': lambda df: df['Score_HY_Trend'] * 0.30}),
+    ('VIX', {'module': 'G', 'bucket': 'Level', 'calc': lambda df: df['Score_VIX'] * 0.30}),
+    ('VIX/VXV', {'module': 'G', 'bucket': 'Level', 'calc': lambda df: df['Score_Term'] * 0.40}),
+    ('Risk vs Safe', {'module': 'G', 'bucket': 'Flow', 'calc': lambda df: df['Score_Mom'] * 0.30}),
+])
+
+# 变化区间（自然日）：与页面 prev_week_value 一致，取最接近 N 天前的一期
+ATTRIBUTION_HORIZONS = OrderedDict([('WoW', 7), ('MoM', 30), ('YoY', 365)])
+
+ATTRIBUTION_BUCKETS = ['Level', 'Flow', 'Penalty']
+
+
+def _lagged_delta(series, days):
+    """每期相对 days 天前最近一期的变化（nearest 匹配，整段历史一次 get_indexer）"""
+    idx = series.index
+    pos = idx.get_indexer(idx - pd.Timedelta(days=days), method='nearest')
+    vals = series.to_numpy(dtype=float)
+    return vals - vals[pos]
+
+
+def attribution_matrix(frames, index, horizons=None):
+    """
+    贡献矩阵与各区间变化矩阵（日期 × 因子，对齐到 index 并前向填充）。
+    因子在各自模块表的有效日期上计算变化，再对齐，最新一行即各因子的最新变化。
+    """
+    horizons = horizons or ATTRIBUTION_HORIZONS
+    factors, meta = {}, []
+    for name, spec in ATTRIBUTION_FACTORS.items():
+        module = spec['module']
+        frame = frames.get(module)
+        if frame is None or frame.empty:
+            continue
+        try:
+            series = spec['calc'](frame)
+        except KeyError:
+            continue
+        series = (series * MODULE_WEIGHTS[module]).dropna()
+        if series.shape[0] < 2:
+            continue
+        factors[name] = series
+        meta.append({'name': name, 'module': module, 'bucket': spec['bucket'],
+                     'additive': spec.get('additive', True)})
+
+    # 周频 A 表的标签日 (W-WED) 可能晚于面板最后一天：补进索引，保证最新一行是各因子的最新一期
+    for series in factors.values():
+        if len(index) and series.index[-1] > index[-1]:
+            index = index.union(series.index[series.index > index[-1]])
+
+    contrib, deltas = {}, {label: {} for label in horizons}
+    for name, series in factors.items():
+        contrib[name] = series.reindex(index, method='ffill')
+        for label, days in horizons.items():
+            deltas[label][name] = pd.Series(_lagged_delta(series, days), index=series.index).reindex(index, method='ffill')
+
+    names = [row['name'] for row in meta]
+    return {
+        'contrib': pd.DataFrame(contrib, index=index, columns=names),
+        'deltas': {label: pd.DataFrame(cols, index=index, columns=names) for label, cols in deltas.items()},
+        'meta': pd.DataFrame(meta, columns=['name', 'module', 'bucket', 'additive']).set_index('name'),
+    }
+
+
+def latest_deltas(attribution, horizon='WoW'):
+    """最新一期各因子变化：name / delta / bucket / module（Lift / Drag 表）"""
+    meta = attribution['meta']
+    frame = attribution['deltas'][horizon]
+    if frame.empty:
+        return pd.DataFrame(columns=['name', 'delta', 'bucket', 'module'])
+    latest = frame.iloc[-1]
+    out = pd.DataFrame({
+        'name': latest.index,
+        'delta': latest.to_numpy(dtype=float),
+        'bucket': meta.loc[latest.index, 'bucket'].to_numpy(),
+        'module': meta.loc[latest.index, 'module'].to_numpy(),
+    })
+    return out.dropna(subset=['delta']).reset_index(drop=True)
+
+
+def module_contributions(attribution):
+    """各模块对总分的加权贡献（只累加 additive 因子，合计即加权总分）"""
+    meta = attribution['meta']
+    contrib = attribution['contrib']
+    additive = meta.index[meta['additive'].astype(bool)]
+    return contrib[additive].T.groupby(meta.loc[additive, 'module']).sum(min_count=1).T
+
+
+def bucket_deltas(attribution, horizon='WoW'):
+    """按 Level / Flow / Penalty 汇总的变化（日期 × 桶）"""
+    meta = attribution['meta']
+    frame = attribution['deltas'][horizon]
+    out = frame.T.groupby(meta['bucket']).sum(min_count=1).T
+    return out.reindex(columns=ATTRIBUTION_BUCKETS).fillna(0.0)
+
+
+# ---------- 按数据版本缓存 ----------
+_ATTRIBUTION_CACHE = versioned_cache('attribution')
+
+
+def factor_attribution(frames, index, version=None):
+    """一次计算贡献矩阵与周 / 月 / 年变化；version 非空时进程内缓存"""
+    return _ATTRIBUTION_CACHE.get(version, lambda: attribution_matrix(frames, index))
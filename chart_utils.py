@@ -0,0 +1,196 @@
+# chart_utils.py
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+import plotly.io as pio
+import streamlit as st
+
+# ==========================================
+# 图表降采样 (分桶极值) 与渲染
+# ==========================================
+# 日频历史动辄数千点 × 多条线，每次 rerun 都把完整 JSON 发给浏览器。
+# 图表容器宽度有限，超过像素预算的点肉眼不可见：
+# - 普通折线：按横轴分桶，每桶保留最高 / 最低点 (reduceat 一次求出，无逐点循环)，折线包络与全局极值不丢；
+#   共用同一横轴的多条线取同一组下标，x unified 悬浮提示在各线上对齐到同一日期
+# - 阶梯线 (shape='hv')：只保留取值变化点，无损
+# - 平滑曲线 (spline)、柱状图、纯散点（买卖点等事件标注）不做处理
+# 处理后点数仍超过阈值时切换为 WebGL (Scattergl) 渲染。
+
+CHART_PIXEL_BUDGET = 1200   # 单条线保留的点数上限（≈ 宽屏图表像素宽度）
+GL_POINT_THRESHOLD = 5000   # 整张图点数超过该值时改用 Scattergl
+
+_ARRAY_PROPS = ('customdata', 'text', 'hovertext')
+
+
+def _bucket_extremes(ys, n_buckets):
+    """ys: (线数 × 点数)；按点序等分为 n_buckets 桶，返回各线每桶最高 / 最低点下标的并集"""
+    k, n = ys.shape
+    starts = np.unique((np.arange(n_buckets) * n) // n_buckets)
+    bucket = np.repeat(np.arange(len(starts)), np.diff(np.r_[starts, n]))
+    picked = []
+    with np.errstate(invalid='ignore'):
+        for reduce in (np.fmax, np.fmin):
+            ext = reduce.reduceat(ys, starts, axis=1)
+            hit_row, hit_col = np.nonzero(ys == ext[:, bucket])
+            # 每条线每桶只取第一个命中点
+            key = hit_row * len(starts) + bucket[hit_col]
+            first = np.r_[True, key[1:] != key[:-1]]
+            picked.append(hit_col[first])
+    return np.unique(np.concatenate(picked))
+
+
+def downsample_indices(y, n_out=CHART_PIXEL_BUDGET):
+    """
+    折线降采样下标：y 为一条线 (点数,) 或共用横轴的多条线 (线数 × 点数)，返回共用的保留下标。
+    取能让保留点数不超过 n_out 的最多分桶数（二分），首尾点必保留；
+    缺失值 (NaN) 段保留段首一个点，折线断口位置不变。
+    """
+    ys = np.atleast_2d(np.asarray(y, dtype=np.float64))
+    n = ys.shape[1]
+    if n <= n_out:
+        return np.arange(n)
+    valid = ~np.isnan(ys)
+    gap_starts = np.nonzero((~valid & np.c_[np.ones((len(ys), 1), bool), valid[:, :-1]]).any(axis=0))[0]
+    fixed = np.unique(np.r_[0, n - 1, gap_starts])
+
+    lo, hi = 1, max(n_out // 2, 1)
+    keep = _bucket_extremes(ys, lo)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        cand = _bucket_extremes(ys, mid)
+        if len(np.union1d(cand, fixed)) <= n_out:
+            lo, keep = mid, cand
+        else:
+            hi = mid - 1
+    return np.union1d(keep, fixed)
+
+
+def step_indices(y):
+    """阶梯线无损压缩：只保留首点、取值变化点与末点"""
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    if n <= 2:
+        return np.arange(n)
+    same = (y[1:] == y[:-1]) | (np.isnan(y[1:]) & np.isnan(y[:-1]))
+    changed = np.nonzero(~same)[0] + 1
+    return np.unique(np.concatenate([[0], changed, [n - 1]]))
+
+
+def _slice_trace(trace, idx):
+    n = len(trace.y)
+    updates = {'x': np.asarray(trace.x)[idx], 'y': np.asarray(trace.y)[idx]}
+    for prop in _ARRAY_PROPS:
+        val = getattr(trace, prop, None)
+        if val is not None and not isinstance(val, str) and len(val) == n:
+            updates[prop] = np.asarray(val)[idx]
+    trace.update(updates)
+
+
+def _reducible(trace):
+    if trace.type != 'scatter' or trace.x is None or trace.y is None:
+        return False
+    mode = trace.mode or 'lines'
+    if 'lines' not in mode:
+        return False
+    return trace.line.shape != 'spline'
+
+
+def _x_key(trace):
+    """横轴分组键：点数相同且横轴取值完全一致的折线共用一组降采样下标"""
+    x = np.asarray(trace.x)
+    return len(x), hash(x.tobytes()) if x.dtype != object else hash(tuple(map(str, x)))
+
+
+def optimize_figure(fig, max_points=CHART_PIXEL_BUDGET, gl_threshold=GL_POINT_THRESHOLD):
+    """对长时间序列折线降采样；点数仍然很多时切换到 Scattergl（原地修改并返回 fig）"""
+    groups = OrderedDict()
+    for trace in fig.data:
+        if not (_reducible(trace) and len(trace.y) > 2):
+            continue
+        if trace.line.shape == 'hv':
+            idx = step_indices(trace.y)
+            if len(idx) < len(trace.y):
+                _slice_trace(trace, idx)
+        elif len(trace.y) > max_points:
+            groups.setdefault(_x_key(trace), []).append(trace)
+
+    for traces in groups.values():
+        idx = downsample_indices(np.vstack([np.asarray(t.y, dtype=np.float64) for t in traces]), max_points)
+        if len(idx) < len(traces[0].y):
+            for trace in traces:
+                _slice_trace(trace, idx)
+
+    total = sum(len(trace.y) for trace in fig.data if trace.type == 'scatter' and trace.y is not None)
+
+    if total > gl_threshold:
+        traces = []
+        for trace in fig.data:
+            if trace.type == 'scatter' and trace.line.shape != 'spline':
+                spec = trace.to_plotly_json()
+                spec.pop('type', None)
+                try:
+                    trace = go.Scattergl(spec)
+                except ValueError:
+                    pass
+            traces.append(trace)
+        fig.data = ()
+        fig.add_traces(traces)
+    return fig
+
+
+def show_chart(fig, **kwargs):
+    """st.plotly_chart 的替代：渲染前先做降采样"""
+    return st.plotly_chart(optimize_figure(fig), **kwargs)
+
+
+# ==========================================
+# 版本化图表缓存 (进程级 LRU)
+# ==========================================
+# 图表只依赖数据版本和少量视图参数：同一版本下无控件变化的 rerun 直接取缓存 JSON，
+# 跳过取数 / 重采样 / add_trace 等构建步骤。数据刷新后版本变化，旧条目自然淘汰。
+
+FIGURE_CACHE_SIZE = 128
+_FIGURE_CACHE = OrderedDict()
+_FIGURE_CACHE_LOCK = threading.Lock()
+_EMPTY = ''
+
+
+def _params_key(params):
+    if not params:
+        return ()
+    return tuple(sorted((str(k), repr(v)) for k, v in params.items()))
+
+
+def cached_figure(page, fig_id, version, build, params=None):
+    """
+    按 (页面, 图表, 数据版本, 视图参数) 缓存图表。
+    build() 返回 go.Figure 或 None（数据不足）；version 为 None 时不缓存。
+    """
+    if version is None:
+        fig = build()
+        return None if fig is None else optimize_figure(fig)
+
+    key = (page, fig_id, version, _params_key(params))
+    with _FIGURE_CACHE_LOCK:
+        spec = _FIGURE_CACHE.get(key)
+        if spec is not None:
+            _FIGURE_CACHE.move_to_end(key)
+    if spec is not None:
+        return None if spec == _EMPTY else pio.from_json(spec)
+
+    fig = build()
+    if fig is not None:
+        optimize_figure(fig)
+    with _FIGURE_CACHE_LOCK:
+        _FIGURE_CACHE[key] = _EMPTY if fig is None else fig.to_json()
+        while len(_FIGURE_CACHE) > FIGURE_CACHE_SIZE:
+            _FIGURE_CACHE.popitem(last=False)
+    return fig
+
+
+def clear_figure_cache():
+    with _FIGURE_CACHE_LOCK:
+        _FIGURE_CACHE.clear()
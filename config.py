@@ -1,12 +1,25 @@
 # config.py
+import os
+
 import streamlit as st
 
 # ==========================================
 # 0. 核心配置API
 # ==========================================
-API_KEY = st.secrets["FRED_API_KEY"]
+def _secret(name, default=None):
+    """优先读取 Streamlit secrets；无 secrets 文件（如后台告警进程）时回退到环境变量"""
+    try:
+        return st.secrets[name]
+    except Exception:
+        return os.environ.get(name, default)
+
+
+API_KEY = _secret("FRED_API_KEY")
+
+GEMINI_API_KEY = _secret("GEMINI_API_KEY")
 
-GEMINI_API_KEY = st.secrets["GEMINI_API_KEY"]
+# 紧凑模式（可选）：面板与模块分数表压缩为 float32，多会话部署时内存减半
+COMPACT_MODE = str(_secret("COMPACT_MODE", False)).lower() in ("1", "true", "yes")
 
 # FRED Series IDs
 SERIES_IDS = {
@@ -32,6 +45,38 @@ SERIES_IDS = {
     
 }
 
+# 各序列的发布单位（FRED / Yahoo 原始口径）。入库时一次换算为规范单位：
+# 金额 → 十亿美元 (USD_bn)，利率 / 利差 → 百分比 (pct)；下游模块不再猜测单位
+SERIES_UNITS = {
+    'WALCL': 'USD_mn', 'WTREGEN': 'USD_mn', 'WRESBAL': 'USD_mn',
+    'RRPONTSYD': 'USD_bn', 'RPONTSYD': 'USD_bn',
+    'DFF': 'pct', 'SOFR': 'pct', 'IORB': 'pct', 'RRPONTSYAWARD': 'pct', 'TGCRRATE': 'pct',
+    'DGS1MO': 'pct', 'DGS3MO': 'pct', 'DGS6MO': 'pct', 'DGS1': 'pct', 'DGS2': 'pct',
+    'DGS3': 'pct', 'DGS5': 'pct', 'DGS7': 'pct', 'DGS10': 'pct', 'DGS20': 'pct', 'DGS30': 'pct',
+    'T10Y2Y': 'pct', 'T10Y3M': 'pct',
+    'DFII10': 'pct', 'DFII5': 'pct', 'T10YIE': 'pct',
+    'INDPRO': 'index', 'PCEPILFE': 'index',
+    'SP500': 'index',
+    'CBBTCUSD': 'USD',
+    'DTWEXBGS': 'index',
+    'DCOILWTICO': 'USD',
+    'DHHNGSP': 'USD',
+    'DEXJPUS': 'JPY',
+    'IRSTCI01JPM156N': 'pct',
+    'VIXCLS': 'index', 'VXVCLS': 'index',
+    'BAMLH0A0HYM2': 'pct',
+    'BAA10Y': 'pct',
+    'DXY': 'index', 'VIX_YH': 'index', 'VXV_YH': 'index',
+}
+
+# 多源序列合并规则：同一概念按优先级取第一个未过期的来源（Yahoo 更及时，FRED 补缺），
+# 入库后只保留规范列 (如 VIX) 与来源位掩码列 (如 VIX_SRC)。
+# DXY 与 DTWEXBGS 是两个不同的美元指数（模块 E 分别计分），不在此合并。
+SOURCE_RULES = {
+    'VIX': {'sources': ['VIX_YH', 'VIXCLS'], 'max_stale_days': 4},
+    'VXV': {'sources': ['VXV_YH', 'VXVCLS'], 'max_stale_days': 4},
+}
+
 MACRO_INDICATORS = {
     'CPI': 'USCPI',          # 消费者物价指数
     'Core_CPI': 'USCPIC',    # 核心CPI
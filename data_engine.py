@@ -4,14 +4,17 @@ import pandas as pd
 import streamlit as st
 from fredapi import Fred
 import yfinance as yf 
+from config import SERIES_UNITS, SOURCE_RULES
+from shared_store import SharedPanelStore, SourceMerger, ingest_panel
 
 # 强制忽略 SSL 证书验证
 ssl._create_default_https_context = ssl._create_unverified_context
 
-@st.cache_data(ttl=3600)
-def get_mixed_data(api_key, series_ids, start_date='2010-01-01'): 
+def fetch_mixed_data(api_key, series_ids, start_date='2010-01-01', merger=None):
     """
-    同时从 FRED 和 Yahoo Finance 获取数据并合并
+    同时从 FRED 和 Yahoo Finance 获取数据并合并（不缓存）。
+    入库时按 SERIES_UNITS 统一单位，按 SOURCE_RULES 合并重叠来源；
+    merger 为长驻的 SourceMerger 时多源合并只重算新到达的行。
     """
     # 1. 获取 FRED 数据
     df_fred = pd.DataFrame()
@@ -66,6 +69,51 @@ def get_mixed_data(api_key, series_ids, start_date='2010-01-01'):
     else:
         return pd.DataFrame()
 
-    # 4. 填充缺失值 (ffill)
-    return df_all.fillna(method='ffill').sort_index()
+    # 4. 入库：统一单位（金额 → 十亿美元，利率 → 百分比）→ 多源合并 → 填充缺失值 (ffill)
+    return ingest_panel(df_all, SERIES_UNITS, SOURCE_RULES, merger=merger)
+
 
+@st.cache_data(ttl=3600)
+def get_mixed_data(api_key, series_ids, start_date='2010-01-01'): 
+    """
+    会话级缓存版本（每个会话反序列化一份）
+    """
+    return fetch_mixed_data(api_key, series_ids, start_date=start_date)
+
+
+@st.cache_data(ttl=3600)
+def get_yahoo_close(tickers, start_date='2010-01-01'):
+    """
+    Yahoo 收盘价 (列 = ticker)，用于面板之外的资产 (如 GLD)；失败时返回空表
+    """
+    try:
+        raw = yf.download(list(tickers), start=start_date, auto_adjust=False, progress=False)
+    except Exception:
+        return pd.DataFrame()
+    if raw is None or raw.empty:
+        return pd.DataFrame()
+    if isinstance(raw.columns, pd.MultiIndex):
+        if "Close" not in raw.columns.levels[0]:
+            return pd.DataFrame()
+        close_df = raw["Close"].copy()
+    elif "Close" in raw.columns:
+        close_df = raw[["Close"]].copy()
+        close_df.columns = [list(tickers)[0]]
+    else:
+        return pd.DataFrame()
+    if close_df.index.tz is not None:
+        close_df.index = close_df.index.tz_localize(None)
+    return close_df.sort_index()
+
+
+@st.cache_resource
+def get_shared_store(api_key, series_ids, start_date='2010-01-01', compact=False):
+    """
+    进程级共享快照仓库：所有会话共用一份只读面板与模块分数表，每小时刷新
+    """
+    merger = SourceMerger(SOURCE_RULES)
+    return SharedPanelStore(
+        loader=lambda: fetch_mixed_data(api_key, series_ids, start_date=start_date, merger=merger),
+        ttl=3600,
+        compact=compact,
+    )
@@ -4,8 +4,9 @@ from datetime import datetime
 import pandas as pd
 
 # 1. 导入配置和数据引擎
-from config import API_KEY,GEMINI_API_KEY, SERIES_IDS, CSS_STYLE
-from data_engine import get_mixed_data
+from config import API_KEY,GEMINI_API_KEY, SERIES_IDS, CSS_STYLE, COMPACT_MODE
+from data_engine import get_mixed_data, get_shared_store
+from score_engine import validate_compact_mode
 
 # 2. 导入各个业务模块
 from modules.dashboard import render_dashboard_standalone
@@ -27,8 +28,10 @@ st.markdown(CSS_STYLE, unsafe_allow_html=True)
 # ==========================================
 # 数据加载
 # ==========================================
+# 进程级共享快照：面板与 A-G 模块表只计算一次，各会话拿零拷贝只读视图
 with st.spinner('正在同步美联储全量数据...'):
-    df_all = get_mixed_data(API_KEY, SERIES_IDS, start_date='2010-01-01')
+    snapshot = get_shared_store(API_KEY, SERIES_IDS, start_date='2010-01-01', compact=COMPACT_MODE).get()
+    df_all = snapshot.panel_view()
 
 # ==========================================
 # 主逻辑
@@ -89,24 +92,36 @@ if not df_all.empty:
                     st.session_state.nav_choice = label
                     st.rerun()
 
+        # 紧凑模式校验：float32 vs float64 的 Total_Score 偏差 + 各模块内存
+        if COMPACT_MODE:
+            with st.expander("🧪 紧凑模式 (float32) 校验"):
+                if st.button("运行校验", key="compact_validate", use_container_width=True):
+                    with st.spinner("正在以 float64 / float32 分别计算全部模块..."):
+                        df_raw = get_mixed_data(API_KEY, SERIES_IDS, start_date='2010-01-01')
+                        deviation, memory = validate_compact_mode(df_raw)
+                    st.dataframe(deviation, hide_index=True, use_container_width=True)
+                    st.dataframe(memory, hide_index=True, use_container_width=True)
+
     # 页面渲染（同页切换）
     if nav_choice == "DASHBOARD":
-        render_dashboard_standalone(df_all)
+        render_dashboard_standalone(
+            df_all, frames=snapshot.frames_view(), score_frame=snapshot.score_view(), score_cube=snapshot.cube_view(),
+        )
     elif nav_choice == "A. 系统流动性":
-        render_module_a(df_all)
+        render_module_a(df_all, frame=snapshot.frame_view('A'))
     elif nav_choice == "B. 资金价格与摩擦":
-        render_module_b(df_all)
+        render_module_b(df_all, frame=snapshot.frame_view('B'))
     elif nav_choice == "C. 国债期限结构":
-        render_module_c(df_all)
+        render_module_c(df_all, frame=snapshot.frame_view('C'))
     elif nav_choice == "D. 实际利率与通胀":
-        render_module_d(df_all)
+        render_module_d(df_all, frame=snapshot.frame_view('D'))
     elif nav_choice == "E. 外部冲击与汇率":
-        render_module_e(df_all)
+        render_module_e(df_all, frame=snapshot.frame_view('E'))
     elif nav_choice == "F. 信用压力":
-        render_module_f(df_all)
+        render_module_f(df_all, frame=snapshot.frame_view('F'))
     elif nav_choice == "G. 风险偏好":
-        render_module_g(df_all)
+        render_module_g(df_all, frame=snapshot.frame_view('G'))
     elif nav_choice == "量化回测":
-        render_backtest(df_all)
+        render_backtest(df_all, score_frame_full=snapshot.score_view())
 else:
     st.error("数据加载失败，请检查网络或 API Key。")
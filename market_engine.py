@@ -0,0 +1,97 @@
+# market_engine.py
+import numpy as np
+import pandas as pd
+
+# ==========================================
+# 行情矩阵：yfinance 结果解析一次，对齐到宏观分索引
+# ==========================================
+# 回测各资产页原先逐个探测 MultiIndex 层级取收盘价、去时区，再与分数表 join 出一张新表。
+# 这里把下载结果一次解析成 日期 × 资产 收盘价表，再对齐到分数表索引，得到连续的
+# 资产 × 日期 价格数组与有效性掩码；单资产回测、参数扫描、组合回测共用同一份对齐结果。
+
+
+def _ticker_close(raw, ticker):
+    """单个 ticker 的收盘价（Close 优先，缺失时用 Adj Close）；取不到时返回空序列"""
+    if isinstance(raw.columns, pd.MultiIndex):
+        lv0 = raw.columns.get_level_values(0)
+        lv1 = raw.columns.get_level_values(1)
+        # group_by='ticker'：(ticker, 字段)
+        if ticker in lv0:
+            part = raw[ticker]
+            if 'Close' in part.columns:
+                return part['Close']
+            if 'Adj Close' in part.columns:
+                return part['Adj Close']
+        # 默认布局：(字段, ticker)
+        if 'Close' in lv0 and ticker in raw['Close'].columns:
+            return raw['Close'][ticker]
+        if 'Adj Close' in lv0 and ticker in raw['Adj Close'].columns:
+            return raw['Adj Close'][ticker]
+        if ticker in lv1 and 'Close' in lv0:
+            return raw['Close'][ticker]
+    else:
+        if 'Close' in raw.columns:
+            return raw['Close']
+        if 'Adj Close' in raw.columns:
+            return raw['Adj Close']
+    return pd.Series(dtype=float)
+
+
+def parse_closes(raw, tickers):
+    """yfinance 下载结果 → 日期 × ticker 收盘价表（去时区、按日期排序；取不到的 ticker 不出现）"""
+    if raw is None or not isinstance(raw, pd.DataFrame) or raw.empty:
+        return pd.DataFrame()
+    cols = {}
+    for ticker in tickers:
+        close = _ticker_close(raw, ticker)
+        if not close.empty:
+            cols[ticker] = close.astype(float)
+    if not cols:
+        return pd.DataFrame()
+    closes = pd.DataFrame(cols)
+    if getattr(closes.index, 'tz', None) is not None:
+        closes.index = closes.index.tz_localize(None)
+    return closes.sort_index()
+
+
+class MarketMatrix:
+    """
+    资产 × 日期 价格矩阵，对齐到分数表索引。
+    values[i, t] 为第 i 个资产在 index[t] 的收盘价（C 连续），valid 为对应位置是否有价格；
+    closes 保留未对齐的原始收盘价表，供按行情自身日期统计的场景使用。
+    """
+
+    def __init__(self, closes, index):
+        self.closes = closes
+        self.index = index
+        self.tickers = list(closes.columns)
+        self._pos = {ticker: i for i, ticker in enumerate(self.tickers)}
+        aligned = closes.reindex(index) if len(self.tickers) else pd.DataFrame(index=index)
+        self.values = np.ascontiguousarray(aligned.to_numpy(dtype=np.float64).T)
+        self.valid = ~np.isnan(self.values)
+
+    def __contains__(self, ticker):
+        return ticker in self._pos
+
+    def price(self, ticker):
+        """对齐后的单资产价格（无价格处为 NaN）"""
+        return pd.Series(self.values[self._pos[ticker]], index=self.index, name=ticker)
+
+    def close(self, ticker):
+        """未对齐的原始收盘价"""
+        return self.closes[ticker]
+
+    def asset_frame(self, ticker, score_frame, price_col='Price'):
+        """
+        分数表 + 价格列，只保留该资产有价格的日期（等价于与价格序列 inner join 后去掉缺失）。
+        score_frame 须与构建矩阵时的索引一致。
+        """
+        if not score_frame.index.equals(self.index):
+            raise ValueError("score_frame 索引与行情矩阵不一致")
+        i = self._pos[ticker]
+        mask = self.valid[i]
+        return score_frame.loc[mask].assign(**{price_col: self.values[i, mask]})
+
+    def frame(self):
+        """日期 × 资产 价格表（与 values 共享内存的转置视图）"""
+        return pd.DataFrame(self.values.T, index=self.index, columns=self.tickers, copy=False)
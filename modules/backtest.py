@@ -4,51 +4,12 @@ import numpy as np
 import yfinance as yf
 import plotly.graph_objects as go
 import plotly.express as px
-
-
-def _compute_macro_regime_series(df_all, target_index, z_window=60):
-    """
-    基于 工业产出(增长) + 核心PCE(通胀) 的 Z 分数生成四象限 Regime。
-    """
-    if df_all is None or df_all.empty:
-        return pd.Series(index=target_index, dtype=object)
-    if 'INDPRO' not in df_all.columns or 'PCEPILFE' not in df_all.columns:
-        return pd.Series(index=target_index, dtype=object)
-
-    src = df_all[['INDPRO', 'PCEPILFE']].copy().sort_index().ffill().dropna()
-    if src.empty:
-        return pd.Series(index=target_index, dtype=object)
-
-    monthly = src.resample('M').last().ffill()
-    monthly['IP_YoY'] = monthly['INDPRO'].pct_change(12) * 100
-    monthly['PCE_YoY'] = monthly['PCEPILFE'].pct_change(12) * 100
-
-    min_periods = max(24, int(z_window // 2))
-    ip_mean = monthly['IP_YoY'].rolling(z_window, min_periods=min_periods).mean()
-    ip_std = monthly['IP_YoY'].rolling(z_window, min_periods=min_periods).std()
-    pce_mean = monthly['PCE_YoY'].rolling(z_window, min_periods=min_periods).mean()
-    pce_std = monthly['PCE_YoY'].rolling(z_window, min_periods=min_periods).std()
-
-    monthly['IP_Z'] = (monthly['IP_YoY'] - ip_mean) / ip_std.replace(0, np.nan)
-    monthly['PCE_Z'] = (monthly['PCE_YoY'] - pce_mean) / pce_std.replace(0, np.nan)
-    monthly = monthly.dropna(subset=['IP_Z', 'PCE_Z'])
-    if monthly.empty:
-        return pd.Series(index=target_index, dtype=object)
-
-    conditions = [
-        (monthly['IP_Z'] >= 0) & (monthly['PCE_Z'] >= 0),
-        (monthly['IP_Z'] < 0) & (monthly['PCE_Z'] >= 0),
-        (monthly['IP_Z'] < 0) & (monthly['PCE_Z'] < 0),
-        (monthly['IP_Z'] >= 0) & (monthly['PCE_Z'] < 0),
-    ]
-    labels = [
-        '过热(增长↑通胀↑)',
-        '滞胀(增长↓通胀↑)',
-        '衰退(增长↓通胀↓)',
-        '复苏(增长↑通胀↓)',
-    ]
-    monthly['Macro_Regime'] = np.select(conditions, labels, default='未分类')
-    return monthly['Macro_Regime'].reindex(target_index, method='ffill')
+from score_engine import compute_module_frames, build_score_frame
+from chart_utils import show_chart
+from perf_engine import bootstrap_strategy, rolling_performance, BOOTSTRAP_PATHS, BOOTSTRAP_BLOCK
+from regime_engine import REGIME_WINDOWS, DEFAULT_REGIME_WINDOW, REGIME_DESCRIPTIONS, macro_regimes, regime_daily
+from shared_store import data_version
+from market_engine import MarketMatrix, parse_closes
 
 
 def _build_regime_validation(df, score_col='Total_Score', price_col='Price', regime_col='Macro_Regime'):
@@ -75,12 +36,7 @@ def _build_regime_validation(df, score_col='Total_Score', price_col='Price', reg
     )
     view['Divergence20'] = (~view['Aligned20']).astype(float)
 
-    regime_order = [
-        '过热(增长↑通胀↑)',
-        '滞胀(增长↓通胀↑)',
-        '衰退(增长↓通胀↓)',
-        '复苏(增长↑通胀↓)',
-    ]
+    regime_order = list(REGIME_DESCRIPTIONS.values())
     rows = []
     for regime in regime_order:
         g = view[view[regime_col] == regime]
@@ -175,317 +131,50 @@ def _build_shock_forward_stats(price_series, threshold=0.08, horizons=(3, 5, 21,
     return pd.DataFrame(rows)
 
 
-def _calculate_score_internal(df_all):
+def _calculate_score_internal(df_all, liquidity=None, derived=None):
     """
     与 Dashboard 对齐：计算 A-G 模块分数并输出总分与关键风险特征。
+    liquidity / derived 为快照内已物化的周频流动性面板与日频派生序列（可选）。
     """
     if df_all is None or df_all.empty:
         return pd.DataFrame(columns=['Total_Score'])
 
-    df_all = df_all.sort_index().copy().ffill()
-    idx = df_all.index
-
-    def ensure_df(frame, cols):
-        if any(col not in frame.columns for col in cols):
-            return pd.DataFrame()
-        return frame.dropna(subset=cols).copy()
-
-    def rolling_percentile(series, window=156, min_periods=20):
-        return series.rolling(window, min_periods=min_periods).apply(
-            lambda s: s.rank(pct=True).iloc[-1],
-            raw=False
-        ) * 100
-
-    def rolling_percentile_long(series, window=756, min_periods=30):
-        return series.rolling(window, min_periods=min_periods).apply(
-            lambda s: s.rank(pct=True).iloc[-1],
-            raw=False
-        ) * 100
-
-    def get_slope_score(series, target, tol):
-        dev = (series - target).abs()
-        return (100 - (dev / tol * 80)).clip(0, 100)
-
-    def align_total(df_mod, fallback=50.0):
-        if df_mod is None or df_mod.empty or 'Total_Score' not in df_mod.columns:
-            return pd.Series(fallback, index=idx, dtype=float)
-        return df_mod['Total_Score'].reindex(idx, method='ffill').fillna(fallback).astype(float)
-
-    def align_feature(df_mod, col, fallback=np.nan):
-        if df_mod is None or df_mod.empty or col not in df_mod.columns:
-            return pd.Series(fallback, index=idx, dtype=float)
-        return df_mod[col].reindex(idx, method='ffill').fillna(fallback).astype(float)
-
-    # ---------------- A 模块 ----------------
-    df_raw_a = df_all[df_all.index >= '2020-01-01'].copy()
-    df_a = pd.DataFrame()
-    if not df_raw_a.empty and all(col in df_raw_a.columns for col in ['WALCL', 'WTREGEN', 'RRPONTSYD', 'WRESBAL']):
-        df_a['WALCL'] = df_raw_a['WALCL'].resample('W-WED').last()
-        df_a['WTREGEN'] = df_raw_a['WTREGEN'].resample('W-WED').last()
-        df_a['RRPONTSYD'] = df_raw_a['RRPONTSYD'].resample('W-WED').last()
-        df_a['WRESBAL'] = df_raw_a['WRESBAL'].resample('W-WED').last()
-        df_a = df_a.ffill().dropna()
-
-        def get_tga_penalty(tga_val):
-            tga_b = tga_val / 1000 if tga_val > 10000 else tga_val
-            if tga_b < 800:
-                return 1.0
-            if tga_b < 850:
-                return 0.8
-            if tga_b < 900:
-                return 0.6
-            return 0.5
-
-        def get_tga_trend_penalty(delta_b):
-            if delta_b <= 0:
-                return 1.0
-            if delta_b <= 50:
-                return 0.95
-            if delta_b <= 100:
-                return 0.9
-            if delta_b <= 150:
-                return 0.8
-            return 0.7
-
-        tga_b = df_a['WTREGEN'].where(df_a['WTREGEN'] <= 10000, df_a['WTREGEN'] / 1000)
-        df_a['TGA_Penalty_Level'] = tga_b.apply(get_tga_penalty)
-        df_a['TGA_Change_4W'] = tga_b.diff(4).fillna(0)
-        df_a['TGA_Penalty_Trend'] = df_a['TGA_Change_4W'].apply(get_tga_trend_penalty)
-        df_a['TGA_Penalty_Total'] = df_a['TGA_Penalty_Level'] * df_a['TGA_Penalty_Trend']
-
-        if df_a['RRPONTSYD'].mean() < 10000:
-            df_a['RRP_Clean'] = df_a['RRPONTSYD'] * 1000
-        else:
-            df_a['RRP_Clean'] = df_a['RRPONTSYD']
-        df_a['Net_Liquidity'] = df_a['WALCL'] - df_a['WTREGEN'] - df_a['RRP_Clean']
-
-        df_a['Liquidity_Sink'] = df_a['WTREGEN'] + df_a['RRP_Clean']
-        df_a['Liquidity_Sink_Ratio'] = (df_a['Liquidity_Sink'] / df_a['WALCL']).clip(lower=0)
-
-        def sink_penalty_ratio(r):
-            if r < 0.10:
-                return 1.0
-            if r < 0.15:
-                return 0.9
-            if r < 0.20:
-                return 0.8
-            if r < 0.25:
-                return 0.7
-            return 0.6
-
-        df_a['Sink_Penalty'] = df_a['Liquidity_Sink_Ratio'].apply(sink_penalty_ratio)
-        df_a['Score_NetLiq'] = rolling_percentile(df_a['Net_Liquidity'].diff(13))
-        df_a['Score_TGA'] = rolling_percentile((-df_a['WTREGEN']).diff(13))
-        df_a['Score_RRP'] = rolling_percentile((-df_a['RRP_Clean']).diff(13))
-        df_a['Score_Reserves'] = rolling_percentile(df_a['WRESBAL'].diff(13))
-        df_a['Score_NetLiq_Adj'] = df_a['Score_NetLiq'] * df_a['Sink_Penalty']
-        df_a['Total_Score'] = (
-            df_a['Score_NetLiq_Adj'] * 0.45 +
-            df_a['Score_TGA'] * 0.2 +
-            df_a['Score_RRP'] * 0.25 +
-            df_a['Score_Reserves'] * 0.1
-        ) * df_a['TGA_Penalty_Total']
-
-    # ---------------- B 模块 ----------------
-    df_b = ensure_df(df_all, ['SOFR', 'IORB', 'RRPONTSYAWARD', 'TGCRRATE', 'RPONTSYD'])
-    if not df_b.empty:
-        df_b['SOFR_MA13'] = df_b['SOFR'].rolling(65, min_periods=1).mean()
-        df_b['SOFR_Trend'] = df_b['SOFR_MA13'].diff(21)
-        df_b['Score_Trend'] = df_b['SOFR_Trend'].rolling(1260, min_periods=1).rank(pct=True, ascending=False) * 100
-
-        def get_regime_bonus(sofr):
-            if sofr < 1.0:
-                return 20
-            if sofr < 2.5:
-                return 10
-            if sofr > 5.0:
-                return -20
-            if sofr > 4.0:
-                return -10
-            return 0
-
-        df_b['Regime_Bonus'] = df_b['SOFR'].apply(get_regime_bonus)
-        df_b['Score_Policy'] = (df_b['Score_Trend'] + df_b['Regime_Bonus']).clip(0, 100)
-        df_b['Corridor_Width'] = (df_b['IORB'] - df_b['RRPONTSYAWARD']).abs().clip(lower=0.05)
-        df_b['F1_Ratio'] = (df_b['SOFR'] - df_b['IORB']).clip(lower=0) / df_b['Corridor_Width']
-        df_b['F2_Ratio'] = (df_b['SOFR'] - df_b['RRPONTSYAWARD']).abs() / df_b['Corridor_Width']
-        df_b['F3_Ratio'] = (df_b['TGCRRATE'] - df_b['SOFR']).abs() / df_b['Corridor_Width']
-
-        def ratio_to_score(series, max_ratio_series):
-            denom = max_ratio_series.replace(0, np.nan).ffill().fillna(0.5)
-            scaled = (series / denom).clip(lower=0, upper=1)
-            return (1 - scaled**1.6) * 100
-
-        df_b['F1_Max'] = df_b['F1_Ratio'].rolling(180, min_periods=60).quantile(0.85)
-        df_b['F2_Max'] = df_b['F2_Ratio'].rolling(180, min_periods=60).quantile(0.85)
-        df_b['F3_Max'] = df_b['F3_Ratio'].rolling(180, min_periods=60).quantile(0.85)
-        df_b['Score_F1'] = ratio_to_score(df_b['F1_Ratio'], df_b['F1_Max'])
-        df_b['Score_F2'] = ratio_to_score(df_b['F2_Ratio'], df_b['F2_Max'])
-        df_b['Score_F3'] = ratio_to_score(df_b['F3_Ratio'], df_b['F3_Max'])
-
-        df_b['SRF_Penalty_Base'] = 100 / (1 + np.exp(-0.6 * (df_b['RPONTSYD'] - 5)))
-        df_b['SRF_Accel'] = df_b['RPONTSYD'].diff(3).clip(lower=0)
-        df_b['SRF_Penalty'] = (df_b['SRF_Penalty_Base'] + (df_b['SRF_Accel'] / 20).clip(0, 1) * 35).clip(0, 100)
-        df_b['Score_SRF'] = 100 - df_b['SRF_Penalty']
-        df_b['SRF_Weight'] = 0.10 + 0.15 * (df_b['SRF_Penalty'] / 100)
-        residual = 1 - df_b['SRF_Weight']
-        df_b['Score_Friction'] = (
-            df_b['Score_F1'] * residual * 0.4 +
-            df_b['Score_F2'] * residual * 0.3 +
-            df_b['Score_F3'] * residual * 0.3 +
-            df_b['Score_SRF'] * df_b['SRF_Weight']
-        )
-        df_b['Total_Score'] = (df_b['Score_Policy'] * 0.40 + df_b['Score_Friction'] * 0.60).clip(0, 100)
-
-    # ---------------- C 模块 ----------------
-    df_c = ensure_df(df_all, ['DGS10', 'DGS2', 'DGS30', 'T10Y2Y', 'T10Y3M'])
-    if not df_c.empty:
-        df_c['Score_10Y'] = df_c['DGS10'].rolling(1260, min_periods=1).rank(pct=True, ascending=False) * 100
-        df_c['Score_2Y'] = df_c['DGS2'].rolling(1260, min_periods=1).rank(pct=True, ascending=False) * 100
-        df_c['Score_30Y'] = df_c['DGS30'].rolling(1260, min_periods=1).rank(pct=True, ascending=False) * 100
-        df_c['Score_Curve_2s10s'] = get_slope_score(df_c['T10Y2Y'], 0.5, 1.5)
-        df_c['Score_Curve_3m10s'] = get_slope_score(df_c['T10Y3M'], 0.75, 2.0)
-        df_c['Total_Score1'] = (
-            df_c['Score_Curve_2s10s'] * 0.3 +
-            df_c['Score_Curve_3m10s'] * 0.3 +
-            df_c['Score_10Y'] * 0.2 +
-            df_c['Score_2Y'] * 0.1 +
-            df_c['Score_30Y'] * 0.1
-        )
-        slope_10 = df_c['DGS10'].diff(60)
-        slope_30 = df_c['DGS30'].diff(60)
-        df_c['Max_Slope'] = pd.concat([slope_10, slope_30], axis=1).max(axis=1)
-
-        def get_slope_penalty(s):
-            if s > 0.50:
-                return 0.2
-            if s > 0.30:
-                return 0.6
-            if s > 0.15:
-                return 0.8
-            return 1.0
-
-        df_c['Penalty_Factor'] = df_c['Max_Slope'].apply(get_slope_penalty)
-        df_c['Total_Score'] = (df_c['Total_Score1'] * df_c['Penalty_Factor']).clip(0, 100)
-
-    # ---------------- D 模块 ----------------
-    df_d = ensure_df(df_all, ['DFII10', 'DFII5', 'T10YIE'])
-    if not df_d.empty:
-        df_d['Score_Real_10Y'] = df_d['DFII10'].rolling(1260, min_periods=1).rank(pct=True, ascending=False) * 100
-        df_d['Score_Real_5Y'] = df_d['DFII5'].rolling(1260, min_periods=1).rank(pct=True, ascending=False) * 100
-        df_d['Score_Breakeven'] = get_slope_score(df_d['T10YIE'], 2.1, 0.6)
-        df_d['Total_Score'] = (
-            df_d['Score_Real_10Y'] * 0.4 +
-            df_d['Score_Real_5Y'] * 0.3 +
-            df_d['Score_Breakeven'] * 0.3
-        ).clip(0, 100)
-
-    # ---------------- E 模块 ----------------
-    df_e = ensure_df(df_all, ['DTWEXBGS', 'DXY', 'DEXJPUS', 'IRSTCI01JPM156N', 'DCOILWTICO', 'DHHNGSP'])
-    if not df_e.empty:
-        df_e['Chg_USD'] = df_e['DTWEXBGS'].pct_change(63)
-        df_e['Score_USD'] = (1 - df_e['Chg_USD'].rolling(1260, min_periods=1).rank(pct=True)) * 100
-        df_e['Chg_DXY'] = df_e['DXY'].pct_change(63)
-        df_e['Score_DXY'] = (1 - df_e['Chg_DXY'].rolling(1260, min_periods=1).rank(pct=True)) * 100
-        df_e['Yen_Appreciation'] = -1 * df_e['DEXJPUS'].pct_change(63)
-        df_e['Score_Yen_FX'] = (1 - df_e['Yen_Appreciation'].rolling(1260, min_periods=1).rank(pct=True)) * 100
-        df_e['Score_BoJ_Rate'] = (1 - df_e['IRSTCI01JPM156N'].rolling(1260, min_periods=1).rank(pct=True)) * 100
-        df_e['Score_Yen_Total'] = df_e['Score_Yen_FX'] * 0.7 + df_e['Score_BoJ_Rate'] * 0.3
-        df_e['Chg_Oil'] = df_e['DCOILWTICO'].pct_change(63)
-        df_e['Score_Oil'] = (1 - df_e['Chg_Oil'].rolling(1260, min_periods=1).rank(pct=True)) * 100
-        df_e['Chg_Gas'] = df_e['DHHNGSP'].pct_change(63)
-        df_e['Score_Gas'] = (1 - df_e['Chg_Gas'].rolling(1260, min_periods=1).rank(pct=True)) * 100
-        df_e['Score_Energy'] = df_e['Score_Oil'] * 0.5 + df_e['Score_Gas'] * 0.5
-        df_e['Total_Score'] = (
-            df_e['Score_USD'] * 0.20 +
-            df_e['Score_DXY'] * 0.20 +
-            df_e['Score_Yen_Total'] * 0.3 +
-            df_e['Score_Energy'] * 0.3
-        ).clip(0, 100)
-
-    # ---------------- F 模块 ----------------
-    df_f = ensure_df(df_all, ['BAMLH0A0HYM2', 'BAA10Y'])
-    if not df_f.empty:
-        df_f['HY_Spread'] = df_f['BAMLH0A0HYM2']
-        df_f['Score_HY_Level'] = 100 - rolling_percentile_long(df_f['HY_Spread'])
-        df_f['Score_HY_Trend'] = rolling_percentile_long(-df_f['HY_Spread'].diff(13))
-        df_f['Score_BAA_Level'] = 100 - rolling_percentile_long(df_f['BAA10Y'])
-        df_f['Total_Score'] = (
-            df_f['Score_HY_Level'] * 0.5 +
-            df_f['Score_HY_Trend'] * 0.3 +
-            df_f['Score_BAA_Level'] * 0.2
-        ).clip(0, 100)
-
-    # ---------------- G 模块 ----------------
-    vix_yh = df_all['VIX_YH'] if 'VIX_YH' in df_all.columns else None
-    vix_fd = df_all['VIXCLS'] if 'VIXCLS' in df_all.columns else None
-    vxv_yh = df_all['VXV_YH'] if 'VXV_YH' in df_all.columns else None
-    vxv_fd = df_all['VXVCLS'] if 'VXVCLS' in df_all.columns else None
-
-    df_g = pd.DataFrame(index=idx)
-    if 'SP500' in df_all.columns:
-        df_g['SP500'] = df_all['SP500']
-    if vix_yh is not None or vix_fd is not None:
-        vix = vix_yh.combine_first(vix_fd) if (vix_yh is not None and vix_fd is not None) else (vix_yh if vix_yh is not None else vix_fd)
-        df_g['VIX'] = vix
-    if vxv_yh is not None or vxv_fd is not None:
-        vxv = vxv_yh.combine_first(vxv_fd) if (vxv_yh is not None and vxv_fd is not None) else (vxv_yh if vxv_yh is not None else vxv_fd)
-        df_g['VXV'] = vxv
-    if not set(['SP500', 'VIX', 'VXV']).issubset(df_g.columns):
-        df_g = pd.DataFrame()
-    else:
-        df_g = df_g.dropna(subset=['SP500', 'VIX', 'VXV']).copy()
-    if not df_g.empty:
-        df_g['VIX_VXV'] = df_g['VIX'] / df_g['VXV']
-        df_g['Score_VIX'] = (100 - rolling_percentile_long(df_g['VIX'])).clip(0, 100)
-        df_g['Score_Term'] = (100 - rolling_percentile_long(df_g['VIX_VXV'])).clip(0, 100)
-        df_g['Score_Mom'] = rolling_percentile_long(df_g['SP500'].diff(65)).clip(0, 100)
-        df_g['Total_Score'] = (
-            df_g['Score_Term'] * 0.4 +
-            df_g['Score_VIX'] * 0.3 +
-            df_g['Score_Mom'] * 0.3
-        ).clip(0, 100)
-
-    # ---------------- 合成总分（A-G） ----------------
-    s_a = align_total(df_a, fallback=50.0)
-    s_b = align_total(df_b, fallback=50.0)
-    s_c = align_total(df_c, fallback=50.0)
-    s_d = align_total(df_d, fallback=50.0)
-    s_e = align_total(df_e, fallback=50.0)
-    s_f = align_total(df_f, fallback=50.0)
-    s_g = align_total(df_g, fallback=50.0)
-
-    total_score = (
-        s_a * 0.20 +
-        s_b * 0.20 +
-        s_c * 0.15 +
-        s_d * 0.15 +
-        s_e * 0.15 +
-        s_f * 0.075 +
-        s_g * 0.075
-    ).clip(0, 100)
-
-    score_frame = pd.DataFrame(index=idx)
-    score_frame['Total_Score'] = total_score.astype(float)
-    score_frame['Score_A'] = s_a
-    score_frame['Score_B'] = s_b
-    score_frame['Score_C'] = s_c
-    score_frame['Score_D'] = s_d
-    score_frame['Score_E'] = s_e
-    score_frame['Score_F'] = s_f
-    score_frame['Score_G'] = s_g
-
-    # 关键惩罚机制（来自现有宏观模块）
-    score_frame['A_TGA_Penalty'] = align_feature(df_a, 'TGA_Penalty_Total', fallback=1.0).clip(0, 1.2)
-    score_frame['A_Sink_Penalty'] = align_feature(df_a, 'Sink_Penalty', fallback=1.0).clip(0, 1.0)
-    score_frame['B_SRF_Penalty'] = (align_feature(df_b, 'SRF_Penalty', fallback=0.0) / 100.0).clip(0, 1.0)
-    score_frame['G_VIXVXV'] = align_feature(df_g, 'VIX_VXV', fallback=1.0)
-
+    df_all = df_all.sort_index().ffill()
+    frames = compute_module_frames(df_all, liquidity=liquidity, derived=derived)
+    score_frame = build_score_frame(frames, df_all.index)
     return score_frame.dropna(subset=['Total_Score'])
 
 # ==========================================
 # 2. 辅助计算 RSI
 # ==========================================
+def _event_hedge_mask(px, trigger, eligible, hold_days, takeprofit_drop):
+    """
+    事件对冲的持仓区间（布尔掩码）：触发日 i 的次日开仓，最多持有 hold_days 天，
+    区间内价格首次跌到 px[i] * (1 - takeprofit_drop) 即当日平仓；eligible 为开仓日是否允许对冲。
+    首次触及用有界窗口上的累计最小值求出，多个区间的并集用 max-accumulate 一次铺开。
+    """
+    n = len(px)
+    opens = np.flatnonzero(trigger) + 1
+    opens = opens[opens < n]
+    opens = opens[eligible[opens]]
+    covered = np.zeros(n, dtype=bool)
+    if opens.size == 0:
+        return covered
+
+    # 每个事件的候选平仓日 [open, open + hold_days - 1]，截断在样本末尾
+    offsets = np.arange(hold_days)
+    cand = np.minimum(opens[:, None] + offsets, n - 1)
+    last = np.minimum(opens + hold_days - 1, n - 1)
+    tp_px = px[opens - 1] * (1.0 - takeprofit_drop)
+    touched = np.fmin.accumulate(px[cand], axis=1) <= tp_px[:, None]
+    closes = np.where(touched.any(axis=1), opens + touched.argmax(axis=1), last)
+
+    # 区间并集：每个开仓位记录最远平仓位，前缀最大值覆盖到的位置即处于持仓中
+    reach = np.full(n, -1, dtype=np.int64)
+    np.maximum.at(reach, opens, closes)
+    return np.maximum.accumulate(reach) >= np.arange(n)
+
+
 def calculate_rsi(series, period=14):
     delta = series.diff()
     gain = (delta.where(delta > 0, 0)).rolling(window=period).mean()
@@ -741,31 +430,18 @@ def run_strategy_logic(
         eth_hedge_takeprofit_drop = abs(float(cfg.get('eth_hedge_takeprofit_drop', 0.20)))
         eth_hedge_cap_ratio = float(np.clip(float(cfg.get('eth_hedge_cap_ratio', 1.0)), 0.2, 2.0))
         base_hedge_size = eth_hedge_fraction * eth_hedge_leverage
-        px = df[price_col].to_numpy(dtype=float)
-        trg = eth_shock_trigger.to_numpy(dtype=bool)
-
-        for i in np.where(trg)[0]:
-            open_i = i + 1
-            if open_i >= len(df.index):
-                continue
-            # 对冲仓位：默认 1/3 * 杠杆（可调），并限制不超过当期多头仓位比例上限
-            long_ref = float(target_long.iloc[open_i]) if not pd.isna(target_long.iloc[open_i]) else 0.0
-            if long_ref <= 0:
-                continue
-            hedge_cap = max(0.0, max_leverage * eth_hedge_cap_ratio)
-            hedge_size = min(base_hedge_size, hedge_cap)
-            if hedge_size <= 0:
-                continue
-
-            close_i = min(len(df.index) - 1, open_i + eth_hedge_hold_days - 1)
-            tp_px = px[i] * (1.0 - eth_hedge_takeprofit_drop)
-            for j in range(open_i, close_i + 1):
-                if px[j] <= tp_px:
-                    close_i = j
-                    break
-            eth_event_hedge.iloc[open_i:close_i + 1] = np.maximum(
-                eth_event_hedge.iloc[open_i:close_i + 1], hedge_size
+        hedge_cap = max(0.0, max_leverage * eth_hedge_cap_ratio)
+        hedge_size = min(base_hedge_size, hedge_cap)
+        if hedge_size > 0:
+            # 对冲仓位：默认 1/3 * 杠杆（可调），并限制不超过当期多头仓位比例上限；开仓日多头为 0 时不对冲
+            covered = _event_hedge_mask(
+                df[price_col].to_numpy(dtype=float),
+                eth_shock_trigger.to_numpy(dtype=bool),
+                target_long.fillna(0.0).to_numpy(dtype=float) > 0,
+                eth_hedge_hold_days,
+                eth_hedge_takeprofit_drop,
             )
+            eth_event_hedge = pd.Series(np.where(covered, hedge_size, 0.0), index=df.index, dtype=float)
 
     df['ETH_Event_Hedge'] = eth_event_hedge
     if eth_event_hedge_enabled:
@@ -1020,9 +696,19 @@ def compute_perf_metrics(df, risk_free_rate=0.04):
 # ==========================================
 # 5. Yahoo 数据
 # ==========================================
+BACKTEST_ASSETS = {
+    'Bitcoin (BTC)': 'BTC-USD',
+    'Ethereum (ETH)': 'ETH-USD',
+    'Gold (GLD)': 'GLD',
+    'SPY (SPY)': 'SPY',
+    'Nasdaq (IXIC)': '^IXIC',
+    'EUR/USD (EURUSD)': 'EURUSD=X'
+}
+
+
 @st.cache_data(ttl=3600)
 def get_yahoo_data(start_date):
-    tickers = "BTC-USD ETH-USD GLD SPY ^IXIC EURUSD=X"
+    tickers = " ".join(BACKTEST_ASSETS.values())
     return yf.download(
         tickers,
         start=start_date,
@@ -1032,10 +718,16 @@ def get_yahoo_data(start_date):
         threads=True
     )
 
+
+@st.cache_data(ttl=3600)
+def get_market_closes(start_date):
+    """回测资产收盘价（日期 × ticker），每次下载只解析一次"""
+    return parse_closes(get_yahoo_data(start_date), list(BACKTEST_ASSETS.values()))
+
 # ==========================================
 # 6. 主渲染函数
 # ==========================================
-def render_backtest(df_all):
+def render_backtest(df_all, score_frame_full=None, liquidity=None, derived=None):
     st.markdown("## 量化策略分数回测")
     st.info("采用『宏观状态机定仓位 + 趋势跟随执行 + 低频调仓 + 下行对冲』：先判大方向，再用20/60/120均线执行仓位。")
     if df_all is None or df_all.empty:
@@ -1388,7 +1080,8 @@ def render_backtest(df_all):
         return 4.0
 
     with st.spinner("Calculating..."):
-        score_frame_full = _calculate_score_internal(df_all)
+        if score_frame_full is None:
+            score_frame_full = _calculate_score_internal(df_all, liquidity, derived)
         if score_frame_full.empty:
             st.error("回测失败：宏观总分序列为空。请检查 FRED/Yahoo 数据是否完整。")
             return
@@ -1397,55 +1090,25 @@ def render_backtest(df_all):
             st.error(f"回测失败：{backtest_start.strftime('%Y-%m-%d')} 之后没有可用宏观分数数据。")
             return
         start_date = backtest_start.strftime('%Y-%m-%d')
-        y_data = get_yahoo_data(start_date)
-        if y_data is None or not isinstance(y_data, pd.DataFrame) or y_data.empty:
+        closes = get_market_closes(start_date)
+        if closes.empty:
             st.error("回测失败：Yahoo 行情下载为空。请稍后重试。")
             return
+        # 全部资产一次对齐到分数表索引，各资产页只按掩码切片
+        market = MarketMatrix(closes, score_frame.index)
     st.caption(f"回测区间：{score_frame.index.min().strftime('%Y-%m-%d')} 至 {score_frame.index.max().strftime('%Y-%m-%d')}")
 
-    def extract_price(y_df, ticker):
-        if isinstance(y_df.columns, pd.MultiIndex):
-            lv0 = y_df.columns.get_level_values(0)
-            lv1 = y_df.columns.get_level_values(1)
-            if ticker in lv0:
-                part = y_df[ticker]
-                if 'Close' in part.columns:
-                    return part['Close']
-                if 'Adj Close' in part.columns:
-                    return part['Adj Close']
-            if 'Close' in lv0 and ticker in y_df['Close'].columns:
-                return y_df['Close'][ticker]
-            if 'Adj Close' in lv0 and ticker in y_df['Adj Close'].columns:
-                return y_df['Adj Close'][ticker]
-            if ticker in lv1 and 'Close' in y_df.columns.get_level_values(0):
-                return y_df['Close'][ticker]
-        else:
-            if 'Close' in y_df.columns:
-                return y_df['Close']
-            if 'Adj Close' in y_df.columns:
-                return y_df['Adj Close']
-        return pd.Series(dtype=float)
-
-    assets = {
-        'Bitcoin (BTC)': 'BTC-USD',
-        'Ethereum (ETH)': 'ETH-USD',
-        'Gold (GLD)': 'GLD',
-        'SPY (SPY)': 'SPY',
-        'Nasdaq (IXIC)': '^IXIC',
-        'EUR/USD (EURUSD)': 'EURUSD=X'
-    }
+    assets = BACKTEST_ASSETS
     tabs = st.tabs(list(assets.keys()))
     
     for (name, ticker), tab in zip(assets.items(), tabs):
         with tab:
             try:
-                price_s = extract_price(y_data, ticker)
-                if price_s.empty:
+                if ticker not in market:
                     st.warning(f"{name} 行情为空（{ticker}），请稍后刷新。")
                     continue
-                if getattr(price_s.index, "tz", None) is not None:
-                    price_s.index = price_s.index.tz_localize(None)
-                df = score_frame.join(price_s.rename('Price'), how='inner').dropna(subset=['Total_Score', 'Price'])
+                price_s = market.close(ticker)
+                df = market.asset_frame(ticker, score_frame)
                 if len(df) < 150:
                     st.warning("数据不足 150 天，暂不回测。")
                     continue
@@ -1547,6 +1210,93 @@ def render_backtest(df_all):
                     f"资金成本={_fmt_pct(perf.get('funding_cost', np.nan))}"
                 )
 
+                with st.expander("稳健性检验（平稳区块自助法）", expanded=False):
+                    bs1, bs2, bs3 = st.columns([1, 1, 1])
+                    bs_paths = bs1.select_slider("重抽样路径数", options=[200, 500, 1000, 2000], value=BOOTSTRAP_PATHS, key=f"{ticker}_bs_paths")
+                    bs_block = bs2.slider("平均区块长度（交易日）", 1, 126, BOOTSTRAP_BLOCK, key=f"{ticker}_bs_block")
+                    bs_run = bs3.checkbox("运行", value=False, key=f"{ticker}_bs_run")
+                    if bs_run:
+                        boot = bootstrap_strategy(df, risk_free_rate=rf_rate, n_paths=bs_paths, mean_block=bs_block)
+                        bs_sum = boot['summary']
+                        if bs_sum.empty:
+                            st.info("样本过短，无法重抽样。")
+                        else:
+                            pct_rows = ['CAGR', 'MDD', 'CVaR 5%(日)', '基准 CAGR', '基准 MDD', '超额 CAGR']
+                            bs_view = bs_sum.copy().astype(object)
+                            for r in bs_view.index:
+                                fmt = _fmt_pct if r in pct_rows else _fmt_num
+                                bs_view.loc[r] = [fmt(v) for v in bs_sum.loc[r]]
+                            st.dataframe(bs_view, use_container_width=True)
+                            st.caption(
+                                f"{bs_paths} 条路径 · 平均区块 {bs_block} 日 · 区间为 5%-95% 分位 · "
+                                f"超额 CAGR > 0 的路径占比 {bs_sum.attrs['beat_bench_prob']:.0%}。"
+                                "收益、执行仓位与成本按同一区块整体重抽样，区块衔接处的换仓按平均单边成本另计；区块长度为 1 时即 iid 蒙特卡洛。"
+                            )
+                            fig_bs = go.Figure()
+                            fig_bs.add_trace(go.Histogram(x=boot['samples']['cagr'] * 100, nbinsx=60, name='策略 CAGR', marker_color='#2563eb', opacity=0.7))
+                            fig_bs.add_trace(go.Histogram(x=boot['samples']['bench_cagr'] * 100, nbinsx=60, name='基准 CAGR', marker_color='#9ca3af', opacity=0.5))
+                            fig_bs.add_vline(x=perf.get('cagr', np.nan) * 100, line_color='#dc2626', line_dash='dash')
+                            fig_bs.update_layout(
+                                barmode='overlay', height=300, xaxis_title='CAGR (%)',
+                                legend=dict(orientation='h'), margin=dict(l=20, r=20, t=30, b=20)
+                            )
+                            show_chart(fig_bs, use_container_width=True, key=f"{ticker}_bootstrap_chart")
+
+                with st.expander("滚动绩效（1年 / 3年）", expanded=False):
+                    if st.checkbox("显示", value=False, key=f"{ticker}_rolling_on"):
+                        roll = rolling_performance(df['Strategy_Ret'], df['Position'], risk_free_rate=rf_rate)
+                        roll_bench = rolling_performance(df['Pct_Change'], risk_free_rate=rf_rate)
+                        if roll['Sharpe_1Y'].dropna().empty:
+                            st.info("回测区间不足 1 年，滚动指标为空。")
+
+                        def _roll_fig(series_specs, title, yaxis_title, pct=False, height=260):
+                            fig = go.Figure()
+                            for s, label, color, dash in series_specs:
+                                fig.add_trace(go.Scatter(
+                                    x=s.index, y=s * 100 if pct else s, mode='lines', name=label,
+                                    line=dict(color=color, width=1.6, dash=dash)
+                                ))
+                            fig.update_layout(
+                                title=title, yaxis_title=yaxis_title, height=height,
+                                legend=dict(orientation='h'), margin=dict(l=20, r=20, t=40, b=20)
+                            )
+                            return fig
+
+                        r1, r2 = st.columns(2)
+                        with r1:
+                            show_chart(_roll_fig([
+                                (roll['Sharpe_1Y'], 'Sharpe 1Y', '#2563eb', 'solid'),
+                                (roll['Sharpe_3Y'], 'Sharpe 3Y', '#1e3a8a', 'solid'),
+                                (roll['Sortino_1Y'], 'Sortino 1Y', '#16a34a', 'dot'),
+                                (roll_bench['Sharpe_1Y'], '基准 Sharpe 1Y', '#9ca3af', 'dash'),
+                            ], '滚动 Sharpe / Sortino', 'Ratio'), use_container_width=True, key=f"{ticker}_roll_sharpe")
+                        with r2:
+                            show_chart(_roll_fig([
+                                (roll['Vol_1Y'], '策略 1Y', '#f59e0b', 'solid'),
+                                (roll['Vol_3Y'], '策略 3Y', '#b45309', 'solid'),
+                                (roll_bench['Vol_1Y'], '基准 1Y', '#9ca3af', 'dash'),
+                            ], '滚动年化波动率', '%', pct=True), use_container_width=True, key=f"{ticker}_roll_vol")
+                        r3, r4 = st.columns(2)
+                        with r3:
+                            show_chart(_roll_fig([
+                                (roll['Drawdown'], '水下深度', '#dc2626', 'solid'),
+                                (roll['MDD_1Y'], '滚动 MDD 1Y', '#7c3aed', 'dot'),
+                                (roll['MDD_3Y'], '滚动 MDD 3Y', '#4c1d95', 'dot'),
+                            ], '回撤 (水下深度 / 滚动最大回撤)', '%', pct=True), use_container_width=True, key=f"{ticker}_roll_mdd")
+                        with r4:
+                            show_chart(_roll_fig([
+                                (roll['Underwater_Days'], '策略', '#dc2626', 'solid'),
+                                (roll_bench['Underwater_Days'], '基准', '#9ca3af', 'dash'),
+                            ], '水下天数 (距前高自然日)', '天'), use_container_width=True, key=f"{ticker}_roll_uw")
+                        show_chart(_roll_fig([
+                            (roll['HitRate_1Y'], '命中率 1Y', '#0ea5e9', 'solid'),
+                            (roll['HitRate_3Y'], '命中率 3Y', '#0369a1', 'solid'),
+                        ], '滚动命中率 (持仓日收益为正占比)', '%', pct=True), use_container_width=True, key=f"{ticker}_roll_hit")
+                        st.caption(
+                            f"当前水下 {int(roll['Underwater_Days'].iloc[-1])} 天，"
+                            f"最长水下 {int(roll['Underwater_Days'].max())} 天；Sharpe / Sortino / 波动率按日收益年化 (×√252)。"
+                        )
+
                 # 宏观总分趋势
                 fig_macro = go.Figure()
                 fig_macro.add_trace(go.Scatter(
@@ -1588,7 +1338,7 @@ def render_backtest(df_all):
                     legend=dict(orientation='h'),
                     margin=dict(l=20, r=20, t=50, b=20)
                 )
-                st.plotly_chart(fig_macro, use_container_width=True, key=f"{ticker}_macro_score_chart")
+                show_chart(fig_macro, use_container_width=True, key=f"{ticker}_macro_score_chart")
                 st.caption(
                     f"Regime执行分数=宏观总分EWMA平滑(span={macro_smooth_span})，"
                     f"趋势只由均线结构(20/60/120)决定进出场，宏观分只决定仓位大小。"
@@ -1629,7 +1379,7 @@ def render_backtest(df_all):
                     legend=dict(orientation='h'),
                     margin=dict(l=20, r=20, t=50, b=20)
                 )
-                st.plotly_chart(fig_px, use_container_width=True, key=f"{ticker}_price_ma_chart")
+                show_chart(fig_px, use_container_width=True, key=f"{ticker}_price_ma_chart")
 
                 if trend_event_enabled:
                     st.markdown("##### 趋势跟随事件统计（单日阈值事件）")
@@ -1669,7 +1419,7 @@ def render_backtest(df_all):
                                 legend=dict(orientation='h'),
                                 margin=dict(l=20, r=20, t=45, b=20)
                             )
-                            st.plotly_chart(fig_evt, use_container_width=True, key=f"{ticker}_event_mean_chart")
+                            show_chart(fig_evt, use_container_width=True, key=f"{ticker}_event_mean_chart")
 
                             fig_evt_win = go.Figure()
                             for evt_name, color in [('大涨事件', '#1d4ed8'), ('大跌事件', '#b91c1c')]:
@@ -1688,7 +1438,7 @@ def render_backtest(df_all):
                                 legend=dict(orientation='h'),
                                 margin=dict(l=20, r=20, t=45, b=20)
                             )
-                            st.plotly_chart(fig_evt_win, use_container_width=True, key=f"{ticker}_event_win_chart")
+                            show_chart(fig_evt_win, use_container_width=True, key=f"{ticker}_event_win_chart")
 
                 if ('Ethereum' in name or '(ETH)' in name) and ('ETH_Shock_Trigger' in df.columns):
                     trig_cnt = int(df['ETH_Shock_Trigger'].sum())
@@ -1763,7 +1513,7 @@ def render_backtest(df_all):
                                       '<br>Regime Score: %{customdata[3]:.1f}<extra></extra>'
                     ))
 
-                st.plotly_chart(fig, use_container_width=True, key=f"{ticker}_nav_chart")
+                show_chart(fig, use_container_width=True, key=f"{ticker}_nav_chart")
                 rebalance_events = int((df['Position'].diff().abs().fillna(df['Position'].abs()) > 1e-8).sum())
                 st.caption(
                     f"开仓信号: {len(buy_points)} 次 | 平仓信号: {len(sell_points)} 次（与交易日志一致）"
@@ -1819,20 +1569,27 @@ def render_backtest(df_all):
                     legend=dict(orientation='h'),
                     margin=dict(l=20, r=20, t=50, b=20)
                 )
-                st.plotly_chart(fig_pos, use_container_width=True, key=f"{ticker}_position_chart")
+                show_chart(fig_pos, use_container_width=True, key=f"{ticker}_position_chart")
                 st.caption(
                     f"仓位范围: {df['Position'].min():.2f}x ~ {df['Position'].max():.2f}x"
                     f" | 目标仓位范围: {df['Target_Position'].min():.2f}x ~ {df['Target_Position'].max():.2f}x"
                 )
 
                 # Regime 验证面板：检查不同宏观周期里“宏观分 vs 资产收益”关系是否切换
-                regime_series = _compute_macro_regime_series(df_all, df.index, z_window=60)
+                # 各 Z 窗口的月频 Regime 按数据版本只算一次，切换窗口只做对齐
+                regimes = macro_regimes(df_all, data_version(df_all))
+                regime_series = regime_daily(regimes, df.index, DEFAULT_REGIME_WINDOW)
                 if regime_series.dropna().empty:
                     st.info("Regime 验证面板：缺少 INDPRO/PCEPILFE 数据，无法完成四象限验证。")
                 else:
-                    df['Macro_Regime'] = regime_series.reindex(df.index, method='ffill')
-                    regime_eval = _build_regime_validation(df, score_col='Total_Score', price_col='Price', regime_col='Macro_Regime')
                     st.markdown("##### Regime 验证面板")
+                    z_window = st.selectbox(
+                        "Regime Z 窗口 (月)", list(REGIME_WINDOWS),
+                        index=list(REGIME_WINDOWS).index(DEFAULT_REGIME_WINDOW), key=f"{ticker}_regime_window",
+                    )
+                    regime_series = regime_daily(regimes, df.index, z_window)
+                    df['Macro_Regime'] = regime_series.map(REGIME_DESCRIPTIONS)
+                    regime_eval = _build_regime_validation(df, score_col='Total_Score', price_col='Price', regime_col='Macro_Regime')
                     if regime_eval.empty:
                         st.info("Regime 验证面板：样本不足，无法统计。")
                     else:
@@ -1867,7 +1624,7 @@ def render_backtest(df_all):
                             legend=dict(orientation='h'),
                             margin=dict(l=20, r=20, t=50, b=20)
                         )
-                        st.plotly_chart(fig_regime, use_container_width=True, key=f"{ticker}_regime_validation_chart")
+                        show_chart(fig_regime, use_container_width=True, key=f"{ticker}_regime_validation_chart")
 
                 if rebalance_events > 0:
                     rebal_tbl = pd.DataFrame({
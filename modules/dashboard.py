@@ -2,27 +2,35 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 import math
-import json
-import io
-import re
-import html
-import textwrap
 import plotly.graph_objects as go
 from datetime import datetime, timedelta
 import yfinance as yf
 from config import GEMINI_API_KEY
-from google import genai
+from score_engine import MODULE_WEIGHTS, compute_module_frames, build_score_frame, build_score_cube
+from chart_utils import show_chart, cached_figure
+from shared_store import data_version, versioned_cache
+from data_engine import get_yahoo_close
+from analog_engine import analog_index, find_analogs, analog_context
+from risk_rules import RISK_RULES, risk_replay
+from regime_engine import REGIME_INPUTS, DEFAULT_REGIME_WINDOW, macro_regimes, regime_min_months
+from attribution_engine import factor_attribution, latest_deltas, module_contributions
+from report_engine import (
+    REPORT_TITLE, call_gemini_new_sdk, normalize_report_date, lazy_pdf, cached_pdf_bytes,
+    build_report_context, build_report_prompt,
+)
+
+
+def _supports_deferred_download():
+    """当前 Streamlit 是否支持 download_button(data=可调用对象)：延迟下载经 MediaFileManager.add_deferred 注册"""
+    try:
+        from streamlit.runtime.media_file_manager import MediaFileManager
+    except ImportError:
+        return False
+    return hasattr(MediaFileManager, "add_deferred")
 
-# --- [核心功能]：AI 调用函数 (使用 google-genai SDK) ---
-def call_gemini_new_sdk(prompt, api_key):
-        client = genai.Client(api_key=api_key, http_options={'api_version': 'v1alpha'})
- 
-        response = client.models.generate_content(
-            model='gemini-3-flash-preview', 
-            contents=prompt
-        )
-        return response.text
-       
+
+# 旧版 Streamlit 不接受可调用的 data，退回直接传入（已缓存的）PDF 字节
+DEFERRED_DOWNLOAD = _supports_deferred_download()
 
 PROFESSIONAL_LIGHT_CSS = """
 <style>
@@ -205,190 +213,69 @@ def _fmt_rt_delta(v, digits=2, suffix=""):
     sign = "+" if v >= 0 else ""
     return f"{sign}{v:.{digits}f}{suffix}"
 
+# Regime 看板的状态卡片 (象限 / Z 分数 / 最近切换) 按数据版本缓存，热力条另走图表缓存
+_REGIME_BOARD_CACHE = versioned_cache('dashboard_regime_board')
+
+
+def _analog_prices(df_all):
+    """近邻前瞻收益所用价格：SPX / BTC 取面板，GLD 取 Yahoo（缓存）"""
+    prices = pd.DataFrame(index=df_all.index)
+    prices["SPX"] = df_all["SP500"] if "SP500" in df_all.columns else np.nan
+    prices["BTC"] = df_all["CBBTCUSD"] if "CBBTCUSD" in df_all.columns else np.nan
+    gld = get_yahoo_close(("GLD",), df_all.index[0].strftime("%Y-%m-%d"))
+    gld = gld["GLD"] if "GLD" in gld.columns else pd.Series(dtype=float)
+    return prices.join(gld.rename("GLD"), how="outer")
+
+
 # ==========================================
 # Dashboard 逻辑
 # ==========================================
-def render_dashboard_standalone(df_all):
+# 趋势图辅线：模块 / 图例 / 颜色
+TREND_MODULE_LINES = [
+    ('A', 'A.流动性', '#06b6d4'),
+    ('B', 'B.资金面', '#8b5cf6'),
+    ('C', 'C.国债', '#f59e0b'),
+    ('D', 'D.利率', '#ec4899'),
+    ('E', 'E.外部', '#10b981'),
+    ('F', 'F.信用', '#ef4444'),
+    ('G', 'G.风险偏好', '#0ea5e9'),
+]
+
+# 热力图行：模块 -> 中文名（按展示顺序）
+HEATMAP_MODULES = {
+    'A': "系统流动性",
+    'B': "资金价格/应急闸",
+    'C': "国债供给与市场功能",
+    'D': "利率预期与真实利",
+    'F': "信用与银行",
+    'G': "风险偏好与波动",
+    'E': "外部冲击与成本",
+}
+
+
+def render_dashboard_standalone(df_all, frames=None, score_frame=None, liquidity=None, derived=None, score_cube=None):
     # 注入 CSS
     st.markdown(PROFESSIONAL_LIGHT_CSS, unsafe_allow_html=True)
 
     # ----------------------------------------------------
-    # 1. 核心计算逻辑 (完全保留原代码)
+    # 1. 核心计算逻辑 (共享 score_engine)
     # ----------------------------------------------------
     def prev_week_value(series, days=7):
         target = series.index[-1] - pd.Timedelta(days=days)
         idx = series.index.get_indexer([target], method='nearest')[0]
         return series.iloc[idx]
-    df_raw_a = df_all[df_all.index >= '2020-01-01'].copy()
-    
-    df_a = pd.DataFrame()
-    df_a['WALCL'] = df_raw_a['WALCL'].resample('W-WED').last() 
-    df_a['WTREGEN'] = df_raw_a['WTREGEN'].resample('W-WED').last()
-    df_a['RRPONTSYD'] = df_raw_a['RRPONTSYD'].resample('W-WED').last()
-    df_a['WRESBAL'] = df_raw_a['WRESBAL'].resample('W-WED').last()
-    df_a = df_a.fillna(method='ffill').dropna()
-
-    def get_tga_penalty(tga_val):
-        tga_b = tga_val / 1000 if tga_val > 10000 else tga_val
-        if tga_b < 800: return 1.0  
-        elif 800 <= tga_b < 850: return 0.8  
-        elif 850 <= tga_b < 900: return 0.6
-        else: return 0.5
-    
-    tga_b = df_a['WTREGEN'].where(df_a['WTREGEN'] <= 10000, df_a['WTREGEN'] / 1000)
-    df_a['TGA_Penalty_Level'] = tga_b.apply(get_tga_penalty)
-
-    def get_tga_trend_penalty(delta_b):
-        if delta_b <= 0: return 1.0
-        elif delta_b <= 50: return 0.95
-        elif delta_b <= 100: return 0.9
-        elif delta_b <= 150: return 0.8
-        else: return 0.7
-
-    df_a['TGA_Change_4W'] = tga_b.diff(4).fillna(0)
-    df_a['TGA_Penalty_Trend'] = df_a['TGA_Change_4W'].apply(get_tga_trend_penalty)
-    df_a['TGA_Penalty_Total'] = df_a['TGA_Penalty_Level'] * df_a['TGA_Penalty_Trend']
-    if df_a['RRPONTSYD'].mean() < 10000:
-        df_a['RRP_Clean'] = df_a['RRPONTSYD'] * 1000
-    else:
-        df_a['RRP_Clean'] = df_a['RRPONTSYD']
-    df_a['Net_Liquidity'] = df_a['WALCL'] - df_a['WTREGEN'] - df_a['RRP_Clean']
-
-    df_a['Liquidity_Sink'] = df_a['WTREGEN'] + df_a['RRP_Clean']
-    df_a['Liquidity_Sink_Ratio'] = (df_a['Liquidity_Sink'] / df_a['WALCL']).clip(lower=0)
-    def sink_penalty_ratio(r):
-        if r < 0.10: return 1.0
-        elif r < 0.15: return 0.9
-        elif r < 0.20: return 0.8
-        elif r < 0.25: return 0.7
-        else: return 0.6
-    df_a['Sink_Penalty'] = df_a['Liquidity_Sink_Ratio'].apply(sink_penalty_ratio)
-    
-    def rolling_percentile(series, window=156, min_periods=20):
-        return series.rolling(window, min_periods=min_periods).apply(
-            lambda s: s.rank(pct=True).iloc[-1],
-            raw=False
-        ) * 100
-
-    def get_score_a(series):
-        return rolling_percentile(series.diff(13))
-    df_a['Score_NetLiq'] = get_score_a(df_a['Net_Liquidity'])
-    df_a['Score_TGA'] = get_score_a(-df_a['WTREGEN'])
-    df_a['Score_RRP'] = get_score_a(-df_a['RRP_Clean'])
-    df_a['Score_Reserves'] = get_score_a(df_a['WRESBAL'])
-    base_total_a = (df_a['Score_NetLiq']*0.45 + df_a['Score_TGA']*0.2 + df_a['Score_RRP']*0.25 + df_a['Score_Reserves']*0.1)
-    df_a['Score_NetLiq_Adj'] = df_a['Score_NetLiq'] * df_a['Sink_Penalty']
-    df_a['Total_Score'] = (
-        df_a['Score_NetLiq_Adj'] * 0.45 +
-        df_a['Score_TGA'] * 0.2 +
-        df_a['Score_RRP'] * 0.25 +
-        df_a['Score_Reserves'] * 0.1
-    ) * df_a['TGA_Penalty_Total']
-
-    def ensure_df(df, cols):
-        return df.dropna(subset=cols).copy()
-
-    # 模块 B
-    df_b = ensure_df(df_all, ['SOFR', 'IORB', 'RRPONTSYAWARD', 'TGCRRATE', 'RPONTSYD'])
-    df_b['SOFR_MA13'] = df_b['SOFR'].rolling(65, min_periods=1).mean()
-    df_b['SOFR_Trend'] = df_b['SOFR_MA13'].diff(21)
-    df_b['Score_Trend'] = df_b['SOFR_Trend'].rolling(1260, min_periods=1).rank(pct=True, ascending=False) * 100
-    def get_regime_bonus(sofr):
-        if sofr < 1.0: return 20
-        elif sofr < 2.5: return 10
-        elif sofr > 5.0: return -20
-        elif sofr > 4.0: return -10
-        else: return 0
-    df_b['Regime_Bonus'] = df_b['SOFR'].apply(get_regime_bonus)
-    df_b['Score_Policy'] = (df_b['Score_Trend'] + df_b['Regime_Bonus']).clip(0, 100)
-    
-    df_b['Corridor_Width'] = (df_b['IORB'] - df_b['RRPONTSYAWARD']).abs().clip(lower=0.05)
-
-    df_b['F1_Spread'] = df_b['SOFR'] - df_b['IORB']
-    df_b['F1_Ratio'] = df_b['F1_Spread'].clip(lower=0) / df_b['Corridor_Width']
-
-    df_b['F2_Spread'] = df_b['SOFR'] - df_b['RRPONTSYAWARD']
-    df_b['F2_Ratio'] = df_b['F2_Spread'].abs() / df_b['Corridor_Width']
-
-    df_b['F3_Spread'] = df_b['TGCRRATE'] - df_b['SOFR']
-    df_b['F3_Ratio'] = df_b['F3_Spread'].abs() / df_b['Corridor_Width']
-
-    def ratio_to_score(series, max_ratio_series):
-        denom = max_ratio_series.replace(0, np.nan).ffill().fillna(0.5)
-        scaled = (series / denom).clip(lower=0, upper=1)
-        return (1 - scaled**1.6) * 100
-
-    df_b['F1_Max'] = df_b['F1_Ratio'].rolling(180, min_periods=60).quantile(0.85)
-    df_b['F2_Max'] = df_b['F2_Ratio'].rolling(180, min_periods=60).quantile(0.85)
-    df_b['F3_Max'] = df_b['F3_Ratio'].rolling(180, min_periods=60).quantile(0.85)
-
-    df_b['Score_F1'] = ratio_to_score(df_b['F1_Ratio'], df_b['F1_Max'])
-    df_b['Score_F2'] = ratio_to_score(df_b['F2_Ratio'], df_b['F2_Max'])
-    df_b['Score_F3'] = ratio_to_score(df_b['F3_Ratio'], df_b['F3_Max'])
-
-    df_b['SRF_Penalty_Base'] = 100 / (1 + np.exp(-0.6 * (df_b['RPONTSYD'] - 5)))
-    df_b['SRF_Accel'] = df_b['RPONTSYD'].diff(3).clip(lower=0)
-    df_b['SRF_Penalty'] = (df_b['SRF_Penalty_Base'] + (df_b['SRF_Accel'] / 20).clip(0, 1) * 35).clip(0, 100)
-    df_b['Score_SRF'] = 100 - df_b['SRF_Penalty']
-
-    df_b['SRF_Weight'] = 0.10 + 0.15 * (df_b['SRF_Penalty'] / 100)
-    residual = 1 - df_b['SRF_Weight']
-    df_b['Score_Friction'] = (
-        df_b['Score_F1'] * residual * 0.4 +
-        df_b['Score_F2'] * residual * 0.3 +
-        df_b['Score_F3'] * residual * 0.3 +
-        df_b['Score_SRF'] * df_b['SRF_Weight']
-    )
-    df_b['Total_Score'] = df_b['Score_Policy'] * 0.40 + df_b['Score_Friction'] * 0.60
-
-    # 模块 C
-    df_c = ensure_df(df_all, ['DGS10', 'DGS2', 'DGS30', 'T10Y2Y', 'T10Y3M'])
-    def get_level_score(series): return series.rolling(1260, min_periods=1).rank(pct=True, ascending=False) * 100
-    df_c['Score_10Y'] = get_level_score(df_c['DGS10'])
-    df_c['Score_2Y'] = get_level_score(df_c['DGS2'])
-    df_c['Score_30Y'] = get_level_score(df_c['DGS30'])
-    def get_slope_score(series, target, tol):
-        dev = (series - target).abs()
-        return (100 - (dev / tol * 80)).clip(0, 100)
-    df_c['Score_Curve_2s10s'] = get_slope_score(df_c['T10Y2Y'], 0.5, 1.5)
-    df_c['Score_Curve_3m10s'] = get_slope_score(df_c['T10Y3M'], 0.75, 2.0)
-    df_c['Total_Score1'] = (df_c['Score_Curve_2s10s']*0.3 + df_c['Score_Curve_3m10s']*0.3 + df_c['Score_10Y']*0.2 + df_c['Score_2Y']*0.1 + df_c['Score_30Y']*0.1)
-    
-    slope_10 = df_c['DGS10'].diff(60)
-    slope_30 = df_c['DGS30'].diff(60)
-    df_c['Max_Slope'] = pd.concat([slope_10, slope_30], axis=1).max(axis=1)
-    def get_slope_penalty(s):
-        if s > 0.50: return 0.2
-        elif s > 0.30: return 0.6 
-        elif s > 0.15: return 0.8
-        else: return 1.0
-    df_c['Penalty_Factor'] = df_c['Max_Slope'].apply(get_slope_penalty)
-    df_c['Total_Score'] = df_c['Total_Score1'] * df_c['Penalty_Factor']
-
-    # 模块 D
-    df_d = ensure_df(df_all, ['DFII10', 'DFII5', 'T10YIE'])
-    df_d['Score_Real_10Y'] = df_d['DFII10'].rolling(1260, min_periods=1).rank(pct=True, ascending=False) * 100
-    df_d['Score_Real_5Y'] = df_d['DFII5'].rolling(1260, min_periods=1).rank(pct=True, ascending=False) * 100
-    df_d['Score_Breakeven'] = get_slope_score(df_d['T10YIE'], 2.1, 0.6) 
-    df_d['Total_Score'] = (df_d['Score_Real_10Y']*0.4 + df_d['Score_Real_5Y']*0.3 + df_d['Score_Breakeven']*0.3)
-
-    # 模块 E
-    df_e = df_all.copy().fillna(method='ffill')
-    df_e = ensure_df(df_e, ['DTWEXBGS', 'DXY', 'DEXJPUS', 'IRSTCI01JPM156N', 'DCOILWTICO', 'DHHNGSP'])
-    df_e['Chg_USD'] = df_e['DTWEXBGS'].pct_change(63)
-    df_e['Score_USD'] = (1 - df_e['Chg_USD'].rolling(1260, min_periods=1).rank(pct=True)) * 100
-    df_e['Chg_DXY'] = df_e['DXY'].pct_change(63)
-    df_e['Score_DXY'] = (1 - df_e['Chg_DXY'].rolling(1260, min_periods=1).rank(pct=True)) * 100
-    df_e['Yen_Appreciation'] = -1 * df_e['DEXJPUS'].pct_change(63)
-    df_e['Score_Yen_FX'] = (1 - df_e['Yen_Appreciation'].rolling(1260, min_periods=1).rank(pct=True)) * 100
-    df_e['Score_BoJ_Rate'] = (1 - df_e['IRSTCI01JPM156N'].rolling(1260, min_periods=1).rank(pct=True)) * 100
-    df_e['Score_Yen_Total'] = df_e['Score_Yen_FX'] * 0.7 + df_e['Score_BoJ_Rate'] * 0.3
-    df_e['Chg_Oil'] = df_e['DCOILWTICO'].pct_change(63)
-    df_e['Score_Oil'] = (1 - df_e['Chg_Oil'].rolling(1260, min_periods=1).rank(pct=True)) * 100
-    df_e['Chg_Gas'] = df_e['DHHNGSP'].pct_change(63)
-    df_e['Score_Gas'] = (1 - df_e['Chg_Gas'].rolling(1260, min_periods=1).rank(pct=True)) * 100
-    df_e['Score_Energy'] = df_e['Score_Oil'] * 0.5 + df_e['Score_Gas'] * 0.5
-    df_e['Total_Score'] = (df_e['Score_USD'] * 0.20 + df_e['Score_DXY'] * 0.20 + df_e['Score_Yen_Total'] * 0.3 + df_e['Score_Energy'] * 0.3)
+
+    # 各模块窄表（只读取声明的输入列，共享 score_engine 计算）
+    if frames is None:
+        frames = compute_module_frames(df_all, liquidity=liquidity, derived=derived)
+    df_a, df_b, df_c, df_d = frames['A'], frames['B'], frames['C'], frames['D']
+    df_e, df_f, df_g = frames['E'], frames['F'], frames['G']
+    if score_frame is None:
+        score_frame = build_score_frame(frames, df_all.index).dropna(subset=['Total_Score'])
+    # 日期 × 模块 得分立方（日 / 周 / 月）：趋势图、热力图、观察窗口只做切片
+    if score_cube is None:
+        score_cube = build_score_cube(frames, df_all.index)
+    version = data_version(df_all)
 
     # --------------------------------------------------------
     # 2. 准备渲染数据 (获取最新值)
@@ -399,52 +286,6 @@ def render_dashboard_standalone(df_all):
     score_d = df_d['Total_Score'].iloc[-1]
     score_e = df_e['Total_Score'].iloc[-1]
 
-    # 模块 F: 信用压力
-    df_f = ensure_df(df_all, ['BAMLH0A0HYM2', 'BAA10Y'])
-    def rolling_percentile_f(series, window=756, min_periods=30):
-        return series.rolling(window, min_periods=min_periods).apply(
-            lambda s: s.rank(pct=True).iloc[-1],
-            raw=False
-        ) * 100
-    def bounded_score(series):
-        return series.clip(lower=0, upper=100)
-    df_f['HY_Spread'] = df_f['BAMLH0A0HYM2']
-    df_f['BAA10Y'] = df_f['BAA10Y']
-    df_f['Score_HY_Level'] = 100 - rolling_percentile_f(df_f['HY_Spread'])
-    df_f['Score_HY_Trend'] = rolling_percentile_f(-df_f['HY_Spread'].diff(13))
-    df_f['Score_BAA_Level'] = 100 - rolling_percentile_f(df_f['BAA10Y'])
-    df_f['Total_Score'] = bounded_score(
-        df_f['Score_HY_Level'] * 0.5 +
-        df_f['Score_HY_Trend'] * 0.3 +
-        df_f['Score_BAA_Level'] * 0.2
-    )
-
-    # 模块 G: 风险偏好
-    vix_yh = df_all['VIX_YH'] if 'VIX_YH' in df_all.columns else None
-    vix_fd = df_all['VIXCLS'] if 'VIXCLS' in df_all.columns else None
-    vxv_yh = df_all['VXV_YH'] if 'VXV_YH' in df_all.columns else None
-    vxv_fd = df_all['VXVCLS'] if 'VXVCLS' in df_all.columns else None
-    df_g = df_all.copy()
-    df_g['VIX'] = vix_yh.combine_first(vix_fd) if vix_yh is not None else vix_fd
-    df_g['VXV'] = vxv_yh.combine_first(vxv_fd) if vxv_yh is not None else vxv_fd
-    if df_g['VIX'] is None or df_g['VXV'] is None or 'SP500' not in df_g.columns:
-        df_g = pd.DataFrame()
-    else:
-        df_g = ensure_df(df_g, ['SP500', 'VIX', 'VXV'])
-    if not df_g.empty:
-        df_g['VIX_VXV'] = df_g['VIX'] / df_g['VXV']
-        df_g['SPX'] = df_g['SP500']
-        df_g = df_g.dropna(subset=['VIX', 'VXV', 'SPX'])
-        if not df_g.empty:
-            df_g['Score_VIX'] = bounded_score(100 - rolling_percentile_f(df_g['VIX']))
-            df_g['Score_Term'] = bounded_score(100 - rolling_percentile_f(df_g['VIX_VXV']))
-            df_g['Score_Mom'] = bounded_score(rolling_percentile_f(df_g['SPX'].diff(65)))
-            df_g['Total_Score'] = bounded_score(
-                df_g['Score_Term'] * 0.4 +
-                df_g['Score_VIX'] * 0.3 +
-                df_g['Score_Mom'] * 0.3
-            )
-
     def safe_last(series, fallback=50.0):
         try:
             val = series.iloc[-1]
@@ -528,7 +369,7 @@ def render_dashboard_standalone(df_all):
         )
         
         st.markdown(f"""<div class="term-card" style="text-align:center;"><div style="font-weight:bold; font-size:20px; color:black; text-transform:uppercase; letter-spacing:1px; margin-bottom:10px;">宏观综合得分</div></div>""", unsafe_allow_html=True)
-        st.plotly_chart(fig_gauge, use_container_width=True)
+        show_chart(fig_gauge, use_container_width=True)
         
         chg_color = "text-green" if total_chg >= 0 else "text-red"
         chg_arrow = "▲" if total_chg >= 0 else "▼"
@@ -538,11 +379,8 @@ def render_dashboard_standalone(df_all):
         pills_html = ""
         tga_latest = df_all['WTREGEN'].iloc[-1]
         tga_prev = df_all['WTREGEN'].iloc[-9]
-        # 统一到“十亿美元”尺度判断（与模型惩罚逻辑一致）
-        tga_latest_b = tga_latest / 1000 if tga_latest > 10000 else tga_latest
-        tga_prev_b = tga_prev / 1000 if tga_prev > 10000 else tga_prev
-        tga_diff_b = tga_latest_b - tga_prev_b
-        tga_is_drain = True if tga_latest_b > 800 else (tga_diff_b > 0)
+        # TGA 入库时已统一为十亿美元（与模型惩罚逻辑一致）
+        tga_is_drain = True if tga_latest > 800 else (tga_latest - tga_prev > 0)
         pills_html += f'<span class="status-pill {"pill-danger" if tga_is_drain else "pill-success"}">💧 TGA {"抽水" if tga_is_drain else "放水"}</span>'
         pills_html += f'<span class="status-pill {"pill-danger" if df_all["T10Y2Y"].iloc[-1] < 0 else "pill-success"}">{"📉 倒挂" if df_all["T10Y2Y"].iloc[-1] < 0 else " 10Y-2Y利差正常"}</span>'
         pills_html += f'<span class="status-pill {"pill-danger" if df_all["RPONTSYD"].iloc[-1] > 1 else "pill-success"}">{"🏦 SRF 启用" if df_all["RPONTSYD"].iloc[-1] > 1 else " SRF 闲置"}</span>'
@@ -554,48 +392,42 @@ def render_dashboard_standalone(df_all):
         st.markdown("""<div class="term-card" style="height: 100%;"><div style="display:flex; justify-content:space-between; margin-bottom:9px;"><div style="font-weight:bold; font-size:20px; color:#1f2937;">综合得分趋势 (Historical Trend)</div>""", unsafe_allow_html=True)
 
         lookback_years = st.slider("⏱️ 观察窗口 (年)", 1, 10, 5)
-        idx = df_b.index
-        s_a_hist = df_a['Total_Score'].reindex(idx, method='ffill')
-        def safe_series(frame, col, fallback=50.0):
-            if frame is None or frame.empty or col not in frame.columns:
-                return pd.Series(fallback, index=idx)
-            return frame[col].reindex(idx, method='ffill').fillna(fallback)
-
-        s_total_hist = (
-            s_a_hist*0.20 +
-            safe_series(df_b, 'Total_Score')*0.20 +
-            safe_series(df_c, 'Total_Score')*0.15 +
-            safe_series(df_d, 'Total_Score')*0.15 +
-            safe_series(df_e, 'Total_Score')*0.15 +
-            safe_series(df_f, 'Total_Score')*0.075 +
-            safe_series(df_g, 'Total_Score')*0.075
-        ).dropna()
-        trading_days = lookback_years * 252
-        recent_trend = s_total_hist.tail(trading_days)
-
-        fig_trend = go.Figure()
-        # 主线：深蓝
-        fig_trend.add_trace(go.Scatter(x=recent_trend.index, y=recent_trend.values, name='综合得分', mode='lines', line=dict(color='#2563eb', width=2), fill='tozeroy', fillcolor='rgba(37, 99, 235, 0.05)'))
-        # 辅线：淡灰/淡彩
-        fig_trend.add_trace(go.Scatter(x=recent_trend.index, y=s_a_hist.loc[recent_trend.index], name='A.流动性', line=dict(color='#06b6d4', width=1, dash='dot'), visible='legendonly'))
-        fig_trend.add_trace(go.Scatter(x=recent_trend.index, y=safe_series(df_b, 'Total_Score').loc[recent_trend.index], name='B.资金面', line=dict(color='#8b5cf6', width=1, dash='dot'), visible='legendonly'))
-        fig_trend.add_trace(go.Scatter(x=recent_trend.index, y=safe_series(df_c, 'Total_Score').loc[recent_trend.index], name='C.国债', line=dict(color='#f59e0b', width=1, dash='dot'), visible='legendonly'))
-        fig_trend.add_trace(go.Scatter(x=recent_trend.index, y=safe_series(df_d, 'Total_Score').loc[recent_trend.index], name='D.利率', line=dict(color='#ec4899', width=1, dash='dot'), visible='legendonly'))
-        fig_trend.add_trace(go.Scatter(x=recent_trend.index, y=safe_series(df_e, 'Total_Score').loc[recent_trend.index], name='E.外部', line=dict(color='#10b981', width=1, dash='dot'), visible='legendonly'))
-        fig_trend.add_trace(go.Scatter(x=recent_trend.index, y=safe_series(df_f, 'Total_Score').loc[recent_trend.index], name='F.信用', line=dict(color='#ef4444', width=1, dash='dot'), visible='legendonly'))
-        fig_trend.add_trace(go.Scatter(x=recent_trend.index, y=safe_series(df_g, 'Total_Score').loc[recent_trend.index], name='G.风险偏好', line=dict(color='#0ea5e9', width=1, dash='dot'), visible='legendonly'))
-        
-        
-        fig_trend.update_layout(
-            height=300,
-            paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)',
-            margin=dict(l=0,r=0,t=10,b=0),
-            xaxis=dict(showgrid=False, tickfont=dict(color='#9ca3af')),
-            yaxis=dict(showgrid=True, gridcolor='#f3f4f6', zeroline=False, tickfont=dict(color='#9ca3af')),
-            hovermode="x unified",
-            legend=dict(orientation="h", y=1.1, font=dict(color="#4b5563"))
+        trend_freq = st.radio(
+            "频率", ['D', 'W', 'M'], horizontal=True, key="dash_trend_freq",
+            format_func=lambda f: {'D': '日', 'W': '周', 'M': '月'}[f],
         )
-        st.plotly_chart(fig_trend, use_container_width=True)
+        s_total_hist = score_cube['D']['Total'].dropna()
+        trend_cube = score_cube[trend_freq].dropna(subset=['Total'])
+        if trend_freq == 'D':
+            recent_trend = trend_cube.tail(lookback_years * 252)
+        elif not trend_cube.empty:
+            start = trend_cube.index[-1] - pd.DateOffset(years=lookback_years)
+            recent_trend = trend_cube[trend_cube.index > start]
+        else:
+            recent_trend = trend_cube
+
+        def build_trend():
+            fig = go.Figure()
+            # 主线：深蓝
+            fig.add_trace(go.Scatter(x=recent_trend.index, y=recent_trend['Total'].values, name='综合得分', mode='lines', line=dict(color='#2563eb', width=2), fill='tozeroy', fillcolor='rgba(37, 99, 235, 0.05)'))
+            # 辅线：淡灰/淡彩（A 缺失保持空白，其余缺失按 50）
+            for key, name, color in TREND_MODULE_LINES:
+                y = recent_trend[key] if key == 'A' else recent_trend[key].fillna(50.0)
+                fig.add_trace(go.Scatter(x=recent_trend.index, y=y, name=name, line=dict(color=color, width=1, dash='dot'), visible='legendonly'))
+            fig.update_layout(
+                height=300,
+                paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)',
+                margin=dict(l=0,r=0,t=10,b=0),
+                xaxis=dict(showgrid=False, tickfont=dict(color='#9ca3af')),
+                yaxis=dict(showgrid=True, gridcolor='#f3f4f6', zeroline=False, tickfont=dict(color='#9ca3af')),
+                hovermode="x unified",
+                legend=dict(orientation="h", y=1.1, font=dict(color="#4b5563"))
+            )
+            return fig
+
+        fig_trend = cached_figure('dashboard', 'score_trend', version, build_trend,
+                                  params={'years': lookback_years, 'freq': trend_freq})
+        show_chart(fig_trend, use_container_width=True)
         st.markdown("</div>", unsafe_allow_html=True)
 
     # --------------------------------------------------------
@@ -627,8 +459,8 @@ def render_dashboard_standalone(df_all):
     tga_curr = df_all['WTREGEN'].iloc[-1]
     tga_penalty_now = df_a['TGA_Penalty_Total'].iloc[-1] if 'TGA_Penalty_Total' in df_a.columns else 1.0
     sink_penalty_now = df_a['Sink_Penalty'].iloc[-1] if 'Sink_Penalty' in df_a.columns else 1.0
-    if tga_curr >= 800000:
-        desc_a = f"TGA水位过高 ({tga_curr/1000:.0f}B) · 惩罚 {tga_penalty_now:.2f}x / 吸收惩罚 {sink_penalty_now:.2f}x"
+    if tga_curr >= 800:
+        desc_a = f"TGA水位过高 ({tga_curr:.0f}B) · 惩罚 {tga_penalty_now:.2f}x / 吸收惩罚 {sink_penalty_now:.2f}x"
     else:
         desc_a = f"吸收惩罚 {sink_penalty_now:.2f}x" if sink_penalty_now < 0.9 else ("净流动性回落" if score_a < 40 else "净流动性趋势平稳")
     desc_b = "SOFR 突破 IORB" if df_all['SOFR'].iloc[-1] > df_all['IORB'].iloc[-1] else "回购市场利率控制良好"
@@ -661,96 +493,20 @@ def render_dashboard_standalone(df_all):
     # --------------------------------------------------------
     # 5. Top Score Lift / Drag（主要改善与拖累）
     # --------------------------------------------------------
-    def _collect_factor_delta(factors, label, series, module_weight, bucket):
-        if series is None:
-            return
-        s = pd.Series(series).dropna()
-        if s.shape[0] < 2:
-            return
-        now = float(s.iloc[-1]) * module_weight
-        prev = float(prev_week_value(s)) * module_weight
-        factors.append({"name": label, "delta": now - prev, "bucket": bucket})
-
-    factor_deltas = []
-
-    # A 模块分解
-    _collect_factor_delta(
-        factor_deltas,
-        "Net Liquidity",
-        df_a['Score_NetLiq_Adj'] * 0.45 * df_a['TGA_Penalty_Total'],
-        0.20,
-        "Flow"
-    )
-    _collect_factor_delta(factor_deltas, "TGA", df_a['Score_TGA'] * 0.20 * df_a['TGA_Penalty_Total'], 0.20, "Flow")
-    _collect_factor_delta(factor_deltas, "ON RRP", df_a['Score_RRP'] * 0.25 * df_a['TGA_Penalty_Total'], 0.20, "Flow")
-    _collect_factor_delta(factor_deltas, "Reserves", df_a['Score_Reserves'] * 0.10 * df_a['TGA_Penalty_Total'], 0.20, "Level")
-    _collect_factor_delta(
-        factor_deltas,
-        "TGA Penalty",
-        (
-            (df_a['Score_NetLiq_Adj'] * 0.45 + df_a['Score_TGA'] * 0.20 + df_a['Score_RRP'] * 0.25 + df_a['Score_Reserves'] * 0.10)
-            * (df_a['TGA_Penalty_Total'] - 1.0)
-        ),
-        0.20,
-        "Penalty"
-    )
-    _collect_factor_delta(
-        factor_deltas,
-        "Sink Penalty",
-        (
-            (df_a['Score_NetLiq_Adj'] - df_a['Score_NetLiq']) * 0.45 * df_a['TGA_Penalty_Total']
-        ),
-        0.20,
-        "Penalty"
-    )
-
-    # B 模块分解
-    b_res = 1 - df_b['SRF_Weight']
-    _collect_factor_delta(factor_deltas, "SOFR Policy", df_b['Score_Policy'] * 0.40, 0.20, "Level")
-    _collect_factor_delta(factor_deltas, "F1 Friction", df_b['Score_F1'] * b_res * 0.40 * 0.60, 0.20, "Flow")
-    _collect_factor_delta(factor_deltas, "F2 Friction", df_b['Score_F2'] * b_res * 0.30 * 0.60, 0.20, "Flow")
-    _collect_factor_delta(factor_deltas, "F3 Friction", df_b['Score_F3'] * b_res * 0.30 * 0.60, 0.20, "Flow")
-    _collect_factor_delta(factor_deltas, "SRF", df_b['Score_SRF'] * df_b['SRF_Weight'] * 0.60, 0.20, "Penalty")
-
-    # C 模块分解
-    _collect_factor_delta(factor_deltas, "10Y Nominal Rate", df_c['Score_10Y'] * 0.20, 0.15, "Level")
-    _collect_factor_delta(factor_deltas, "2Y Rate", df_c['Score_2Y'] * 0.10, 0.15, "Level")
-    _collect_factor_delta(factor_deltas, "30Y Rate", df_c['Score_30Y'] * 0.10, 0.15, "Level")
-    _collect_factor_delta(factor_deltas, "2s10s Curve", df_c['Score_Curve_2s10s'] * 0.30, 0.15, "Flow")
-    _collect_factor_delta(factor_deltas, "3m10s Curve", df_c['Score_Curve_3m10s'] * 0.30, 0.15, "Flow")
-    _collect_factor_delta(
-        factor_deltas,
-        "Curve Penalty",
-        df_c['Total_Score'] - df_c['Total_Score1'],
-        0.15,
-        "Penalty"
-    )
-
-    # D 模块分解
-    _collect_factor_delta(factor_deltas, "10Y Real Rate", df_d['Score_Real_10Y'] * 0.40, 0.15, "Level")
-    _collect_factor_delta(factor_deltas, "5Y Real Rate", df_d['Score_Real_5Y'] * 0.30, 0.15, "Level")
-    _collect_factor_delta(factor_deltas, "10Y Breakeven", df_d['Score_Breakeven'] * 0.30, 0.15, "Flow")
-
-    # E 模块分解
-    _collect_factor_delta(factor_deltas, "DXY", df_e['Score_DXY'] * 0.20, 0.15, "Flow")
-    _collect_factor_delta(factor_deltas, "Broad USD", df_e['Score_USD'] * 0.20, 0.15, "Flow")
-    _collect_factor_delta(factor_deltas, "Yen/Carry", df_e['Score_Yen_Total'] * 0.30, 0.15, "Flow")
-    _collect_factor_delta(factor_deltas, "Energy", df_e['Score_Energy'] * 0.30, 0.15, "Flow")
-
-    # F/G 模块分解
-    if not df_f.empty:
-        _collect_factor_delta(factor_deltas, "HY Credit", df_f['Score_HY_Level'] * 0.50, 0.075, "Level")
-        _collect_factor_delta(factor_deltas, "BAA10Y", df_f['Score_BAA_Level'] * 0.20, 0.075, "Level")
-        _collect_factor_delta(factor_deltas, "HY Trend", df_f['Score_HY_Trend'] * 0.30, 0.075, "Flow")
-    if not df_g.empty:
-        _collect_factor_delta(factor_deltas, "VIX", df_g['Score_VIX'] * 0.30, 0.075, "Level")
-        _collect_factor_delta(factor_deltas, "VIX/VXV", df_g['Score_Term'] * 0.40, 0.075, "Level")
-        _collect_factor_delta(factor_deltas, "Risk vs Safe", df_g['Score_Mom'] * 0.30, 0.075, "Flow")
+    # 因子贡献矩阵（全历史、周 / 月 / 年变化）按数据版本缓存
+    attribution = factor_attribution(frames, score_frame.index, version)
 
     section_header("Top Score Lift / Drag")
 
-    if factor_deltas:
-        factor_delta_df = pd.DataFrame(factor_deltas)
+    horizon_labels = {"WoW": "本周", "MoM": "本月", "YoY": "近一年"}
+    horizon = st.radio(
+        "归因区间", list(horizon_labels), horizontal=True, key="dash_attr_horizon",
+        format_func=lambda h: f"{h} ({horizon_labels[h]})", label_visibility="collapsed",
+    )
+    period = horizon_labels[horizon]
+    factor_delta_df = latest_deltas(attribution, horizon)
+
+    if not factor_delta_df.empty:
         lifts = factor_delta_df[factor_delta_df["delta"] > 0].sort_values("delta", ascending=False).head(3)
         drags = factor_delta_df[factor_delta_df["delta"] < 0].sort_values("delta", ascending=True).head(3)
         bucket_delta = factor_delta_df.groupby("bucket")["delta"].sum().reindex(["Level", "Flow", "Penalty"]).fillna(0.0)
@@ -770,7 +526,7 @@ def render_dashboard_standalone(df_all):
                     </div>"""
                     for _, r in lifts.iterrows()
                 ]
-            ) if not lifts.empty else """<div class="text-dim" style="padding:12px 0;">本周暂无明显正向抬升。</div>"""
+            ) if not lifts.empty else f"""<div class="text-dim" style="padding:12px 0;">{period}暂无明显正向抬升。</div>"""
 
             st.markdown(
                 f"""<div class="term-card" style="padding:18px;">
@@ -810,7 +566,7 @@ def render_dashboard_standalone(df_all):
 
         st.markdown(
             f"""<div class="term-card" style="padding:14px; margin-top:-10px;">
-            <div style="font-weight:700; color:#111827;">本周总分变化归因: {driver_text}</div>
+            <div style="font-weight:700; color:#111827;">{period}总分变化归因: {driver_text}</div>
             <div class="text-dim" style="margin-top:6px;">
             结构性变化 = Level + Penalty = <b>{structural_delta:+.2f} pts</b>；
             短期波动 = Flow = <b>{flow_delta:+.2f} pts</b>。
@@ -828,7 +584,7 @@ def render_dashboard_standalone(df_all):
                     </div>"""
                     for _, r in drags.iterrows()
                 ]
-            ) if not drags.empty else """<div class="text-dim" style="padding:12px 0;">本周暂无明显负向拖累。</div>"""
+            ) if not drags.empty else f"""<div class="text-dim" style="padding:12px 0;">{period}暂无明显负向拖累。</div>"""
 
             st.markdown(
                 f"""<div class="term-card" style="padding:18px;">
@@ -840,29 +596,56 @@ def render_dashboard_standalone(df_all):
                 unsafe_allow_html=True
             )
 
+    # 模块贡献历史（周频，近 3 年）：各模块加权贡献堆叠，合计即综合得分
+    def build_contribution_history():
+        contrib = module_contributions(attribution)
+        if contrib.empty:
+            return None
+        weekly = contrib[contrib.index >= contrib.index[-1] - pd.DateOffset(years=3)].resample("W-FRI").last().dropna(how="all")
+        if weekly.empty:
+            return None
+        palette = {"A": "#2563eb", "B": "#0891b2", "C": "#7c3aed", "D": "#db2777", "E": "#f59e0b", "F": "#16a34a", "G": "#6b7280"}
+        fig_contrib = go.Figure()
+        for key in weekly.columns:
+            fig_contrib.add_trace(go.Bar(
+                x=weekly.index, y=weekly[key], name=f"{key} ({MODULE_WEIGHTS[key]:.1%})",
+                marker_color=palette.get(key, "#9ca3af"),
+                hovertemplate=f"{key}: %{{y:.1f}} pts<extra></extra>",
+            ))
+        fig_contrib.add_trace(go.Scatter(
+            x=weekly.index, y=weekly.sum(axis=1, min_count=1), name="合计",
+            line=dict(color="#111827", width=2),
+            hovertemplate="合计: %{y:.1f}<extra></extra>",
+        ))
+        fig_contrib.update_layout(
+            barmode="relative", bargap=0.05, height=380,
+            margin=dict(l=10, r=10, t=8, b=8),
+            paper_bgcolor="rgba(0,0,0,0)", plot_bgcolor="rgba(0,0,0,0)",
+            yaxis=dict(title="贡献 (pts)", showgrid=True, gridcolor="#f3f4f6"),
+            legend=dict(orientation="h", y=1.08, x=0),
+            hovermode="x unified",
+        )
+        return fig_contrib
+
+    fig_contrib = cached_figure('dashboard', 'contribution_history', version, build_contribution_history)
+    if fig_contrib is not None:
+        with st.expander("模块贡献历史（周频，近 3 年）", expanded=False):
+            show_chart(fig_contrib, use_container_width=True)
+
     # --------------------------------------------------------
     # 6. 模块热力图（周频）
     # --------------------------------------------------------
     section_header("模块状态热力图（周频）")
 
-    base_idx = df_all.index
-    module_hist = pd.DataFrame(
-        {
-            "系统流动性": df_a["Total_Score"].reindex(base_idx, method="ffill"),
-            "资金价格/应急闸": df_b["Total_Score"].reindex(base_idx, method="ffill"),
-            "国债供给与市场功能": df_c["Total_Score"].reindex(base_idx, method="ffill"),
-            "利率预期与真实利": df_d["Total_Score"].reindex(base_idx, method="ffill"),
-            "信用与银行": (df_f["Total_Score"].reindex(base_idx, method="ffill") if not df_f.empty else pd.Series(50.0, index=base_idx)),
-            "风险偏好与波动": (df_g["Total_Score"].reindex(base_idx, method="ffill") if not df_g.empty else pd.Series(50.0, index=base_idx)),
-            "外部冲击与成本": df_e["Total_Score"].reindex(base_idx, method="ffill"),
-        },
-        index=base_idx,
-    )
-    module_weekly = module_hist.resample("W-FRI").last().dropna(how="all").tail(26)
+    def build_heatmap():
+        module_weekly = (
+            score_cube['W'][list(HEATMAP_MODULES)]
+            .dropna(how="all").tail(26)
+            .rename(columns=HEATMAP_MODULES)
+        )
+        if module_weekly.empty:
+            return None
 
-    if module_weekly.empty:
-        st.info("热力图数据不足，稍后刷新。")
-    else:
         module_names = list(module_weekly.columns)
         weekly_scores = module_weekly.T.values
         heat_z = np.where(
@@ -915,7 +698,13 @@ def render_dashboard_standalone(df_all):
                 tickfont=dict(color="#6b7280", size=14),
             ),
         )
-        st.plotly_chart(fig_heat, use_container_width=True)
+        return fig_heat
+
+    fig_heat = cached_figure('dashboard', 'module_heatmap', version, build_heatmap)
+    if fig_heat is None:
+        st.info("热力图数据不足，稍后刷新。")
+    else:
+        show_chart(fig_heat, use_container_width=True)
         st.markdown(
             """<div style="display:flex; gap:22px; flex-wrap:wrap; margin-top:8px;">
             <span style="display:inline-flex; align-items:center; gap:7px;"><span style="width:12px;height:12px;border-radius:4px;background:#fca5a5;"></span>&lt;33</span>
@@ -930,116 +719,139 @@ def render_dashboard_standalone(df_all):
     # 7. Regime 看板（四象限）
     # --------------------------------------------------------
     section_header("Regime 看板（复苏 / 过热 / 滞胀 / 放缓）")
-    reg = ensure_df(df_all, ["INDPRO", "PCEPILFE"]).copy()
-    if reg.empty:
-        st.info("Regime 数据不足（需要 INDPRO/PCEPILFE）。")
-    else:
-        reg_m = reg.resample("M").last()
-        reg_m["Growth_YoY"] = reg_m["INDPRO"].pct_change(12) * 100
-        reg_m["CorePCE_YoY"] = reg_m["PCEPILFE"].pct_change(12) * 100
-        g_mean = reg_m["Growth_YoY"].rolling(60, min_periods=12).mean()
-        g_std = reg_m["Growth_YoY"].rolling(60, min_periods=12).std().replace(0, np.nan)
-        i_mean = reg_m["CorePCE_YoY"].rolling(60, min_periods=12).mean()
-        i_std = reg_m["CorePCE_YoY"].rolling(60, min_periods=12).std().replace(0, np.nan)
-        reg_m["Growth_Z"] = (reg_m["Growth_YoY"] - g_mean) / g_std
-        reg_m["Infl_Z"] = (reg_m["CorePCE_YoY"] - i_mean) / i_std
-        reg_m = reg_m.dropna(subset=["Growth_Z", "Infl_Z"])
-
+    # 月频 Z 分数 / 象限切换 / 热力条只随数据版本变化：状态卡片的文字与热力条分别按版本缓存
+    def regime_board_state():
+        if any(col not in df_all.columns for col in REGIME_INPUTS) or df_all[REGIME_INPUTS].dropna().empty:
+            return {"status": "no_data"}
+        reg_m = macro_regimes(df_all, version)[DEFAULT_REGIME_WINDOW]
         if reg_m.empty:
-            st.info("Regime 数据样本不足（至少需要12个月有效数据）。")
+            return {"status": "short"}
+
+        reg_view = reg_m.tail(30)
+        reg_now = reg_view.iloc[-1]
+        switches = reg_view[reg_view["Regime"] != reg_view["Regime"].shift(1)]
+        if switches.shape[0] > 1:
+            sw = switches.iloc[-1]
+            sw_dt = switches.index[-1].strftime("%Y-%m")
+            reason_bits = []
+            prev_idx = reg_view.index.get_loc(switches.index[-1]) - 1
+            if prev_idx >= 0:
+                prev_row = reg_view.iloc[prev_idx]
+                if np.sign(sw["Growth_Z"]) != np.sign(prev_row["Growth_Z"]):
+                    reason_bits.append("增长动能穿越阈值(0)")
+                if np.sign(sw["Infl_Z"]) != np.sign(prev_row["Infl_Z"]):
+                    reason_bits.append("通胀压力穿越阈值(0)")
+            sw_reason = " + ".join(reason_bits) if reason_bits else "增长/通胀组合发生切换"
+            sw_text = f"最近切换: {sw_dt} → {sw['Regime']}（{sw_reason}）"
         else:
-            reg_m["Regime"] = np.select(
-                [
-                    (reg_m["Growth_Z"] >= 0) & (reg_m["Infl_Z"] < 0),
-                    (reg_m["Growth_Z"] >= 0) & (reg_m["Infl_Z"] >= 0),
-                    (reg_m["Growth_Z"] < 0) & (reg_m["Infl_Z"] >= 0),
-                    (reg_m["Growth_Z"] < 0) & (reg_m["Infl_Z"] < 0),
+            sw_text = "最近区间未发生象限切换。"
+        return {
+            "status": "ok",
+            "view": reg_view,
+            "regime": str(reg_now["Regime"]),
+            "growth_z": float(reg_now["Growth_Z"]),
+            "infl_z": float(reg_now["Infl_Z"]),
+            "switch_text": sw_text,
+        }
+
+    def build_regime_board():
+        reg_view = board["view"]
+        fig_reg = go.Figure(
+            data=go.Heatmap(
+                z=[reg_view["Regime_Code"].values],
+                x=list(range(reg_view.shape[0])),
+                y=["Regime"],
+                text=np.array([[d.strftime("%Y-%m") for d in reg_view.index]]),
+                customdata=np.array([reg_view["Regime"].values]),
+                hovertemplate="日期: %{text}<br>状态: %{customdata}<extra></extra>",
+                colorscale=[
+                    [0.00, "#93c5fd"], [0.24, "#93c5fd"],  # 放缓
+                    [0.25, "#86efac"], [0.49, "#86efac"],  # 复苏
+                    [0.50, "#fb923c"], [0.74, "#fb923c"],  # 过热
+                    [0.75, "#fca5a5"], [1.00, "#fca5a5"],  # 滞胀
                 ],
-                ["复苏", "过热", "滞胀", "放缓"],
-                default="放缓",
+                zmin=0,
+                zmax=3,
+                showscale=False,
+                xgap=3,
+                ygap=3,
+            )
+        )
+        tv = [i for i in range(reg_view.shape[0]) if i % 4 == 0 or i == reg_view.shape[0] - 1]
+        tt = [reg_view.index[i].strftime("%y-%m") for i in tv]
+        fig_reg.update_layout(
+            height=170,
+            margin=dict(l=8, r=8, t=8, b=8),
+            paper_bgcolor="rgba(0,0,0,0)",
+            plot_bgcolor="rgba(0,0,0,0)",
+            xaxis=dict(
+                tickmode="array",
+                tickvals=tv,
+                ticktext=tt,
+                showgrid=False,
+                zeroline=False,
+                tickfont=dict(color="#9ca3af"),
+            ),
+            yaxis=dict(showgrid=False, zeroline=False, tickfont=dict(color="#6b7280")),
+        )
+        return fig_reg
+
+    board = _REGIME_BOARD_CACHE.get(version, regime_board_state)
+    if board["status"] == "no_data":
+        st.info("Regime 数据不足（需要 INDPRO/PCEPILFE）。")
+    elif board["status"] == "short":
+        st.info(f"Regime 数据样本不足（Z 分数至少需要 {regime_min_months(DEFAULT_REGIME_WINDOW)} 个月有效同比数据，同比另需 12 个月历史）。")
+    else:
+        fig_reg = cached_figure('dashboard', 'regime_board', version, build_regime_board)
+        rc1, rc2 = st.columns([1.1, 1.9])
+        with rc1:
+            st.markdown(
+                f"""<div class="term-card" style="padding:16px;">
+                <div style="font-weight:800; font-size:18px; color:#111827;">当前状态: {board['regime']}</div>
+                <div class="text-dim" style="margin-top:8px;">阈值: Growth_Z=0 / CorePCE_Z=0</div>
+                <div style="margin-top:6px;">增长动能 Z: <b>{board['growth_z']:+.2f}</b></div>
+                <div style="margin-top:4px;">通胀压力 Z: <b>{board['infl_z']:+.2f}</b></div>
+                <div class="text-dim" style="margin-top:10px;">{board['switch_text']}</div>
+                </div>""",
+                unsafe_allow_html=True,
+            )
+        with rc2:
+            show_chart(fig_reg, use_container_width=True)
+            st.markdown(
+                """<div style="display:flex; gap:16px; flex-wrap:wrap; margin-top:2px;">
+                <span style="display:inline-flex; align-items:center; gap:6px;"><span style="width:10px;height:10px;border-radius:3px;background:#86efac;"></span>复苏</span>
+                <span style="display:inline-flex; align-items:center; gap:6px;"><span style="width:10px;height:10px;border-radius:3px;background:#fb923c;"></span>过热</span>
+                <span style="display:inline-flex; align-items:center; gap:6px;"><span style="width:10px;height:10px;border-radius:3px;background:#fca5a5;"></span>滞胀</span>
+                <span style="display:inline-flex; align-items:center; gap:6px;"><span style="width:10px;height:10px;border-radius:3px;background:#93c5fd;"></span>放缓</span>
+                </div>""",
+                unsafe_allow_html=True,
             )
-            regime_code_map = {"放缓": 0, "复苏": 1, "过热": 2, "滞胀": 3}
-            reg_view = reg_m.tail(30).copy()
-            reg_view["Regime_Code"] = reg_view["Regime"].map(regime_code_map).astype(float)
-            reg_now = reg_view.iloc[-1]
-            switches = reg_view[reg_view["Regime"] != reg_view["Regime"].shift(1)]
-            if switches.shape[0] > 1:
-                sw = switches.iloc[-1]
-                sw_dt = switches.index[-1].strftime("%Y-%m")
-                reason_bits = []
-                prev_idx = reg_view.index.get_loc(switches.index[-1]) - 1
-                if prev_idx >= 0:
-                    prev_row = reg_view.iloc[prev_idx]
-                    if np.sign(sw["Growth_Z"]) != np.sign(prev_row["Growth_Z"]):
-                        reason_bits.append("增长动能穿越阈值(0)")
-                    if np.sign(sw["Infl_Z"]) != np.sign(prev_row["Infl_Z"]):
-                        reason_bits.append("通胀压力穿越阈值(0)")
-                sw_reason = " + ".join(reason_bits) if reason_bits else "增长/通胀组合发生切换"
-                sw_text = f"最近切换: {sw_dt} → {sw['Regime']}（{sw_reason}）"
-            else:
-                sw_text = "最近区间未发生象限切换。"
-
-            rc1, rc2 = st.columns([1.1, 1.9])
-            with rc1:
-                st.markdown(
-                    f"""<div class="term-card" style="padding:16px;">
-                    <div style="font-weight:800; font-size:18px; color:#111827;">当前状态: {reg_now['Regime']}</div>
-                    <div class="text-dim" style="margin-top:8px;">阈值: Growth_Z=0 / CorePCE_Z=0</div>
-                    <div style="margin-top:6px;">增长动能 Z: <b>{reg_now['Growth_Z']:+.2f}</b></div>
-                    <div style="margin-top:4px;">通胀压力 Z: <b>{reg_now['Infl_Z']:+.2f}</b></div>
-                    <div class="text-dim" style="margin-top:10px;">{sw_text}</div>
-                    </div>""",
-                    unsafe_allow_html=True,
-                )
-            with rc2:
-                fig_reg = go.Figure(
-                    data=go.Heatmap(
-                        z=[reg_view["Regime_Code"].values],
-                        x=list(range(reg_view.shape[0])),
-                        y=["Regime"],
-                        text=np.array([[d.strftime("%Y-%m") for d in reg_view.index]]),
-                        customdata=np.array([reg_view["Regime"].values]),
-                        hovertemplate="日期: %{text}<br>状态: %{customdata}<extra></extra>",
-                        colorscale=[
-                            [0.00, "#93c5fd"], [0.24, "#93c5fd"],  # 放缓
-                            [0.25, "#86efac"], [0.49, "#86efac"],  # 复苏
-                            [0.50, "#fb923c"], [0.74, "#fb923c"],  # 过热
-                            [0.75, "#fca5a5"], [1.00, "#fca5a5"],  # 滞胀
-                        ],
-                        zmin=0,
-                        zmax=3,
-                        showscale=False,
-                        xgap=3,
-                        ygap=3,
-                    )
-                )
-                tv = [i for i in range(reg_view.shape[0]) if i % 4 == 0 or i == reg_view.shape[0] - 1]
-                tt = [reg_view.index[i].strftime("%y-%m") for i in tv]
-                fig_reg.update_layout(
-                    height=170,
-                    margin=dict(l=8, r=8, t=8, b=8),
-                    paper_bgcolor="rgba(0,0,0,0)",
-                    plot_bgcolor="rgba(0,0,0,0)",
-                    xaxis=dict(
-                        tickmode="array",
-                        tickvals=tv,
-                        ticktext=tt,
-                        showgrid=False,
-                        zeroline=False,
-                        tickfont=dict(color="#9ca3af"),
-                    ),
-                    yaxis=dict(showgrid=False, zeroline=False, tickfont=dict(color="#6b7280")),
-                )
-                st.plotly_chart(fig_reg, use_container_width=True)
-                st.markdown(
-                    """<div style="display:flex; gap:16px; flex-wrap:wrap; margin-top:2px;">
-                    <span style="display:inline-flex; align-items:center; gap:6px;"><span style="width:10px;height:10px;border-radius:3px;background:#86efac;"></span>复苏</span>
-                    <span style="display:inline-flex; align-items:center; gap:6px;"><span style="width:10px;height:10px;border-radius:3px;background:#fb923c;"></span>过热</span>
-                    <span style="display:inline-flex; align-items:center; gap:6px;"><span style="width:10px;height:10px;border-radius:3px;background:#fca5a5;"></span>滞胀</span>
-                    <span style="display:inline-flex; align-items:center; gap:6px;"><span style="width:10px;height:10px;border-radius:3px;background:#93c5fd;"></span>放缓</span>
-                    </div>""",
-                    unsafe_allow_html=True,
-                )
+
+    # --------------------------------------------------------
+    # 7.5 历史相似情景（A-G 七维得分 kNN）
+    # --------------------------------------------------------
+    section_header("历史相似情景（A-G 七维得分）")
+    an1, an2 = st.columns(2)
+    analog_k = an1.slider("近邻数量", 3, 10, 5, key="analog_k")
+    analog_gap = an2.slider("最小间隔（天）", 30, 365, 90, step=15, key="analog_gap")
+    analog_nb, analog_tab, analog_sum = find_analogs(
+        analog_index(frames, score_frame.index, version), _analog_prices(df_all), k=analog_k, min_gap=analog_gap
+    )
+    analog_ctx = analog_context(analog_nb, analog_tab, analog_sum)
+    if analog_nb.empty:
+        st.info("历史样本不足，无法检索相似情景。")
+    else:
+        nb_view = analog_nb.round(1)
+        nb_view.columns = ["距离"] + [c.replace("Score_", "") for c in analog_nb.columns[1:]]
+        fwd_3m = analog_tab.xs("3M", axis=1, level="期限").round(1)
+        fwd_3m.columns = [f"{c} 3M(%)" for c in fwd_3m.columns]
+        nb_view = nb_view.join(fwd_3m)
+        nb_view.index = nb_view.index.strftime("%Y-%m-%d")
+        st.dataframe(nb_view.rename_axis("相似日期"), use_container_width=True)
+        sum_view = analog_sum.copy()
+        sum_view["胜率"] = sum_view["胜率"].map(lambda v: f"{v:.0%}" if pd.notna(v) else "-")
+        st.dataframe(sum_view.round(2), use_container_width=True, hide_index=True)
+        st.caption("距离 = 标准化七维得分向量的欧氏距离（当时尚未上线的模块不参与比较，表中留空）；前瞻收益自相似日起按交易日计，样本不足的期限留空。")
 
     # --------------------------------------------------------
     # 8. 实时市场看板（跨资产）
@@ -1194,7 +1006,7 @@ def render_dashboard_standalone(df_all):
         
         # 积分计算逻辑 (原样保留)
         score = 0
-        tga_diff = (latest_tga - prev_tga_week) / 1000
+        tga_diff = latest_tga - prev_tga_week
         if tga_diff < -10: score += 1
         elif tga_diff > 10: score -= 1
         
@@ -1223,7 +1035,7 @@ def render_dashboard_standalone(df_all):
         
         dview = df_all[df_all.index >= '2023-01-01']
         fig_cross = go.Figure()
-        fig_cross.add_trace(go.Scatter(x=dview.index, y=dview['WTREGEN']/1000, name='TGA ($B)', fill='tozeroy', line=dict(width=0), fillcolor='rgba(128,128,128,0.15)'))
+        fig_cross.add_trace(go.Scatter(x=dview.index, y=dview['WTREGEN'], name='TGA ($B)', fill='tozeroy', line=dict(width=0), fillcolor='rgba(128,128,128,0.15)'))
         fig_cross.add_trace(go.Scatter(x=dview.index, y=dview['SOFR'], name='SOFR (%)', yaxis='y2', line=dict(color='#0068c9', width=2)))
         fig_cross.add_trace(go.Bar(x=dview.index, y=dview['RPONTSYD'], name='SRF ($B)', yaxis='y2', marker_color='rgba(255,43,43,0.6)'))
         
@@ -1236,7 +1048,7 @@ def render_dashboard_standalone(df_all):
             legend=dict(orientation="h", y=-0.2, font=dict(color="#4b5563")), 
             margin=dict(t=10, b=10, l=10, r=10), hovermode="x unified"
         )
-        st.plotly_chart(fig_cross, use_container_width=True)
+        show_chart(fig_cross, use_container_width=True)
         
 
     with col_chart_2:
@@ -1264,7 +1076,7 @@ def render_dashboard_standalone(df_all):
             legend=dict(orientation="h", y=-0.2, font=dict(color="#4b5563")),
             margin=dict(t=10, b=10, l=10, r=10), hovermode="x unified"
         )
-        st.plotly_chart(fig_spx, use_container_width=True)
+        show_chart(fig_spx, use_container_width=True)
 
     # --------------------------------------------------------
     # 6. 风险雷达 (Text Output)
@@ -1272,20 +1084,22 @@ def render_dashboard_standalone(df_all):
     section_header("风险雷达")
     risk_items = []
     context_notes = []
+    # 规则在全历史上向量化回放（按数据版本缓存），雷达只读取最新一行的触发状态
+    replay = risk_replay(df_all, frames, version)
+    fired = replay["matrix"].iloc[-1]
 
     def add_risk(level, title, trigger, off):
         risk_items.append({"level": level, "title": title, "trigger": trigger, "off": off})
 
-    tga_val_check = tga_curr / 1000 if tga_curr > 10000 else tga_curr
-    if tga_val_check >= 800:
-        p_val = "0.5x" if tga_val_check >= 900 else ("0.6x" if tga_val_check >= 850 else "0.8x")
+    if fired['tga_penalty']:
+        p_val = "0.5x" if tga_curr >= 900 else ("0.6x" if tga_curr >= 850 else "0.8x")
         add_risk(
-            "red" if tga_val_check >= 900 else "orange",
+            "red" if tga_curr >= 900 else "orange",
             f"A模块 (TGA惩罚): 流动性抽水加剧，惩罚系数 {p_val}",
-            f"TGA 水位 {tga_val_check:.0f}B >= 800B。",
+            f"TGA 水位 {tga_curr:.0f}B >= 800B。",
             "TGA 重新回落至 <800B 且 4周变化转负。"
         )
-    if score_a < 40:
+    if fired['liquidity_weak']:
         add_risk(
             "red",
             f"A模块 (流动性): 整体流动性偏紧，得分 {score_a:.1f}",
@@ -1293,14 +1107,14 @@ def render_dashboard_standalone(df_all):
             "A模块得分连续两周回到 >=45。"
         )
 
-    if df_all['RPONTSYD'].iloc[-1] > 10:
+    if fired['srf_usage']:
         add_risk(
             "red",
             "B模块 (资金面): 应急融资启动",
             f"SRF 使用量 {df_all['RPONTSYD'].iloc[-1]:.1f}B > 10B。",
             "SRF 回落到 5B 以下并维持 3 个交易日。"
         )
-    elif df_all['SOFR'].iloc[-1] > df_all['IORB'].iloc[-1]:
+    elif fired['sofr_above_iorb']:
         add_risk(
             "orange",
             "B模块 (资金面): 资金价格偏贵",
@@ -1308,14 +1122,14 @@ def render_dashboard_standalone(df_all):
             "SOFR 回落至 IORB 下方并持续 2-3 天。"
         )
 
-    if df_c['Penalty_Factor'].iloc[-1] < 1.0:
+    if fired['long_end_slope']:
         add_risk(
             "red",
             "C模块 (国债): 长端利率急涨，估值压力增加",
             f"长端斜率惩罚触发，Penalty={df_c['Penalty_Factor'].iloc[-1]:.1f}x。",
             "Penalty 恢复到 1.0x 且 10Y 60日斜率回到温和区间。"
         )
-    elif df_all['T10Y2Y'].iloc[-1] < -0.5:
+    elif fired['deep_inversion']:
         add_risk(
             "orange",
             "C模块 (国债): 曲线深度倒挂",
@@ -1323,7 +1137,7 @@ def render_dashboard_standalone(df_all):
             "2s10s 回升至 > -0.20 且保持。"
         )
 
-    if df_all['DFII10'].iloc[-1] > 2.0:
+    if fired['real_rate_high']:
         add_risk(
             "orange",
             "D模块 (实利): 实际利率偏高",
@@ -1331,29 +1145,23 @@ def render_dashboard_standalone(df_all):
             "10Y 实际利率回落至 <1.8%。"
         )
 
-    try:
-        if df_all['DEXJPUS'].pct_change(5).iloc[-1] < -0.03:
-            add_risk(
-                "red",
-                "E模块 (汇率): 套息退潮风险",
-                f"USDJPY 5日变动 {df_all['DEXJPUS'].pct_change(5).iloc[-1]*100:.1f}% < -3%。",
-                "USDJPY 波动收敛且回到 -1%~+1% 区间。"
-            )
-    except Exception:
-        pass
+    if fired['yen_carry_unwind']:
+        add_risk(
+            "red",
+            "E模块 (汇率): 套息退潮风险",
+            f"USDJPY 5日变动 {df_all['DEXJPUS'].pct_change(5).iloc[-1]*100:.1f}% < -3%。",
+            "USDJPY 波动收敛且回到 -1%~+1% 区间。"
+        )
 
-    try:
-        if df_all['DCOILWTICO'].pct_change(20).iloc[-1] > 0.15:
-            add_risk(
-                "orange",
-                "E模块 (能源): 通胀再抬头风险",
-                f"WTI 20日涨幅 {df_all['DCOILWTICO'].pct_change(20).iloc[-1]*100:.1f}% > 15%。",
-                "WTI 20日涨幅回落至 <8%。"
-            )
-    except Exception:
-        pass
+    if fired['oil_spike']:
+        add_risk(
+            "orange",
+            "E模块 (能源): 通胀再抬头风险",
+            f"WTI 20日涨幅 {df_all['DCOILWTICO'].pct_change(20).iloc[-1]*100:.1f}% > 15%。",
+            "WTI 20日涨幅回落至 <8%。"
+        )
 
-    if not df_f.empty and (score_f < 40 or df_f['HY_Spread'].iloc[-1] > 6.0 or df_f['BAA10Y'].iloc[-1] > 3.0):
+    if fired['credit_stress']:
         add_risk(
             "red",
             "F模块 (信用): 信用压力升温",
@@ -1361,7 +1169,7 @@ def render_dashboard_standalone(df_all):
             "HY 低于 5% 且 BAA10Y 低于 2.5%。"
         )
 
-    if not df_g.empty and (score_g < 40 or df_g['VIX'].iloc[-1] > 25 or df_g['VIX_VXV'].iloc[-1] > 1.0):
+    if fired['risk_off']:
         add_risk(
             "red",
             "G模块 (风险偏好): 风险厌恶升温",
@@ -1407,6 +1215,19 @@ def render_dashboard_standalone(df_all):
             unsafe_allow_html=True
         )
 
+    with st.expander("📜 风险规则历史回放（触发 / 解除 / 命中率）", expanded=False):
+        stats_view = replay["stats"].copy()
+        for col in [c for c in stats_view.columns if c.endswith("命中率")] + ["触发占比"]:
+            stats_view[col] = stats_view[col].map(lambda v: f"{v:.0%}" if pd.notna(v) else "-")
+        st.dataframe(stats_view.round(2), use_container_width=True, hide_index=True)
+        st.caption("命中率 = 每段首次触发后 SPX 前瞻收益为负的比例；触发占比 = 全历史中规则处于触发状态的天数占比。")
+        recent_eps = replay["episodes"].tail(15).iloc[::-1].copy()
+        if not recent_eps.empty:
+            recent_eps["规则"] = recent_eps["规则"].map(lambda k: RISK_RULES[k]["name"])
+            recent_eps["触发日"] = recent_eps["触发日"].dt.strftime("%Y-%m-%d")
+            recent_eps["解除日"] = recent_eps["解除日"].dt.strftime("%Y-%m-%d").fillna("触发中")
+            st.dataframe(recent_eps, use_container_width=True, hide_index=True)
+
     # --------------------------------------------------------
     # 7. AI 宏观分析 (风险雷达下方)
     # --------------------------------------------------------
@@ -1418,71 +1239,17 @@ def render_dashboard_standalone(df_all):
     if 'ai_report' not in st.session_state:
         st.session_state.ai_report = None
 
-    def clean_text_for_pdf(raw_text: str) -> str:
-        if not raw_text:
-            return ""
-        txt = html.unescape(raw_text)
-        txt = re.sub(r"<[^>]+>", "", txt)
-        txt = txt.replace("\r\n", "\n")
-        return txt
-
-    def normalize_report_date(raw_text: str, cutoff_date: str) -> str:
-        if not raw_text:
-            return raw_text
-        lines = [ln.rstrip() for ln in raw_text.splitlines()]
-        kept = []
-        for ln in lines:
-            if re.search(r"(报告日期|发布日期)\s*[:：]", ln):
-                continue
-            kept.append(ln)
-        body = "\n".join(kept).lstrip()
-        header = f"报告日期（数据截止）: {cutoff_date}"
-        if body.startswith(header):
-            return body
-        return f"{header}\n\n{body}"
-
-    def build_pdf_bytes(text: str, title: str = "AI宏观分析报告") -> bytes:
-        try:
-            from reportlab.pdfgen import canvas
-            from reportlab.lib.pagesizes import A4
-            from reportlab.pdfbase import pdfmetrics
-            from reportlab.pdfbase.cidfonts import UnicodeCIDFont
-
-            pdfmetrics.registerFont(UnicodeCIDFont("STSong-Light"))
-            buffer = io.BytesIO()
-            c = canvas.Canvas(buffer, pagesize=A4)
-            width, height = A4
-            c.setFont("STSong-Light", 16)
-            c.drawString(50, height - 50, title)
-            c.setFont("STSong-Light", 10)
-            y = height - 80
-            for line in text.split("\n"):
-                wrapped = textwrap.wrap(line, width=90) or [""]
-                for wline in wrapped:
-                    if y < 50:
-                        c.showPage()
-                        c.setFont("STSong-Light", 10)
-                        y = height - 50
-                    c.drawString(50, y, wline)
-                    y -= 14
-            c.save()
-            buffer.seek(0)
-            return buffer.getvalue()
-        except Exception:
-            # 兜底：返回空字节
-            return b""
-
     col_left, col_right = st.columns([0.35, 0.65])
     with col_left:
         if st.button("生成AI宏观分析", type="primary", use_container_width=True):
             st.session_state.ai_request = True
     with col_right:
         if st.session_state.get("ai_report"):
-            safe_text = clean_text_for_pdf(st.session_state.ai_report)
-            pdf_bytes = build_pdf_bytes(safe_text, title="AI宏观分析报告")
+            # 点击下载时才排版 PDF（旧版 Streamlit 退回直接渲染），同一份报告文本只渲染一次
+            pdf_data = (lazy_pdf if DEFERRED_DOWNLOAD else cached_pdf_bytes)(st.session_state.ai_report, REPORT_TITLE)
             st.download_button(
                 "下载PDF报告",
-                data=pdf_bytes,
+                data=pdf_data,
                 file_name=f"macro_report_{df_all.index[-1].strftime('%Y-%m-%d')}.pdf",
                 mime="application/pdf",
                 use_container_width=False
@@ -1500,186 +1267,9 @@ def render_dashboard_standalone(df_all):
     if st.session_state.get("ai_request"):
         with st.spinner("🤖 正在生成宏观研究报告..."):
             # ---------- build structured AI context ----------
-            def safe_hist_value(series, days_back):
-                try:
-                    target = series.index[-1] - pd.Timedelta(days=days_back)
-                    idx = series.index.get_indexer([target], method='nearest')[0]
-                    return float(series.iloc[idx])
-                except Exception:
-                    return float(series.iloc[-1])
-
-            def classify_regime(val):
-                if val < 30: return "Crisis"
-                if val < 45: return "Weak"
-                if val < 60: return "Neutral"
-                return "Strong"
-
-            def find_similar_periods(series, band=2.0, min_gap=90):
-                if series is None or series.empty:
-                    return []
-                latest = series.iloc[-1]
-                hits = series[(series >= latest - band) & (series <= latest + band)]
-                hits = hits[hits.index <= (series.index[-1] - pd.Timedelta(days=min_gap))]
-                return [d.strftime('%Y-%m-%d') for d in hits.tail(3).index]
-
-            def forward_returns(prices, anchor_dates, horizon_days=63):
-                if prices is None or prices.empty:
-                    return []
-                out = []
-                for d in anchor_dates:
-                    try:
-                        anchor = prices.loc[:d].iloc[-1]
-                        future = prices.loc[d:].iloc[:horizon_days].iloc[-1]
-                        out.append(float((future / anchor - 1) * 100))
-                    except Exception:
-                        continue
-                return out
-
-            def percentile_rank(series, value):
-                try:
-                    return float(series.rank(pct=True).iloc[-1] * 100)
-                except Exception:
-                    return 50.0
-
-            def identify_top_drivers(mod):
-                if mod == "A":
-                    return [
-                        f"TGA {tga_val_check:.0f}B",
-                        f"RRP {df_all['RRPONTSYD'].iloc[-1]:.1f}B",
-                        f"NetLiqAdj {df_a['Score_NetLiq_Adj'].iloc[-1]:.1f}"
-                    ]
-                if mod == "B":
-                    return [
-                        f"SOFR {df_all['SOFR'].iloc[-1]:.2f}",
-                        f"IORB {df_all['IORB'].iloc[-1]:.2f}",
-                        f"SRF {df_all['RPONTSYD'].iloc[-1]:.1f}B"
-                    ]
-                if mod == "C":
-                    return [
-                        f"10Y-2Y {df_all['T10Y2Y'].iloc[-1]:.2f}",
-                        f"10Y {df_all['DGS10'].iloc[-1]:.2f}",
-                        f"Penalty {df_c['Penalty_Factor'].iloc[-1]:.1f}x"
-                    ]
-                if mod == "D":
-                    return [
-                        f"10Y Real {df_all['DFII10'].iloc[-1]:.2f}",
-                        f"Breakeven {df_all['T10YIE'].iloc[-1]:.2f}"
-                    ]
-                if mod == "E":
-                    return [
-                        f"DXY chg {df_e['Chg_DXY'].iloc[-1]:.2%}",
-                        f"Oil chg {df_e['Chg_Oil'].iloc[-1]:.2%}"
-                    ]
-                if mod == "F":
-                    return [
-                        f"HY {df_f['HY_Spread'].iloc[-1]:.2f}%",
-                        f"BAA10Y {df_f['BAA10Y'].iloc[-1]:.2f}%"
-                    ] if not df_f.empty else ["data limited"]
-                if mod == "G":
-                    return [
-                        f"VIX {vix_now:.1f}",
-                        f"VIX/VXV {term_now:.2f}",
-                        f"SPX mom {df_g['Score_Mom'].iloc[-1]:.1f}" if not df_g.empty else "SPX mom n/a"
-                    ]
-                return []
-
-            total_series = s_total_hist.reindex(df_all.index, method='ffill').dropna() if 's_total_hist' in locals() else pd.Series(dtype=float)
-            total_now = float(total_series.iloc[-1]) if not total_series.empty else total_score
-            total_1m = safe_hist_value(total_series, 30) if not total_series.empty else total_score
-            total_3m = safe_hist_value(total_series, 90) if not total_series.empty else total_score
-            total_1y = safe_hist_value(total_series, 365) if not total_series.empty else total_score
-
-            spx = df_all['SP500'].dropna() if 'SP500' in df_all.columns else pd.Series(dtype=float)
-            similar_dates = find_similar_periods(total_series)
-            fwd_3m = forward_returns(spx, similar_dates, 63)
-
-            report_cutoff_date = df_all.index[-1].strftime('%Y-%m-%d')
-            report_cutoff_month = df_all.index[-1].strftime('%Y年%m月')
-            context_obj = {
-                "meta": {
-                    "data_cutoff_date": report_cutoff_date,
-                    "data_cutoff_month": report_cutoff_month,
-                },
-                "summary": {
-                    "overall_score": round(total_now, 1),
-                    "vs_1m": round(total_now - total_1m, 1),
-                    "vs_3m": round(total_now - total_3m, 1),
-                    "vs_1y": round(total_now - total_1y, 1)
-                },
-                "module_breakdown": [
-                    {
-                        "name": "Liquidity (A)",
-                        "score": round(float(score_a), 1),
-                        "key_drivers": identify_top_drivers("A"),
-                        "historical_context": f"Score pct {percentile_rank(df_a['Total_Score'], score_a):.0f}"
-                    },
-                    {
-                        "name": "Funding (B)",
-                        "score": round(float(score_b), 1),
-                        "key_drivers": identify_top_drivers("B"),
-                        "historical_context": f"Score pct {percentile_rank(df_b['Total_Score'], score_b):.0f}"
-                    },
-                    {
-                        "name": "Yield Curve (C)",
-                        "score": round(float(score_c), 1),
-                        "key_drivers": identify_top_drivers("C"),
-                        "historical_context": f"Score pct {percentile_rank(df_c['Total_Score'], score_c):.0f}"
-                    },
-                    {
-                        "name": "Real Rates (D)",
-                        "score": round(float(score_d), 1),
-                        "key_drivers": identify_top_drivers("D"),
-                        "historical_context": f"Score pct {percentile_rank(df_d['Total_Score'], score_d):.0f}"
-                    },
-                    {
-                        "name": "External (E)",
-                        "score": round(float(score_e), 1),
-                        "key_drivers": identify_top_drivers("E"),
-                        "historical_context": f"Score pct {percentile_rank(df_e['Total_Score'], score_e):.0f}"
-                    },
-                    {
-                        "name": "Credit (F)",
-                        "score": round(float(score_f), 1),
-                        "key_drivers": identify_top_drivers("F"),
-                        "historical_context": f"Score pct {percentile_rank(df_f['Total_Score'], score_f):.0f}" if not df_f.empty else "n/a"
-                    },
-                    {
-                        "name": "Risk Appetite (G)",
-                        "score": round(float(score_g), 1),
-                        "key_drivers": identify_top_drivers("G"),
-                        "historical_context": f"Score pct {percentile_rank(df_g['Total_Score'], score_g):.0f}" if not df_g.empty else "n/a"
-                    }
-                ],
-                "regime_analysis": {
-                    "current": classify_regime(total_now),
-                    "last_similar": similar_dates,
-                    "what_happened_next": f"SPX 3M fwd returns: {', '.join([f'{x:.1f}%' for x in fwd_3m])}" if fwd_3m else "Not enough history"
-                },
-                "cross_asset_implications": {
-                    "equities": "High real rates + inverted curve → Bearish",
-                    "bonds": "Rising TGA + falling RRP → Duration risk",
-                    "commodities": "Strong USD + energy spike → Mixed"
-                }
-            }
-
-            prompt = f"""
-            你是一位顶级宏观策略师。基于以下结构化数据写一份Deep Research 市场分析报告:
-            {json.dumps(context_obj, ensure_ascii=False, indent=2)}
-
-            强约束:
-            1. 报告日期必须使用数据截止日：{report_cutoff_date}
-            2. 如果你写月度表达，只能写：{report_cutoff_month}
-            3. 不允许自行推断或虚构其它日期
-            4. 报告第一行必须是：报告日期（数据截止）: {report_cutoff_date}
-
-            请提供:
-            1. 当前宏观环境定性 (1句话)
-            2. 核心驱动因素分析 (Top 3)
-            3. 历史相似情境对比
-            4. 资产配置建议 (股/债/商品/现金/BTC)
-            5. 关键风险点及触发条件
-            6. 风格：专业、犀利、数据驱动
-            """
+            context_obj = build_report_context(df_all, frames, analog_ctx)
+            report_cutoff_date = context_obj["meta"]["data_cutoff_date"]
+            prompt = build_report_prompt(context_obj)
 
             raw_ai_report = call_gemini_new_sdk(prompt, GEMINI_API_KEY)
             st.session_state.ai_report = normalize_report_date(raw_ai_report, report_cutoff_date)
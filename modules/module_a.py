@@ -1,97 +1,19 @@
 import streamlit as st
-import pandas as pd
 import plotly.graph_objects as go
+from score_engine import compute_module_a
+from chart_utils import show_chart, cached_figure
+from shared_store import data_version
 
 # ==========================================
 # 3. 模块 A: 系统流动性 (周频)
 # ==========================================
-def render_module_a(df_all):
-  
-
-    df_raw = df_all[df_all.index >= '2020-01-01'].copy()
-
-    df = pd.DataFrame()
-    df['WALCL'] = df_raw['WALCL'].resample('W-WED').last() 
-    df['WTREGEN'] = df_raw['WTREGEN'].resample('W-WED').last()
-    df['RRPONTSYD'] = df_raw['RRPONTSYD'].resample('W-WED').last()
-    df['WRESBAL'] = df_raw['WRESBAL'].resample('W-WED').last()
-    df = df.fillna(method='ffill').dropna()
-
-    def get_tga_penalty(tga_val):
-        tga_b = tga_val / 1000 if tga_val > 10000 else tga_val
-        
-        if tga_b < 800:
-            return 1.0  
-        elif 800 <= tga_b < 850:
-            return 0.8  
-        elif 850 <= tga_b < 900:
-            return 0.6
-        else:
-            return 0.5
-    
-    # 统一到“十亿美元”尺度
-    tga_b = df['WTREGEN'].where(df['WTREGEN'] <= 10000, df['WTREGEN'] / 1000)
-    df['TGA_Penalty_Level'] = tga_b.apply(get_tga_penalty)
-
-    def get_tga_trend_penalty(delta_b):
-        if delta_b <= 0: return 1.0
-        elif delta_b <= 50: return 0.95
-        elif delta_b <= 100: return 0.9
-        elif delta_b <= 150: return 0.8
-        else: return 0.7
-
-    df['TGA_Change_4W'] = tga_b.diff(4).fillna(0)
-    df['TGA_Penalty_Trend'] = df['TGA_Change_4W'].apply(get_tga_trend_penalty)
-    df['TGA_Penalty_Total'] = df['TGA_Penalty_Level'] * df['TGA_Penalty_Trend']
-    
-    # 应用：趋势分 * 平滑惩罚系数
-
-    if df['RRPONTSYD'].mean() < 10000:
-        df['RRP_Clean'] = df['RRPONTSYD'] * 1000
-    else:
-        df['RRP_Clean'] = df['RRPONTSYD']
-
-    df['Net_Liquidity'] = df['WALCL'] - df['WTREGEN'] - df['RRP_Clean']
-
-    # 流动性吸收（TGA + RRP）
-    df['Liquidity_Sink'] = df['WTREGEN'] + df['RRP_Clean']
-    df['Liquidity_Sink_Ratio'] = (df['Liquidity_Sink'] / df['WALCL']).clip(lower=0)
-
-    # 流动性吸收惩罚（高吸收 = 低分）
-    def sink_penalty_ratio(r):
-        if r < 0.10: return 1.0
-        elif r < 0.15: return 0.9
-        elif r < 0.20: return 0.8
-        elif r < 0.25: return 0.7
-        else: return 0.6
-    df['Sink_Penalty'] = df['Liquidity_Sink_Ratio'].apply(sink_penalty_ratio)
-    
-    def rolling_percentile(series, window=156, min_periods=20):
-        return series.rolling(window, min_periods=min_periods).apply(
-            lambda s: s.rank(pct=True).iloc[-1],
-            raw=False
-        ) * 100
-
-    def get_score(series):
-        return rolling_percentile(series.diff(13))
-    
-    df['Score_Reserves'] = get_score(df['WRESBAL'])
-    df['Score_NetLiq'] = get_score(df['Net_Liquidity'])
-    df['Score_TGA'] = get_score(-df['WTREGEN'])
-    df['Score_RRP'] = get_score(-df['RRP_Clean']) 
-    
-    base_total = (
-        df['Score_NetLiq'] * 0.45 + df['Score_TGA'] * 0.2 + 
-        df['Score_RRP'] * 0.25 + df['Score_Reserves'] * 0.1
-    )
-    df['Score_NetLiq_Adj'] = df['Score_NetLiq'] * df['Sink_Penalty']
-    df['Total_Score'] = (
-        df['Score_NetLiq_Adj'] * 0.45 +
-        df['Score_TGA'] * 0.2 +
-        df['Score_RRP'] * 0.25 +
-        df['Score_Reserves'] * 0.1
-    ) * df['TGA_Penalty_Total']
+def render_module_a(df_all, frame=None, liquidity=None):
+    df = frame if frame is not None else compute_module_a(df_all, liquidity)
+    if df.empty:
+        st.warning("A模块数据不足（WALCL/TGA/RRP/准备金），请稍后刷新。")
+        return
 
+    version = data_version(df)
     latest = df.iloc[-1]
     prev = df.iloc[-2]
     
@@ -106,12 +28,12 @@ def render_module_a(df_all):
         </div>
     """, unsafe_allow_html=True)
     
-    c2.metric("净流动性 (Net Liq)", f"${latest['Net_Liquidity']/1000000:.2f} T", 
-              f"{(latest['Net_Liquidity'] - prev['Net_Liquidity'])/1000:.0f} B (vs上周)", delta_color="normal")
-    c3.metric("Fed 总资产", f"${latest['WALCL']/1000000:.2f} T", 
-              f"{(latest['WALCL'] - prev['WALCL'])/1000:.0f} B (vs上周)", delta_color="normal")
-    c4.metric("逆回购 (RRP)", f"${latest['RRP_Clean']/1000:.0f} B", 
-              f"{(latest['RRP_Clean'] - prev['RRP_Clean'])/1000:.0f} B (vs上周)", delta_color="normal")
+    c2.metric("净流动性 (Net Liq)", f"${latest['Net_Liquidity']/1000:.2f} T", 
+              f"{latest['Net_Liquidity'] - prev['Net_Liquidity']:.0f} B (vs上周)", delta_color="normal")
+    c3.metric("Fed 总资产", f"${latest['WALCL']/1000:.2f} T", 
+              f"{latest['WALCL'] - prev['WALCL']:.0f} B (vs上周)", delta_color="normal")
+    c4.metric("逆回购 (RRP)", f"${latest['RRPONTSYD']:.0f} B", 
+              f"{latest['RRPONTSYD'] - prev['RRPONTSYD']:.0f} B (vs上周)", delta_color="normal")
 
     # 细分得分
     st.markdown("<br>", unsafe_allow_html=True)
@@ -141,13 +63,13 @@ def render_module_a(df_all):
     fig = go.Figure()
     fig.add_trace(go.Scatter(x=df.index, y=df['Total_Score'], name='A模块体系流动性分数', line=dict(color='#09ab3b', width=2), yaxis='y2'))
     fig.add_trace(go.Scatter(
-        x=df.index, y=df['Liquidity_Sink'] / 1000,
+        x=df.index, y=df['Liquidity_Sink'],
         name='流动性吸收 (TGA + RRP, $B)',
         line=dict(color='#6366f1', width=2),
         fill='tozeroy', fillcolor='rgba(99, 102, 241, 0.12)'
     ))
     
-    y_min, y_max = (df['Liquidity_Sink'] / 1000).min() * 0.95, (df['Liquidity_Sink'] / 1000).max() * 1.02
+    y_min, y_max = df['Liquidity_Sink'].min() * 0.95, df['Liquidity_Sink'].max() * 1.02
     fig.update_layout(
         title="A模块得分 vs 流动性吸收 (TGA + RRP)",
         height=500, paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)', font=dict(color='black'),
@@ -155,15 +77,14 @@ def render_module_a(df_all):
         yaxis2=dict(title='Score (0-100)', overlaying='y', side='right', range=[0, 100], showgrid=True, gridcolor='#e0e0e0'),
         hovermode="x unified", legend=dict(orientation="h", y=1.1, x=0)
     )
-    st.plotly_chart(fig, use_container_width=True)
+    show_chart(fig, use_container_width=True)
 
     
     # TGA + RRP 曲线
     col_tga, col_rrp = st.columns(2)
     with col_tga:
         # 1. 计算当前 TGA 余额（Billion）及 匹配惩罚系数
-        tga_latest_val = df['WTREGEN'].iloc[-1]
-        tga_b = tga_latest_val / 1000 if tga_latest_val > 10000 else tga_latest_val
+        tga_b = df['WTREGEN'].iloc[-1]
         
         # 匹配显示逻辑
         if tga_b < 800:
@@ -175,65 +96,73 @@ def render_module_a(df_all):
         else:
             p_text, p_color = "0.5x (极端惩罚)", "#ff2b2b"
 
-        # 2. 绘图逻辑
-        fig_tga = go.Figure()
-        fig_tga.add_trace(go.Scatter(
-            x=df.index, y=df['WTREGEN']/1000, name='TGA 余额 ($B)', 
-            line=dict(color='#d97706', width=2), 
-            fill='tozeroy', fillcolor='rgba(217, 119, 6, 0.1)'
-        ))
-        fig_tga.add_hline(y=400, line_dash="dash", line_color="#09ab3b", 
-                          annotation_text="利好区 (<400B)", annotation_position="bottom right")
-        fig_tga.add_hline(y=800, line_dash="dash", line_color="#f59e0b", 
-                          annotation_text="警戒区 (800B+ : 0.8x)", annotation_position="top right")
-        fig_tga.add_hline(y=850, line_dash="dot", line_color="#ea580c", 
-                          annotation_text="高压区 (850B+ : 0.6x)", annotation_position="top right")
-        fig_tga.add_hline(y=900, line_dash="solid", line_color="#ff2b2b", 
-                          annotation_text="枯竭区 (900B+ : 0.5x)", annotation_position="top right")
+        # 2. 绘图逻辑（按数据版本缓存）
+        def build_tga():
+            fig_tga = go.Figure()
+            fig_tga.add_trace(go.Scatter(
+                x=df.index, y=df['WTREGEN'], name='TGA 余额 ($B)', 
+                line=dict(color='#d97706', width=2), 
+                fill='tozeroy', fillcolor='rgba(217, 119, 6, 0.1)'
+            ))
+            fig_tga.add_hline(y=400, line_dash="dash", line_color="#09ab3b", 
+                              annotation_text="利好区 (<400B)", annotation_position="bottom right")
+            fig_tga.add_hline(y=800, line_dash="dash", line_color="#f59e0b", 
+                              annotation_text="警戒区 (800B+ : 0.8x)", annotation_position="top right")
+            fig_tga.add_hline(y=850, line_dash="dot", line_color="#ea580c", 
+                              annotation_text="高压区 (850B+ : 0.6x)", annotation_position="top right")
+            fig_tga.add_hline(y=900, line_dash="solid", line_color="#ff2b2b", 
+                              annotation_text="枯竭区 (900B+ : 0.5x)", annotation_position="top right")
 
-        fig_tga.update_layout(
-            height=400, 
-            paper_bgcolor='rgba(0,0,0,0)', 
-            plot_bgcolor='rgba(0,0,0,0)', 
-            font=dict(color='black'),
-            title=f"TGA 余额趋势: 当前 {tga_b:.1f}B | <span style='color:{p_color};'>惩罚系数: {p_text}</span> | 总惩罚: {latest['TGA_Penalty_Total']:.2f}x", 
-            hovermode="x unified", 
-            yaxis_title="Billions ($)"
-        )
-        st.plotly_chart(fig_tga, use_container_width=True)
+            fig_tga.update_layout(
+                height=400, 
+                paper_bgcolor='rgba(0,0,0,0)', 
+                plot_bgcolor='rgba(0,0,0,0)', 
+                font=dict(color='black'),
+                title=f"TGA 余额趋势: 当前 {tga_b:.1f}B | <span style='color:{p_color};'>惩罚系数: {p_text}</span> | 总惩罚: {latest['TGA_Penalty_Total']:.2f}x", 
+                hovermode="x unified", 
+                yaxis_title="Billions ($)"
+            )
+            return fig_tga
+
+        fig_tga = cached_figure('module_a', 'tga', version, build_tga)
+        show_chart(fig_tga, use_container_width=True)
 
     with col_rrp:
-        rrp_series_b = df['RRP_Clean'] / 1000
-        fig_rrp = go.Figure()
-        fig_rrp.add_trace(go.Scatter(
-            x=df.index, y=rrp_series_b, name='RRP 用量 ($B)',
-            line=dict(color='#2563eb', width=2),
-            fill='tozeroy', fillcolor='rgba(37, 99, 235, 0.12)'
-        ))
-        fig_rrp.add_hline(y=300, line_dash="dash", line_color="#10b981", annotation_text="低位 <300B", annotation_position="bottom right")
-        fig_rrp.add_hline(y=1000, line_dash="dash", line_color="#f59e0b", annotation_text="中位 <1000B", annotation_position="top right")
-        fig_rrp.add_hline(y=2000, line_dash="dash", line_color="#ef4444", annotation_text="高位 <2000B", annotation_position="top right")
+        def build_rrp():
+            rrp_series_b = df['RRPONTSYD']
+            fig_rrp = go.Figure()
+            fig_rrp.add_trace(go.Scatter(
+                x=df.index, y=rrp_series_b, name='RRP 用量 ($B)',
+                line=dict(color='#2563eb', width=2),
+                fill='tozeroy', fillcolor='rgba(37, 99, 235, 0.12)'
+            ))
+            fig_rrp.add_hline(y=300, line_dash="dash", line_color="#10b981", annotation_text="低位 <300B", annotation_position="bottom right")
+            fig_rrp.add_hline(y=1000, line_dash="dash", line_color="#f59e0b", annotation_text="中位 <1000B", annotation_position="top right")
+            fig_rrp.add_hline(y=2000, line_dash="dash", line_color="#ef4444", annotation_text="高位 <2000B", annotation_position="top right")
 
-        rrp_b = rrp_series_b.iloc[-1]
-        if rrp_b < 300:
-            rrp_level = "低位"
-        elif rrp_b < 1000:
-            rrp_level = "中位"
-        elif rrp_b < 2000:
-            rrp_level = "高位"
-        else:
-            rrp_level = "极高"
+            rrp_b = rrp_series_b.iloc[-1]
+            if rrp_b < 300:
+                rrp_level = "低位"
+            elif rrp_b < 1000:
+                rrp_level = "中位"
+            elif rrp_b < 2000:
+                rrp_level = "高位"
+            else:
+                rrp_level = "极高"
+
+            fig_rrp.update_layout(
+                height=400,
+                paper_bgcolor='rgba(0,0,0,0)',
+                plot_bgcolor='rgba(0,0,0,0)',
+                font=dict(color='black'),
+                title=f"RRP 用量趋势: 当前 {rrp_b:.0f}B · {rrp_level}",
+                hovermode="x unified",
+                yaxis_title="Billions ($)"
+            )
+            return fig_rrp
 
-        fig_rrp.update_layout(
-            height=400,
-            paper_bgcolor='rgba(0,0,0,0)',
-            plot_bgcolor='rgba(0,0,0,0)',
-            font=dict(color='black'),
-            title=f"RRP 用量趋势: 当前 {rrp_b:.0f}B · {rrp_level}",
-            hovermode="x unified",
-            yaxis_title="Billions ($)"
-        )
-        st.plotly_chart(fig_rrp, use_container_width=True)
+        fig_rrp = cached_figure('module_a', 'rrp', version, build_rrp)
+        show_chart(fig_rrp, use_container_width=True)
 
     # 百科
     st.markdown("<br>", unsafe_allow_html=True)
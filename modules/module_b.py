@@ -1,13 +1,14 @@
 import streamlit as st
 import pandas as pd
-import numpy as np
 import plotly.graph_objects as go
 from datetime import timedelta
+from score_engine import compute_module_b
+from chart_utils import show_chart
 
 # ==========================================
 # 4. 模块 B: 资金价格与走廊摩擦
 # ==========================================
-def render_module_b(df_raw):
+def render_module_b(df_raw, frame=None, derived=None):
     """
     B模块: 资金价格与走廊摩擦 
     
@@ -15,100 +16,16 @@ def render_module_b(df_raw):
     1. 政策制度 (40%): 利率趋势 + 绝对水平判别
     2. 摩擦压力 (60%): 天花板/地板/分裂 + SRF预警
     """
-    df = df_raw.copy()
-    required_cols = ['SOFR', 'IORB', 'RRPONTSYAWARD', 'TGCRRATE', 'RPONTSYD']
-    if df.dropna(subset=required_cols).empty:
+    df = frame if frame is not None else compute_module_b(df_raw, derived)
+    if df.empty:
         st.warning("B模块数据不足（SOFR/IORB/RRP/TGCR/SRF），请稍后刷新。")
         return
-    df = df.dropna(subset=required_cols)
 
     def prev_week_row(frame, days=7):
         target = frame.index[-1] - pd.Timedelta(days=days)
         idx = frame.index.get_indexer([target], method='nearest')[0]
         return frame.iloc[idx]
     
-    # ========================================
-    # Part 1: 政策利率制度评分
-    # ========================================
-    
-    # 1.1 计算13周移动平均 (政策趋势)
-    df['SOFR_MA13'] = df['SOFR'].rolling(65, min_periods=1).mean()  # 13周*5天
-    df['SOFR_Trend'] = df['SOFR_MA13'].diff(21)  # 1个月变化率
-    
-    # 1.2 趋势评分 (下降=宽松=高分)
-    df['Score_Trend'] = df['SOFR_Trend'].rolling(1260, min_periods=1).rank(pct=True, ascending=False) * 100
-    
-    # 1.3 绝对水平制度调整
-    def get_regime_bonus(sofr):
-        """根据利率绝对水平给予奖惩"""
-        if sofr < 1.0:    return 20   # 极度宽松 (零利率时代)
-        elif sofr < 2.5:  return 10   # 宽松
-        elif sofr > 5.0:  return -20  # 极度紧缩
-        elif sofr > 4.0:  return -10  # 紧缩
-        else:             return 0    # 中性 (2.5-4.0%)
-    
-    df['Regime_Bonus'] = df['SOFR'].apply(get_regime_bonus)
-    
-    # 1.4 政策得分 (0-100)
-    df['Score_Policy'] = (df['Score_Trend'] + df['Regime_Bonus']).clip(0, 100)
-    
-    # ========================================
-    # Part 2: 走廊摩擦压力评分
-    # ========================================
-    
-    # 2.1 走廊宽度 (用于相对归一)
-    df['Corridor_Width'] = (df['IORB'] - df['RRPONTSYAWARD']).abs().clip(lower=0.05)
-
-    # 2.2 摩擦因子1: SOFR-IORB (天花板穿透)
-    df['F1_Spread'] = df['SOFR'] - df['IORB']
-    df['F1_Ratio'] = df['F1_Spread'].clip(lower=0) / df['Corridor_Width']
-
-    # 2.3 摩擦因子2: SOFR-RRP (地板偏离)
-    df['F2_Spread'] = df['SOFR'] - df['RRPONTSYAWARD']
-    df['F2_Ratio'] = df['F2_Spread'].abs() / df['Corridor_Width']
-
-    # 2.4 摩擦因子3: TGCR-SOFR (回购市场分裂)
-    df['F3_Spread'] = df['TGCRRATE'] - df['SOFR']
-    df['F3_Ratio'] = df['F3_Spread'].abs() / df['Corridor_Width']
-
-    def ratio_to_score(series, max_ratio_series):
-        denom = max_ratio_series.replace(0, np.nan).ffill().fillna(0.5)
-        scaled = (series / denom).clip(lower=0, upper=1)
-        return (1 - scaled**1.6) * 100
-
-    # 高敏：滚动 180 天 85% 分位作为动态上限
-    df['F1_Max'] = df['F1_Ratio'].rolling(180, min_periods=60).quantile(0.85)
-    df['F2_Max'] = df['F2_Ratio'].rolling(180, min_periods=60).quantile(0.85)
-    df['F3_Max'] = df['F3_Ratio'].rolling(180, min_periods=60).quantile(0.85)
-
-    df['Score_F1'] = ratio_to_score(df['F1_Ratio'], df['F1_Max'])
-    df['Score_F2'] = ratio_to_score(df['F2_Ratio'], df['F2_Max'])
-    df['Score_F3'] = ratio_to_score(df['F3_Ratio'], df['F3_Max'])
-
-    # 2.5 SRF 连续惩罚 (平滑，不跳变，中心点 5B)
-    df['SRF_Penalty_Base'] = 100 / (1 + np.exp(-0.6 * (df['RPONTSYD'] - 5)))
-    df['SRF_Accel'] = df['RPONTSYD'].diff(3).clip(lower=0)
-    df['SRF_Penalty'] = (df['SRF_Penalty_Base'] + (df['SRF_Accel'] / 20).clip(0, 1) * 35).clip(0, 100)
-    df['Score_SRF'] = 100 - df['SRF_Penalty']
-
-    # 2.6 动态权重（SRF 不主宰）
-    df['SRF_Weight'] = 0.10 + 0.15 * (df['SRF_Penalty'] / 100)
-    residual = 1 - df['SRF_Weight']
-    df['Score_Friction'] = (
-        df['Score_F1'] * residual * 0.4 +
-        df['Score_F2'] * residual * 0.3 +
-        df['Score_F3'] * residual * 0.3 +
-        df['Score_SRF'] * df['SRF_Weight']
-    )
-    
-    # ========================================
-    # Part 3: B模块综合得分
-    # ========================================
-    df['Total_Score'] = (
-        df['Score_Policy'] * 0.40 +    # 政策趋势 40%
-        df['Score_Friction'] * 0.60    # 摩擦压力 60%
-    )
-    
     # ========================================
     # Part 4: 可视化展示
     # ========================================
@@ -192,7 +109,7 @@ def render_module_b(df_raw):
         hovermode="x unified",
         yaxis=dict(range=[0, 100], title='Score', showgrid=True)
     )
-    st.plotly_chart(fig_score, use_container_width=True)
+    show_chart(fig_score, use_container_width=True)
 
     st.markdown("<br>", unsafe_allow_html=True)
     # --- 图表2: 走廊宽度 ---
@@ -210,7 +127,7 @@ def render_module_b(df_raw):
         hovermode="x unified",
         yaxis=dict(showgrid=True, gridcolor='#f3f4f6')
     )
-    st.plotly_chart(fig_corridor, use_container_width=True)
+    show_chart(fig_corridor, use_container_width=True)
 
     st.markdown("<br>", unsafe_allow_html=True)
     # --- 图表3: SRF 权重 ---
@@ -230,7 +147,7 @@ def render_module_b(df_raw):
         hovermode="x unified",
         yaxis=dict(range=[0, 0.3], tickformat=".0%", showgrid=True, gridcolor='#f3f4f6')
     )
-    st.plotly_chart(fig_srf_w, use_container_width=True)
+    show_chart(fig_srf_w, use_container_width=True)
     
     # --- 图表2: 利率走廊 ---
     fig_corridor = go.Figure()
@@ -259,7 +176,7 @@ def render_module_b(df_raw):
         yaxis=dict(range=[y_min, y_max], title='Rate (%)', showgrid=True),
         legend=dict(orientation="h", y=1.1, x=0)
     )
-    st.plotly_chart(fig_corridor, use_container_width=True)
+    show_chart(fig_corridor, use_container_width=True)
     
     # --- 图表3: 天花板摩擦  ---
     pos_spread = (df_view['F1_Spread'] * 100).clip(lower=0)
@@ -287,7 +204,7 @@ def render_module_b(df_raw):
         hovermode="x unified",
         yaxis=dict(title='Spread (bps)', showgrid=True, zeroline=True)
     )
-    st.plotly_chart(fig_spread, use_container_width=True)
+    show_chart(fig_spread, use_container_width=True)
     
     # --- 图表4: SRF 预警仪表盘 ---
     fig_srf = go.Figure()
@@ -312,7 +229,7 @@ def render_module_b(df_raw):
         hovermode="x unified",
         yaxis=dict(title='Billions ($)', showgrid=True)
     )
-    st.plotly_chart(fig_srf, use_container_width=True)
+    show_chart(fig_srf, use_container_width=True)
     
     # 百科
     st.markdown("<br>", unsafe_allow_html=True)
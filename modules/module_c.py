@@ -3,81 +3,30 @@ import pandas as pd
 import plotly.graph_objects as go
 import plotly.express as px
 from datetime import timedelta
+from score_engine import compute_module_c
+from chart_utils import show_chart, cached_figure
+from shared_store import data_version
 
 # ==========================================
 # 6. 模块 C: 国债曲线与期限结构
 # ==========================================
-def render_module_c(df_raw):
+def render_module_c(df_raw, frame=None, derived=None):
     """
     C模块: 国债曲线与期限结构
     逻辑:
     1. 绝对利率 (Level): 低 = 松 (Risk-On) | 高 = 紧
     2. 期限利差 (Slope): MID_BEST 逻辑 (适度正斜率最好，倒挂或过陡都扣分)
     """
-    df = df_raw.copy()
-    required_cols = ['DGS10', 'DGS2', 'DGS30', 'T10Y2Y', 'T10Y3M']
-    if df.dropna(subset=required_cols).empty:
+    df = frame if frame is not None else compute_module_c(df_raw, derived)
+    if df.empty:
         st.warning("C模块数据不足（国债利率/期限结构），请稍后刷新。")
         return
-    df = df.dropna(subset=required_cols)
 
     def prev_week_row(frame, days=7):
         target = frame.index[-1] - pd.Timedelta(days=days)
         idx = frame.index.get_indexer([target], method='nearest')[0]
         return frame.iloc[idx]
 
-    # --- 1. 因子计算 ---
-    # 1.1 绝对利率得分 (越低越好 -> 宽松)
-    # 使用过去5年(1260天)的分位数排名反转
-    def get_level_score(series):
-        return series.rolling(1260, min_periods=1).rank(pct=True, ascending=False) * 100
-
-    df['Score_10Y'] = get_level_score(df['DGS10'])
-    df['Score_2Y'] = get_level_score(df['DGS2'])
-    df['Score_30Y'] = get_level_score(df['DGS30'])
-
-    # 1.2 曲线斜率得分 (MID_BEST 逻辑)
-    # 目标: 50bps (0.5%), 容忍带: +/- 150bps
-    def get_slope_score(series, target=0.5, tolerance=1.5):
-        # 计算距离目标的绝对偏差
-        deviation = (series - target).abs()
-        # 归一化: 偏差越大，分数越低。
-        # 简单线性衰减模型: Score = 100 - (deviation / tolerance * 80)
-        score = 100 - (deviation / tolerance * 80) 
-        return score.clip(0, 100)
-
-    df['Score_Curve_2s10s'] = get_slope_score(df['T10Y2Y'], target=0.5, tolerance=1.5) # 10Y-2Y
-    df['Score_Curve_3m10s'] = get_slope_score(df['T10Y3M'], target=0.75, tolerance=2.0) # 10Y-3M
-
-    # --- 2. 综合得分 ---
-    # 权重: 曲线形态(利差)通常比绝对水平更能预测衰退/复苏
-    df['Total_Score1'] = (
-        df['Score_Curve_2s10s'] * 0.30 + 
-        df['Score_Curve_3m10s'] * 0.30 +
-        df['Score_10Y'] * 0.20 +
-        df['Score_2Y'] * 0.10 +
-        df['Score_30Y'] * 0.10
-    )
-
-    # 10Y/30Y 双重动量惩罚
-    
-    slope_10 = df['DGS10'].diff(60)
-    slope_30 = df['DGS30'].diff(60)
-    
-    df['Max_Slope'] = pd.concat([slope_10, slope_30], axis=1).max(axis=1)
-    
-    def get_slope_penalty(s):
-        # s = 60天内利率上涨了多少bp
-        if s > 0.50: return 0.2
-        elif s > 0.30: return 0.6 
-        elif s > 0.15: return 0.8
-        else: return 1.0
-
-    df['Penalty_Factor'] = df['Max_Slope'].apply(get_slope_penalty)
-
-    # 最终分 = 基础分(Part 1) * 斜率惩罚系数
-    df['Total_Score'] = df['Total_Score1'] * df['Penalty_Factor']
-
     # --- 3. 页面展示 ---
     latest = df.iloc[-1]
     prev = df.iloc[-2]
@@ -145,53 +94,58 @@ def render_module_c(df_raw):
 
     # 图1: 全期限曲线 (Snapshot)
     with col_chart1:
-        fig_curve = go.Figure()
-        
-        # 1. 定义全期限列表 (X轴)
-        terms_label = ['1M', '3M', '6M', '1Y', '2Y', '3Y', '5Y', '7Y', '10Y', '20Y', '30Y']
-        # 2. 对应的列名
-        terms_col = ['DGS1MO', 'DGS3MO', 'DGS6MO', 'DGS1', 'DGS2', 'DGS3', 'DGS5', 'DGS7', 'DGS10', 'DGS20', 'DGS30']
+        # 曲线快照只依赖数据版本（按版本缓存）
+        def build_curve():
+            fig_curve = go.Figure()
         
-        # 3. 提取当前数据
-        current_rates = [latest.get(col, None) for col in terms_col]
+            # 1. 定义全期限列表 (X轴)
+            terms_label = ['1M', '3M', '6M', '1Y', '2Y', '3Y', '5Y', '7Y', '10Y', '20Y', '30Y']
+            # 2. 对应的列名
+            terms_col = ['DGS1MO', 'DGS3MO', 'DGS6MO', 'DGS1', 'DGS2', 'DGS3', 'DGS5', 'DGS7', 'DGS10', 'DGS20', 'DGS30']
         
-        # 4. 绘制当前曲线
-        fig_curve.add_trace(go.Scatter(
-            x=terms_label, 
-            y=current_rates, 
-            mode='lines+markers', 
-            name='当前曲线 (Now)', 
-            line=dict(color='#0068c9', width=3, shape='spline'), 
-            marker=dict(size=8)
-        ))
+            # 3. 提取当前数据
+            current_rates = [latest.get(col, None) for col in terms_col]
         
-        # 5. 绘制对比曲线 (1个月前)
-        try:
-            ago_idx = df.index.get_loc(latest.name - timedelta(days=30), method='nearest')
-            ago_row = df.iloc[ago_idx]
-            ago_rates = [ago_row.get(col, None) for col in terms_col]
-            
+            # 4. 绘制当前曲线
             fig_curve.add_trace(go.Scatter(
                 x=terms_label, 
-                y=ago_rates, 
+                y=current_rates, 
                 mode='lines+markers', 
-                name='1个月前 (Last Month)', 
-                line=dict(color='#a0a0a0', width=2, dash='dot', shape='spline'),
-                opacity=0.6
+                name='当前曲线 (Now)', 
+                line=dict(color='#0068c9', width=3, shape='spline'), 
+                marker=dict(size=8)
             ))
-        except:
-            pass
+        
+            # 5. 绘制对比曲线 (1个月前)
+            try:
+                ago_idx = df.index.get_loc(latest.name - timedelta(days=30), method='nearest')
+                ago_row = df.iloc[ago_idx]
+                ago_rates = [ago_row.get(col, None) for col in terms_col]
+            
+                fig_curve.add_trace(go.Scatter(
+                    x=terms_label, 
+                    y=ago_rates, 
+                    mode='lines+markers', 
+                    name='1个月前 (Last Month)', 
+                    line=dict(color='#a0a0a0', width=2, dash='dot', shape='spline'),
+                    opacity=0.6
+                ))
+            except:
+                pass
+
+            fig_curve.update_layout(
+                title="🇺🇸 美债全期限收益率曲线 (Full Yield Curve)", 
+                height=350,
+                yaxis_title="Yield (%)", 
+                hovermode="x unified",
+                paper_bgcolor='rgba(0,0,0,0)', 
+                plot_bgcolor='rgba(0,0,0,0)',
+                xaxis=dict(title="Maturity")
+            )
+            return fig_curve
 
-        fig_curve.update_layout(
-            title="🇺🇸 美债全期限收益率曲线 (Full Yield Curve)", 
-            height=350,
-            yaxis_title="Yield (%)", 
-            hovermode="x unified",
-            paper_bgcolor='rgba(0,0,0,0)', 
-            plot_bgcolor='rgba(0,0,0,0)',
-            xaxis=dict(title="Maturity")
-        )
-        st.plotly_chart(fig_curve, use_container_width=True)
+        fig_curve = cached_figure('module_c', 'yield_curve', data_version(df), build_curve)
+        show_chart(fig_curve, use_container_width=True)
 
     # 图2: 10Y-2Y 历史走势 (倒挂监测)
     with col_chart2:
@@ -212,7 +166,7 @@ def render_module_c(df_raw):
         fig_spread.update_layout(title="10Y-2Y 关键利差趋势", height=350,
                                yaxis_title="Spread (%)", hovermode="x unified",
                                paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)')
-        st.plotly_chart(fig_spread, use_container_width=True)
+        show_chart(fig_spread, use_container_width=True)
 
     # [新增] 图3: US Rates 历史走势 (仿 MacroMicro)
     st.markdown("### US Rates: 全期限 利率历史走势")
@@ -241,7 +195,7 @@ def render_module_c(df_raw):
         paper_bgcolor='rgba(0,0,0,0)', 
         plot_bgcolor='rgba(0,0,0,0)'
     )
-    st.plotly_chart(fig_trend, use_container_width=True)
+    show_chart(fig_trend, use_container_width=True)
 
     # 百科
     st.markdown("<br>", unsafe_allow_html=True)
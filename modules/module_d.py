@@ -2,56 +2,29 @@ import streamlit as st
 import pandas as pd
 import plotly.graph_objects as go
 from datetime import timedelta
+from score_engine import compute_module_d
+from chart_utils import show_chart
 
 # ==========================================
 # 7. 模块 D: 实际利率与通胀预期
 # ==========================================
-def render_module_d(df_raw):
+def render_module_d(df_raw, frame=None):
     """
     D模块: 实际利率与通胀预期
     逻辑:
     1. 实际利率 (Real Rates): 名义 - 通胀预期。它是“真实”的资金成本。越低越好。
     2. 通胀预期 (Breakeven): MID_BEST 逻辑 (太高=通胀失控，太低=通缩衰退)
     """
-    df = df_raw.copy()
-    required_cols = ['DFII10', 'DFII5', 'T10YIE']
-    if df.dropna(subset=required_cols).empty:
+    df = frame if frame is not None else compute_module_d(df_raw)
+    if df.empty:
         st.warning("D模块数据不足（实际利率/通胀预期），请稍后刷新。")
         return
-    df = df.dropna(subset=required_cols)
 
     def prev_week_row(frame, days=7):
         target = frame.index[-1] - pd.Timedelta(days=days)
         idx = frame.index.get_indexer([target], method='nearest')[0]
         return frame.iloc[idx]
     
-    # --- 1. 因子计算 ---
-    # 1.1 实际利率得分 (越低越好)
-    # 逻辑: 实际利率飙升是风险资产最大的杀手 (参考2022年)
-    def get_real_rate_score(series):
-        # 同样使用反向排名：值越高，排名越低，分数越低
-        return series.rolling(1260, min_periods=1).rank(pct=True, ascending=False) * 100
-    
-    df['Score_Real_10Y'] = get_real_rate_score(df['DFII10'])
-    df['Score_Real_5Y'] = get_real_rate_score(df['DFII5'])
-
-    # 1.2 通胀预期得分 (MID_BEST 逻辑)
-    # 美联储目标是 2%，市场通常允许在 2.0% - 2.5% 之间
-    # Target: 2.1%, 舒适区间: [1.5%, 2.7%]
-    def get_inflation_score(series, target=2.1, tolerance=0.6):
-        deviation = (series - target).abs()
-        score = 100 - (deviation / tolerance * 80)
-        return score.clip(0, 100)
-    
-    df['Score_Breakeven'] = get_inflation_score(df['T10YIE'], target=2.1, tolerance=0.6)
-
-    # --- 2. 综合得分 ---
-    df['Total_Score'] = (
-        df['Score_Real_10Y'] * 0.40 + 
-        df['Score_Real_5Y'] * 0.30 +
-        df['Score_Breakeven'] * 0.30
-    )
-
     # --- 3. 页面展示 ---
     latest = df.iloc[-1]
     prev = df.iloc[-2]
@@ -105,7 +78,7 @@ def render_module_d(df_raw):
         fig_real.update_layout(title="10Y 实际利率 (资金的真实价格)", height=350,
                              yaxis_title="Real Rate (%)", hovermode="x unified",
                                paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)')
-        st.plotly_chart(fig_real, use_container_width=True)
+        show_chart(fig_real, use_container_width=True)
 
     # 图2: 通胀预期锚定区间 
     with col2:
@@ -120,7 +93,7 @@ def render_module_d(df_raw):
         fig_be.update_layout(title="10Y 通胀预期 (Breakeven)", height=350,
                              yaxis_title="Inflation Exp (%)", hovermode="x unified",
                                paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)')
-        st.plotly_chart(fig_be, use_container_width=True)
+        show_chart(fig_be, use_container_width=True)
 
     # 百科
         st.markdown("<br>", unsafe_allow_html=True)
@@ -1,15 +1,16 @@
 import streamlit as st
 import pandas as pd
 import plotly.graph_objects as go
+from score_engine import compute_module_e
+from chart_utils import show_chart
 
-def render_module_e(df_all):
+def render_module_e(df_all, frame=None):
     """
     E模块: 外部冲击与汇率 (External Shocks & FX)
     """
     # 1. 数据准备
-    df = df_all.copy()
-    required_cols = ['DTWEXBGS', 'DXY', 'DEXJPUS', 'IRSTCI01JPM156N', 'DCOILWTICO', 'DHHNGSP']
-    if df.dropna(subset=required_cols).empty:
+    df = frame if frame is not None else compute_module_e(df_all)
+    if df.empty:
         st.warning("E模块数据不足（外部汇率/能源），请稍后刷新。")
         return
 
@@ -18,48 +19,7 @@ def render_module_e(df_all):
         idx = frame.index.get_indexer([target], method='nearest')[0]
         return frame.iloc[idx]
     
-    df['IRSTCI01JPM156N'] = df['IRSTCI01JPM156N'].fillna(method='ffill')
-    df = df.fillna(method='ffill')
-    df = df.dropna(subset=required_cols)
-
-    # ==========================================
-    # 2. 因子计算 
-    # ==========================================
-    
-    # 美元 (涨=坏)
-    df['Chg_USD'] = df['DTWEXBGS'].pct_change(63) 
-    df['Score_USD'] = (1 - df['Chg_USD'].rolling(1260, min_periods=1).rank(pct=True)) * 100
-
-    df['Chg_DXY'] = df['DXY'].pct_change(63)
-    df['Score_DXY'] = (1 - df['Chg_DXY'].rolling(1260, min_periods=1).rank(pct=True)) * 100
-    
-
-    # 日元 (USD/JPY 跌 = 坏)
-    df['Yen_Appreciation'] = -1 * df['DEXJPUS'].pct_change(63)
-    df['Score_Yen_FX'] = (1 - df['Yen_Appreciation'].rolling(1260, min_periods=1).rank(pct=True)) * 100
-    
-    # 无抵押隔夜拆借利率 (高=坏)
-
-    df['Score_BoJ_Rate'] = (1 - df['IRSTCI01JPM156N'].rolling(1260, min_periods=1).rank(pct=True)) * 100
-    df['Score_Yen_Total'] = df['Score_Yen_FX'] * 0.7 + df['Score_BoJ_Rate'] * 0.3
-
-    df['Chg_Oil'] = df['DCOILWTICO'].pct_change(63)
-    df['Score_Oil'] = (1 - df['Chg_Oil'].rolling(1260, min_periods=1).rank(pct=True)) * 100
-    
-    df['Chg_Gas'] = df['DHHNGSP'].pct_change(63)
-    df['Score_Gas'] = (1 - df['Chg_Gas'].rolling(1260, min_periods=1).rank(pct=True)) * 100
-    
-    df['Score_Energy'] = df['Score_Oil'] * 0.5 + df['Score_Gas'] * 0.5
-
-    # 3. 综合得分
-    df['Total_Score'] = (
-        df['Score_USD'] * 0.2 +
-        df['Score_DXY'] * 0.2 +
-        df['Score_Yen_Total'] * 0.3 +
-        df['Score_Energy'] * 0.3
-    )
-
-    # 4. 展示
+    # 2. 展示
     df_view = df[df.index >= '2020-01-01'].copy()
     
     latest = df.iloc[-1]
@@ -100,7 +60,7 @@ def render_module_e(df_all):
         fig_jp.add_trace(go.Scatter(x=df_view.index, y=df_view['DEXJPUS'], name='USD/JPY', line=dict(color='#0068c9', width=2)))
         fig_jp.add_trace(go.Scatter(x=df_view.index, y=df_view['IRSTCI01JPM156N'], name='BoJ Rate', line=dict(color='#ff2b2b', width=2, dash='dot'), yaxis='y2'))
         fig_jp.update_layout(title="日元：汇率 vs 日本无抵押隔夜拆借利率", height=350, yaxis2=dict(overlaying='y', side='right'), hovermode="x unified")
-        st.plotly_chart(fig_jp, use_container_width=True)
+        show_chart(fig_jp, use_container_width=True)
     
     with col2:
         fig_usd = go.Figure()
@@ -111,7 +71,7 @@ def render_module_e(df_all):
         fig_usd.update_layout(height=350, title="美元指数", 
                               yaxis=dict(title='DXY Index'), yaxis2=dict(title='Broad Index', overlaying='y', side='right', showgrid=False),
                               hovermode="x unified", legend=dict(orientation="h", y=1.1), paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)')
-        st.plotly_chart(fig_usd, use_container_width=True)
+        show_chart(fig_usd, use_container_width=True)
 
     
     st.markdown("<br>", unsafe_allow_html=True) 
@@ -130,7 +90,7 @@ def render_module_e(df_all):
         margin=dict(l=0, r=0, t=30, b=0) 
     )
     
-    st.plotly_chart(fig_sc, use_container_width=True)
+    show_chart(fig_sc, use_container_width=True)
 
     #百科
     st.markdown("<br>", unsafe_allow_html=True)
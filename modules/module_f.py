@@ -1,46 +1,23 @@
 import streamlit as st
 import pandas as pd
 import plotly.graph_objects as go
+from score_engine import compute_module_f
+from chart_utils import show_chart
 
 # ==========================================
 # 模块 F: 信用压力 (Credit Stress)
 # ==========================================
-def render_module_f(df_all):
-    df = df_all.copy()
-    required_cols = ['BAMLH0A0HYM2', 'BAA10Y']
-    if df.dropna(subset=required_cols).empty:
+def render_module_f(df_all, frame=None):
+    df = frame if frame is not None else compute_module_f(df_all)
+    if df.empty:
         st.warning("F模块数据不足（HY/BAA利差），请稍后刷新。")
         return
-    df = df.dropna(subset=required_cols)
 
     def prev_week_row(frame, days=7):
         target = frame.index[-1] - pd.Timedelta(days=days)
         idx = frame.index.get_indexer([target], method='nearest')[0]
         return frame.iloc[idx]
 
-    def rolling_percentile(series, window=756, min_periods=30):
-        return series.rolling(window, min_periods=min_periods).apply(
-            lambda s: s.rank(pct=True).iloc[-1],
-            raw=False
-        ) * 100
-
-    def bounded_score(series):
-        return series.clip(lower=0, upper=100)
-
-    # 高收益利差 (高=坏) + BAA10Y(企业利差，作为稳态参考)
-    df['HY_Spread'] = df['BAMLH0A0HYM2']
-    df['BAA10Y'] = df['BAA10Y']
-
-    df['Score_HY_Level'] = 100 - rolling_percentile(df['HY_Spread'])
-    df['Score_HY_Trend'] = rolling_percentile(-df['HY_Spread'].diff(13))
-    df['Score_BAA_Level'] = 100 - rolling_percentile(df['BAA10Y'])
-
-    df['Total_Score'] = bounded_score(
-        df['Score_HY_Level'] * 0.5 +
-        df['Score_HY_Trend'] * 0.3 +
-        df['Score_BAA_Level'] * 0.2
-    )
-
     df_view = df[df.index >= '2020-01-01'].copy()
     latest = df.iloc[-1]
     prev_week = prev_week_row(df)
@@ -90,7 +67,7 @@ def render_module_f(df_all):
         plot_bgcolor='rgba(0,0,0,0)',
         hovermode="x unified"
     )
-    st.plotly_chart(fig, use_container_width=True)
+    show_chart(fig, use_container_width=True)
 
     fig_trend = go.Figure()
     fig_trend.add_trace(go.Bar(
@@ -109,7 +86,7 @@ def render_module_f(df_all):
         plot_bgcolor='rgba(0,0,0,0)',
         hovermode="x unified"
     )
-    st.plotly_chart(fig_trend, use_container_width=True)
+    show_chart(fig_trend, use_container_width=True)
 
     fig_baa = go.Figure()
     fig_baa.add_trace(go.Scatter(x=df_view.index, y=df_view['BAA10Y'], name='BAA-10Y', line=dict(color='#2563eb', width=2)))
@@ -122,7 +99,7 @@ def render_module_f(df_all):
         plot_bgcolor='rgba(0,0,0,0)',
         hovermode="x unified"
     )
-    st.plotly_chart(fig_baa, use_container_width=True)
+    show_chart(fig_baa, use_container_width=True)
 
     st.markdown("<br>", unsafe_allow_html=True)
     with st.expander("📚 F模块：因子专业定义与量化逻辑 (点击展开)", expanded=False):
@@ -2,54 +2,24 @@ import streamlit as st
 import pandas as pd
 import plotly.graph_objects as go
 import numpy as np
+from score_engine import compute_module_g
+from chart_utils import show_chart
 
 # ==========================================
 # 模块 G: 风险偏好 (Risk Appetite)
 # ==========================================
-def render_module_g(df_all):
-    df = df_all.copy()
+def render_module_g(df_all, frame=None, derived=None):
     # 组合 Yahoo + FRED（优先 Yahoo，缺失处用 FRED 补）
-    vix_yh = df['VIX_YH'] if 'VIX_YH' in df.columns else None
-    vix_fd = df['VIXCLS'] if 'VIXCLS' in df.columns else None
-    vxv_yh = df['VXV_YH'] if 'VXV_YH' in df.columns else None
-    vxv_fd = df['VXVCLS'] if 'VXVCLS' in df.columns else None
-    df['VIX'] = vix_yh.combine_first(vix_fd) if vix_yh is not None else vix_fd
-    df['VXV'] = vxv_yh.combine_first(vxv_fd) if vxv_yh is not None else vxv_fd
-
-    required_cols = ['SP500', 'VIX', 'VXV']
-    if df.dropna(subset=required_cols).empty:
+    df = frame if frame is not None else compute_module_g(df_all, derived)
+    if df.empty:
         st.warning("G模块数据不足（VIX/VXV/SPX），Yahoo 可能未返回数据，已尝试回退 FRED。请稍后刷新。")
         return
-    df = df.dropna(subset=required_cols)
 
     def prev_week_row(frame, days=7):
         target = frame.index[-1] - pd.Timedelta(days=days)
         idx = frame.index.get_indexer([target], method='nearest')[0]
         return frame.iloc[idx]
 
-    def rolling_percentile(series, window=756, min_periods=30):
-        return series.rolling(window, min_periods=min_periods).apply(
-            lambda s: s.rank(pct=True).iloc[-1],
-            raw=False
-        ) * 100
-
-    def bounded_score(series):
-        score = series.clip(lower=0, upper=100)
-        return score
-
-    # 已合并 VIX/VXV
-    df['VIX_VXV'] = df['VIX'] / df['VXV']
-    df['SPX'] = df['SP500']
-
-    df['Score_VIX'] = bounded_score(100 - rolling_percentile(df['VIX']))
-    df['Score_Term'] = bounded_score(100 - rolling_percentile(df['VIX_VXV']))
-    df['Score_Mom'] = bounded_score(rolling_percentile(df['SPX'].diff(65)))
-
-    df['Total_Score'] = bounded_score(
-        df['Score_Term'] * 0.4 +
-        df['Score_VIX'] * 0.3 +
-        df['Score_Mom'] * 0.3
-    )
     df[['Score_VIX','Score_Term','Score_Mom','Total_Score']] = df[['Score_VIX','Score_Term','Score_Mom','Total_Score']].fillna(50.0)
 
     df_view = df[df.index >= '2020-01-01'].copy()
@@ -94,7 +64,7 @@ def render_module_g(df_all):
         yaxis=dict(title='VIX'),
         yaxis2=dict(title='VIX/VXV', overlaying='y', side='right')
     )
-    st.plotly_chart(fig, use_container_width=True)
+    show_chart(fig, use_container_width=True)
 
     fig_mom = go.Figure()
     fig_mom.add_trace(go.Scatter(x=df_view.index, y=df_view['SPX'], name='SPX', line=dict(color='#10b981', width=2)))
@@ -111,7 +81,7 @@ def render_module_g(df_all):
         yaxis=dict(title='SPX'),
         yaxis2=dict(title='动量', overlaying='y', side='right', showgrid=False)
     )
-    st.plotly_chart(fig_mom, use_container_width=True)
+    show_chart(fig_mom, use_container_width=True)
 
     st.markdown("<br>", unsafe_allow_html=True)
     with st.expander("📚 G模块：因子专业定义与量化逻辑 (点击展开)", expanded=False):
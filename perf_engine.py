@@ -0,0 +1,414 @@
+# perf_engine.py
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+# ==========================================
+# 回测稳健性：平稳区块自助法 (Stationary Block Bootstrap)
+# ==========================================
+# compute_perf_metrics 只给出单条历史路径的点估计。这里对回测结果的逐日行
+# (资产收益, 执行仓位, 成本) 按同一组区块下标整体重抽样（仓位由当日宏观分决定）：
+# 区块内保持“宏观分 → 仓位 → 收益”的对应关系与短期自相关，区块长度服从几何分布 (Politis-Romano)。
+# 区块衔接处仓位会跳变：该行按 |仓位变化| × 本次回测的平均单边成本重新计交易成本，避免置信区间偏乐观。
+# 全部路径以 (路径 × 交易日) 的二维数组一次计算 仓位 → 收益，指标交给 batch_perf_metrics (路径为列)，
+# 按路径分块控制内存，最后给出每个指标的分位数置信区间。
+# 平均区块长度取 1 时退化为 iid 蒙特卡洛重抽样。
+
+BOOTSTRAP_PATHS = 1000
+BOOTSTRAP_BLOCK = 21          # 平均区块长度 (交易日)，约一个月
+BOOTSTRAP_CI = (0.05, 0.95)
+_PATH_CHUNK = 256
+
+METRIC_LABELS = {
+    'cagr': 'CAGR',
+    'mdd': 'MDD',
+    'sharpe_m': 'Sharpe(月)',
+    'sortino_m': 'Sortino(月)',
+    'calmar': 'Calmar',
+    'cvar5': 'CVaR 5%(日)',
+    'downside_capture': 'Down Capture',
+    'bench_cagr': '基准 CAGR',
+    'bench_mdd': '基准 MDD',
+    'excess_cagr': '超额 CAGR',
+}
+
+
+def stationary_bootstrap_indices(n, n_paths, mean_block=BOOTSTRAP_BLOCK, rng=None):
+    """
+    平稳区块自助法下标矩阵 (n_paths × n)：每一步以 1/mean_block 的概率另起新区块
+    (起点均匀随机)，否则沿用上一日下标 +1 (越界回绕到序列开头)。
+    """
+    rng = np.random.default_rng(rng)
+    p = 1.0 / max(float(mean_block), 1.0)
+    new_block = rng.random((n_paths, n)) < p
+    new_block[:, 0] = True
+    starts = rng.integers(0, n, size=(n_paths, n))
+    t = np.arange(n)
+    # 每个位置所在区块的起始列 → 起点 + 区块内偏移
+    block_t = np.maximum.accumulate(np.where(new_block, t, 0), axis=1)
+    block_start = np.take_along_axis(starts, block_t, axis=1)
+    return (block_start + (t - block_t)) % n
+
+
+def _month_segments(index):
+    """按自然月切分的起点位置 (与 resample('M') 分组一致)"""
+    month = index.year * 12 + index.month
+    return np.flatnonzero(np.r_[True, month[1:] != month[:-1]])
+
+
+def _masked_mean(values, mask):
+    cnt = mask.sum(axis=1)
+    total = np.where(mask, values, 0.0).sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(cnt > 0, total / cnt, np.nan)
+
+
+def _score_paths(strat, bench, index, start, risk_free_rate):
+    """
+    路径 × 交易日 的策略 / 基准日收益 → 每条路径的指标。
+    策略与基准路径并排作为列交给 batch_perf_metrics（口径与 compute_perf_metrics 一致），
+    基准列只取 CAGR / MDD。
+    """
+    strat = np.atleast_2d(strat)
+    bench = np.atleast_2d(bench)
+    m = strat.shape[0]
+    ret = pd.DataFrame(np.vstack([strat, bench]).T, index=index)
+    metrics = batch_perf_metrics(
+        ret, pd.DataFrame(np.vstack([bench, bench]).T, index=index),
+        risk_free_rate=risk_free_rate, start=dict.fromkeys(ret.columns, start),
+    )
+    out = metrics.iloc[:m][[key for key in METRIC_LABELS if key in PERF_METRIC_KEYS]].reset_index(drop=True)
+    out['bench_cagr'] = metrics['cagr'].to_numpy()[m:]
+    out['bench_mdd'] = metrics['mdd'].to_numpy()[m:]
+    out['excess_cagr'] = out['cagr'] - out['bench_cagr']
+    return out
+
+
+def _strategy_inputs(df):
+    """
+    从 run_strategy_logic 输出中取出逐日 (资产收益, 执行仓位, 成本)；仓位已由当日宏观分决定。
+    成本拆成 交易成本 (手续费 + 滑点，随换手) 与 其余成本 (资金成本)。
+    """
+    base = df[['Pct_Change', 'Position', 'Total_Cost']].copy()
+    trade = pd.Series(0.0, index=df.index)
+    for col in ('Tx_Cost', 'Slippage_Cost'):
+        if col in df.columns:
+            trade = trade + df[col].fillna(0.0)
+    base['Trade_Cost'] = trade
+    base = base.dropna(subset=['Pct_Change'])
+    base['Position'] = base['Position'].fillna(0.0)
+    base['Total_Cost'] = base['Total_Cost'].fillna(0.0)
+    return base
+
+
+def _trade_cost_rate(df):
+    """本次回测的平均单边交易成本：(手续费 + 滑点) / 换手；无换手记录时为 0"""
+    if 'Turnover' not in df.columns:
+        return 0.0
+    turnover = df['Turnover'].fillna(0.0).sum()
+    trade = sum(df[col].fillna(0.0).sum() for col in ('Tx_Cost', 'Slippage_Cost') if col in df.columns)
+    return float(trade / turnover) if turnover > 0 else 0.0
+
+
+def _resampled_costs(idx, position, cost, trade_cost, rate):
+    """
+    重抽样路径的成本：区块内沿用原行成本；区块起点（以及路径首日，视为由空仓建仓）仓位跳变，
+    原行的交易成本换成 |仓位变化| × 单边成本，资金成本不变。
+    """
+    pos = position[idx]
+    jump = np.ones(idx.shape, dtype=bool)
+    jump[:, 1:] = idx[:, 1:] != idx[:, :-1] + 1
+    prev = np.zeros_like(pos)
+    prev[:, 1:] = pos[:, :-1]
+    rebuilt = cost[idx] - trade_cost[idx] + np.abs(pos - prev) * rate
+    return np.where(jump, rebuilt, cost[idx])
+
+
+def _position_returns(asset_ret, position, cost, risk_free_daily):
+    """仓位 → 策略日收益（与 run_strategy_logic 的净收益口径一致），支持二维输入"""
+    return position * asset_ret + (1.0 - np.abs(position)) * risk_free_daily - cost
+
+
+def bootstrap_strategy(df, risk_free_rate=0.04, n_paths=BOOTSTRAP_PATHS, mean_block=BOOTSTRAP_BLOCK,
+                       ci=BOOTSTRAP_CI, seed=0):
+    """
+    对 run_strategy_logic 的结果做平稳区块自助法重抽样。
+    返回 dict:
+        summary : 指标 × (历史, 均值, 下限, 中位数, 上限)；attrs['beat_bench_prob'] 为超额 CAGR > 0 的路径占比
+        samples : 每条路径的指标 DataFrame (n_paths 行)
+    """
+    base = _strategy_inputs(df)
+    n = len(base)
+    if n < 2 * max(int(mean_block), 1):
+        return {'summary': pd.DataFrame(), 'samples': pd.DataFrame()}
+
+    risk_free_daily = float(risk_free_rate) / 252
+    asset_ret = base['Pct_Change'].to_numpy(dtype=np.float64)
+    position = base['Position'].to_numpy(dtype=np.float64)
+    cost = base['Total_Cost'].to_numpy(dtype=np.float64)
+    trade_cost = base['Trade_Cost'].to_numpy(dtype=np.float64)
+    rate = _trade_cost_rate(df)
+    # 年数与 compute_perf_metrics 相同：按原始回测区间的自然日计算（净值起点为回测首日）
+    start = df.index[0]
+
+    hist = _score_paths(
+        _position_returns(asset_ret, position, cost, risk_free_daily), asset_ret,
+        base.index, start, risk_free_rate
+    )
+
+    rng = np.random.default_rng(seed)
+    chunks = []
+    for lo in range(0, int(n_paths), _PATH_CHUNK):
+        m = min(_PATH_CHUNK, int(n_paths) - lo)
+        idx = stationary_bootstrap_indices(n, m, mean_block, rng)
+        # 同一组下标同时抽取收益 / 仓位 / 成本，保持区块内对应关系；区块衔接处的换仓另计交易成本
+        r = asset_ret[idx]
+        strat = _position_returns(r, position[idx], _resampled_costs(idx, position, cost, trade_cost, rate), risk_free_daily)
+        chunks.append(_score_paths(strat, r, base.index, start, risk_free_rate))
+    samples = pd.concat(chunks, ignore_index=True)
+
+    lo_q, hi_q = ci
+    rows = []
+    for key, label in METRIC_LABELS.items():
+        s = samples[key].dropna()
+        rows.append({
+            '指标': label,
+            '历史': float(hist[key].iloc[0]),
+            '均值': s.mean() if len(s) else np.nan,
+            f'P{lo_q * 100:.0f}': s.quantile(lo_q) if len(s) else np.nan,
+            '中位数': s.median() if len(s) else np.nan,
+            f'P{hi_q * 100:.0f}': s.quantile(hi_q) if len(s) else np.nan,
+        })
+    summary = pd.DataFrame(rows).set_index('指标')
+    summary.attrs['beat_bench_prob'] = float((samples['excess_cagr'] > 0).mean())
+    summary.attrs['paths'] = int(n_paths)
+    summary.attrs['mean_block'] = float(mean_block)
+    return {'summary': summary, 'samples': samples}
+
+
+# ==========================================
+# 滚动绩效：整段历史一次计算
+# ==========================================
+# 子区间表现不必逐段重跑回测：对净值 / 日收益做滚动 波动率 / Sharpe / Sortino / 命中率，
+# 滚动最大回撤对每个窗口长度只物化一次滑窗，在块内做前缀最大值；
+# 水下深度与水下天数由前缀最大值与“最近一次新高位置”的前向累计得到。
+
+ROLLING_WINDOWS = {'1Y': 252, '3Y': 756}
+
+
+def rolling_max_drawdown(nav, window, min_periods=None, chunk_rows=256):
+    """截至每日的最近 window 个交易日内最大回撤 (≤ 0)；有效点不足 min_periods 为 NaN"""
+    nav = np.asarray(nav, dtype=np.float64)
+    n = len(nav)
+    min_periods = window if min_periods is None else int(min_periods)
+    out = np.full(n, np.nan)
+    if n == 0:
+        return out
+    padded = np.concatenate([np.full(window - 1, np.nan), nav])
+    windows = sliding_window_view(padded, window)
+    for start in range(0, n, chunk_rows):
+        win = windows[start:start + chunk_rows]
+        peak = np.fmax.accumulate(win, axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            dd = np.fmin.reduce(win / peak - 1, axis=1)
+        enough = (~np.isnan(win)).sum(axis=1) >= min_periods
+        out[start:start + len(win)] = np.where(enough, dd, np.nan)
+    return out
+
+
+def underwater(nav):
+    """水下深度 (相对历史新高的回撤) 与水下天数 (距最近一次新高的自然日)"""
+    nav = nav.dropna()
+    vals = nav.to_numpy(dtype=np.float64)
+    peak = np.maximum.accumulate(vals)
+    pos = np.arange(len(vals))
+    last_peak = np.maximum.accumulate(np.where(vals >= peak, pos, 0))
+    stamps = nav.index.values
+    days = (stamps - stamps[last_peak]).astype('timedelta64[D]').astype(np.int64)
+    return pd.DataFrame({'Drawdown': vals / peak - 1, 'Underwater_Days': days}, index=nav.index)
+
+
+def rolling_performance(ret, position=None, windows=None, risk_free_rate=0.04):
+    """
+    滚动绩效表 (index 与 ret 一致)，每个窗口一组列：
+    Vol_* (年化) / Sharpe_* / Sortino_* (日度年化) / MDD_* / HitRate_* (持仓日中收益为正的占比)，
+    另附整段的 Drawdown 与 Underwater_Days。
+    """
+    windows = windows or ROLLING_WINDOWS
+    ret = ret.astype(np.float64)
+    excess = ret - float(risk_free_rate) / 252
+    nav = (1 + ret.fillna(0.0)).cumprod()
+    active = ret.notna() if position is None else (position.reindex(ret.index).fillna(0.0).abs() > 1e-9) & ret.notna()
+    hits = (ret > 0) & active
+
+    cols = {}
+    for label, w in windows.items():
+        roll = excess.rolling(w, min_periods=w)
+        mean, std = roll.mean(), roll.std()
+        downside = np.sqrt((excess.clip(upper=0.0) ** 2).rolling(w, min_periods=w).mean())
+        cols[f'Vol_{label}'] = ret.rolling(w, min_periods=w).std() * np.sqrt(252)
+        cols[f'Sharpe_{label}'] = (mean / std.where(std > 0)) * np.sqrt(252)
+        cols[f'Sortino_{label}'] = (mean / downside.where(downside > 0)) * np.sqrt(252)
+        cols[f'MDD_{label}'] = pd.Series(rolling_max_drawdown(nav, w), index=ret.index)
+        n_active = active.astype(float).rolling(w, min_periods=w).sum()
+        cols[f'HitRate_{label}'] = hits.astype(float).rolling(w, min_periods=w).sum() / n_active.where(n_active > 0)
+    out = pd.DataFrame(cols, index=ret.index)
+    return out.join(underwater(nav))
+
+
+# ==========================================
+# 批量绩效指标：日期 × 运行 的收益矩阵一次求出
+# ==========================================
+# 参数扫描 / 多组回测不必逐个调用 compute_perf_metrics：各列共用日期轴，
+# 净值、回撤、恢复天数、月度 Sharpe / Sortino、VaR / CVaR、下行捕获与成本合计
+# 都以按列的 NumPy 归约求出，口径与 compute_perf_metrics 逐列一致
+# （列内缺失收益不计入 VaR / 月度统计，净值按 0 收益延续）。
+
+PERF_METRIC_KEYS = [
+    'cagr', 'mdd', 'sharpe_m', 'sortino_m', 'calmar', 'cvar5', 'recovery_days', 'downside_capture',
+    'avg_turnover', 'fee_cost', 'slippage_cost', 'funding_cost', 'total_cost',
+]
+
+PERF_COST_COLUMNS = {
+    'fee_cost': 'Tx_Cost',
+    'slippage_cost': 'Slippage_Cost',
+    'funding_cost': 'Funding_Cost',
+}
+
+
+def _column_sum(matrix, n_runs):
+    if matrix is None:
+        return np.full(n_runs, np.nan)
+    return np.nansum(np.asarray(matrix, dtype=np.float64), axis=0)
+
+
+def _recovery_days(nav, peak, dd, index):
+    """最大回撤谷底之后首次回到此前高点所用的自然日；未恢复为 NaN"""
+    n, m = nav.shape
+    trough = dd.argmin(axis=0)
+    peak_level = peak[trough, np.arange(m)]
+    after = np.arange(n)[:, None] >= trough[None, :]
+    recovered = after & (nav >= peak_level[None, :])
+    hit = recovered.any(axis=0)
+    first = recovered.argmax(axis=0)
+    stamps = index.values
+    days = (stamps[first] - stamps[trough]).astype('timedelta64[D]').astype(np.float64)
+    return np.where(hit, days, np.nan)
+
+
+def batch_perf_metrics(ret, bench=None, costs=None, risk_free_rate=0.04, start=None):
+    """
+    批量版 compute_perf_metrics。
+    ret   : DataFrame，日期 × 运行 的策略日收益 (Strategy_Ret)；各列区间可以不同，区间外为 NaN
+    bench : 基准日收益 (Pct_Change)，Series（各列共用）或与 ret 同形的 DataFrame
+    costs : {'Turnover' / 'Tx_Cost' / 'Slippage_Cost' / 'Funding_Cost' / 'Total_Cost': 日期 × 运行}，可选
+    start : 各列净值起点日期 {运行: 日期}（可早于 ret 的首行），可选；缺省为该列首个有效收益日
+    返回 运行 × 指标 的 DataFrame，列名与 compute_perf_metrics 的键相同。
+    """
+    runs = ret.columns
+    index = ret.index
+    r = ret.to_numpy(dtype=np.float64)
+    n, m = r.shape
+    valid = ~np.isnan(r)
+    if n == 0:
+        return pd.DataFrame(index=runs, columns=PERF_METRIC_KEYS, dtype=float)
+
+    r0 = np.where(valid, r, 0.0)
+    nav = np.cumprod(1.0 + r0, axis=0)
+    # 各列自身的起止日期（参数扫描 / 多资产拼接时各列区间可能不同）
+    first = valid.argmax(axis=0)
+    last = n - 1 - valid[::-1].argmax(axis=0)
+    stamps = index.values
+    base = stamps[first]
+    if start is not None:
+        given = pd.DatetimeIndex(pd.Series(start).reindex(runs)).values
+        base = np.where(np.isnat(given), base, np.minimum(given, base))
+    span_days = (stamps[last] - base).astype('timedelta64[D]').astype(np.float64)
+    years = np.maximum(span_days, 1) / 365.25
+    rows = np.arange(n)[:, None]
+    in_col = (rows >= first[None, :]) & (rows <= last[None, :]) & valid.any(axis=0)[None, :]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cagr = np.where(valid.any(axis=0), nav[-1] ** (1 / years) - 1, np.nan)
+        peak = np.maximum.accumulate(nav, axis=0)
+        dd = nav / peak - 1
+        mdd = dd.min(axis=0)
+        recovery_days = _recovery_days(nav, peak, dd, index)
+
+        # 月度收益：自然月内 (1 + r) 连乘；每列只统计首个到最后一个有数据的月份（与 resample('M') 一致）
+        month_starts = _month_segments(index)
+        monthly = np.multiply.reduceat(1.0 + r0, month_starts, axis=0) - 1
+        has_obs = np.add.reduceat(valid.astype(np.int64), month_starts, axis=0) > 0
+        in_span = (np.maximum.accumulate(has_obs, axis=0) &
+                   np.maximum.accumulate(has_obs[::-1], axis=0)[::-1])
+        excess = (monthly - ((1 + float(risk_free_rate)) ** (1 / 12) - 1)).T
+        in_span = in_span.T
+        mean_ex = _masked_mean(excess, in_span)
+        std_ex = np.sqrt(_masked_mean((excess - mean_ex[:, None]) ** 2, in_span))
+        sharpe = np.where(std_ex > 0, mean_ex / std_ex * np.sqrt(12), np.nan)
+        neg = in_span & (excess < 0)
+        neg_mean = _masked_mean(excess, neg)
+        neg_std = np.sqrt(_masked_mean((excess - neg_mean[:, None]) ** 2, neg))
+        sortino = np.where(neg.any(axis=1) & (neg_std > 0), mean_ex / neg_std * np.sqrt(12), np.nan)
+
+        calmar = np.where(mdd == 0, np.nan, cagr / np.abs(mdd))
+
+        # nanquantile 逐列循环，无缺失时走向量化的 quantile
+        var5 = np.quantile(r, 0.05, axis=0) if valid.all() else np.nanquantile(r, 0.05, axis=0)
+        cvar5 = _masked_mean(r.T, (r <= var5[None, :]).T)
+
+        if bench is None:
+            capture = np.full(m, np.nan)
+        else:
+            if isinstance(bench, pd.DataFrame):
+                b = bench.reindex(index).to_numpy(dtype=np.float64)
+            else:
+                b = np.repeat(pd.Series(bench).reindex(index).to_numpy(dtype=np.float64)[:, None], m, axis=1)
+            down = ((b < 0) & in_col).T
+            bench_down = _masked_mean(b.T, down)
+            capture = np.where(down.any(axis=1) & (bench_down != 0), _masked_mean(r0.T, down) / bench_down, np.nan)
+
+    costs = {} if costs is None else {k: v.reindex(index) for k, v in costs.items()}
+    turnover = costs.get('Turnover')
+    if turnover is None:
+        avg_turnover = np.full(m, np.nan)
+    else:
+        t = turnover.to_numpy(dtype=np.float64).T
+        avg_turnover = _masked_mean(t, ~np.isnan(t))
+    out = {key: _column_sum(costs.get(col), m) for key, col in PERF_COST_COLUMNS.items()}
+    if 'Total_Cost' in costs:
+        total_cost = _column_sum(costs['Total_Cost'], m)
+    else:
+        total_cost = out['fee_cost']
+
+    metrics = pd.DataFrame({
+        'cagr': cagr,
+        'mdd': mdd,
+        'sharpe_m': sharpe,
+        'sortino_m': sortino,
+        'calmar': calmar,
+        'cvar5': cvar5,
+        'recovery_days': recovery_days,
+        'downside_capture': capture,
+        'avg_turnover': avg_turnover,
+        'fee_cost': out['fee_cost'],
+        'slippage_cost': out['slippage_cost'],
+        'funding_cost': out['funding_cost'],
+        'total_cost': total_cost,
+    }, index=runs)
+    return metrics[PERF_METRIC_KEYS]
+
+
+def stack_strategy_runs(runs):
+    """
+    把多次 run_strategy_logic 的结果 {名称: df} 拼成 batch_perf_metrics 的输入：
+    (ret 矩阵, bench, costs, start)；bench 取各次的 Pct_Change 矩阵，start 为各次的净值起点日期。
+    """
+    ret = pd.DataFrame({name: df['Strategy_Ret'] for name, df in runs.items()})
+    bench = pd.DataFrame({name: df['Pct_Change'] for name, df in runs.items()})
+    costs = {}
+    for col in ['Turnover', 'Tx_Cost', 'Slippage_Cost', 'Funding_Cost', 'Total_Cost']:
+        if all(col in df.columns for df in runs.values()):
+            costs[col] = pd.DataFrame({name: df[col] for name, df in runs.items()})
+    start = {name: df.index[0] for name, df in runs.items() if not df.empty}
+    return ret, bench, costs, start
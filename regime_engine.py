@@ -0,0 +1,87 @@
+# regime_engine.py
+import numpy as np
+import pandas as pd
+
+from shared_store import versioned_cache
+
+# ==========================================
+# 宏观四象限 Regime：增长 (INDPRO) × 通胀 (核心 PCE)
+# ==========================================
+# 仪表盘 “Regime 看板” 与回测 “Regime 验证面板” 共用：月频同比 + 滚动 Z 分数，
+# Z >= 0 记为“上行”。月频同比只算一次，多个 Z 窗口在同一次计算里一并求出，结果按数据版本缓存。
+
+REGIME_INPUTS = ['INDPRO', 'PCEPILFE']
+
+# 可选 Z 窗口（月）；默认 60 个月
+REGIME_WINDOWS = (36, 60, 120)
+DEFAULT_REGIME_WINDOW = 60
+
+# 象限编码（与看板热力条配色顺序一致）
+REGIME_LABELS = ['放缓', '复苏', '过热', '滞胀']
+REGIME_DESCRIPTIONS = {
+    '过热': '过热(增长↑通胀↑)',
+    '滞胀': '滞胀(增长↓通胀↑)',
+    '放缓': '放缓(增长↓通胀↓)',
+    '复苏': '复苏(增长↑通胀↓)',
+}
+
+
+def _min_periods(window):
+    # 至少 2 年样本再给 Z 分数，避免序列起点附近的剧烈跳变
+    return max(24, int(window // 2))
+
+
+def regime_min_months(window=DEFAULT_REGIME_WINDOW):
+    """给出首个 Z 分数所需的月频同比样本数"""
+    return _min_periods(window)
+
+
+def regime_yoy(df_all):
+    """月频同比：Growth_YoY (INDPRO) / CorePCE_YoY (PCEPILFE)，单位 %"""
+    if df_all is None or df_all.empty or any(col not in df_all.columns for col in REGIME_INPUTS):
+        return pd.DataFrame(columns=['Growth_YoY', 'CorePCE_YoY'])
+    src = df_all[REGIME_INPUTS].sort_index().ffill().dropna()
+    if src.empty:
+        return pd.DataFrame(columns=['Growth_YoY', 'CorePCE_YoY'])
+    monthly = src.resample('ME').last().ffill()
+    return pd.DataFrame({
+        'Growth_YoY': monthly['INDPRO'].pct_change(12) * 100,
+        'CorePCE_YoY': monthly['PCEPILFE'].pct_change(12) * 100,
+    })
+
+
+def regime_monthly(df_all, windows=REGIME_WINDOWS):
+    """
+    各 Z 窗口的月频 Regime 表 {window: DataFrame}。
+    列：Growth_YoY / CorePCE_YoY / Growth_Z / Infl_Z / Regime / Regime_Code，只保留 Z 分数齐全的月份。
+    """
+    yoy = regime_yoy(df_all)
+    out = {}
+    for window in windows:
+        roll = yoy.rolling(window, min_periods=_min_periods(window))
+        z = (yoy - roll.mean()) / roll.std().replace(0, np.nan)
+        table = yoy.assign(Growth_Z=z['Growth_YoY'], Infl_Z=z['CorePCE_YoY']).dropna(subset=['Growth_Z', 'Infl_Z'])
+        growth_up = table['Growth_Z'].to_numpy() >= 0
+        infl_up = table['Infl_Z'].to_numpy() >= 0
+        code = np.where(growth_up, np.where(infl_up, 2, 1), np.where(infl_up, 3, 0))
+        table['Regime'] = np.asarray(REGIME_LABELS, dtype=object)[code]
+        table['Regime_Code'] = code.astype(float)
+        out[window] = table
+    return out
+
+
+def regime_daily(regimes, index, window=DEFAULT_REGIME_WINDOW, column='Regime'):
+    """把月频 Regime 表前向对齐到日频 index（月末标签，当月内沿用上月末状态）"""
+    table = regimes.get(window)
+    if table is None or table.empty:
+        return pd.Series(index=index, dtype=object if column == 'Regime' else float)
+    return table[column].reindex(index, method='ffill')
+
+
+# ---------- 按数据版本缓存 ----------
+_REGIME_CACHE = versioned_cache('regime')
+
+
+def macro_regimes(df_all, version=None):
+    """全部 Z 窗口的月频 Regime 表；version 非空时进程内缓存"""
+    return _REGIME_CACHE.get(version, lambda: regime_monthly(df_all))
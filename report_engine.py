@@ -0,0 +1,478 @@
+# report_engine.py
+"""
+AI 宏观报告：结构化上下文 → 提示词 → LLM → PDF。
+仪表盘与批量任务共用同一套逻辑；批量任务对每个截止日在截断面板上重算得分（只用当时可见的数据），
+各截止日在进程池中并行处理（面板只随初始化传入一次，CID 字体每个进程只注册一次），
+LLM 结果按提示词哈希落盘缓存，也可用本地桩离线生成。
+
+用法:
+    python report_engine.py --start 2024-01-01 --end 2024-12-31 --freq W-WED --llm stub --out reports
+    python report_engine.py --dates 2024-03-06,2024-09-18 --llm gemini --panel-file panel.pkl
+"""
+import argparse
+import hashlib
+import html
+import io
+import json
+import os
+import re
+import textwrap
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from analog_engine import analog_index, find_analogs, analog_context
+from score_engine import MODULE_WEIGHTS, build_score_cube, compute_module_frames, latest_module_scores, _last_valid
+from shared_store import ingest_panel
+
+REPORT_TITLE = "AI宏观分析报告"
+PDF_FONT = "STSong-Light"
+DEFAULT_CACHE_DIR = "report_cache"
+
+# ==========================================
+# 0. 文本清洗 / PDF 渲染
+# ==========================================
+def clean_text_for_pdf(raw_text):
+    if not raw_text:
+        return ""
+    txt = html.unescape(raw_text)
+    txt = re.sub(r"<[^>]+>", "", txt)
+    txt = txt.replace("\r\n", "\n")
+    return txt
+
+
+def normalize_report_date(raw_text, cutoff_date):
+    if not raw_text:
+        return raw_text
+    lines = [ln.rstrip() for ln in raw_text.splitlines()]
+    kept = []
+    for ln in lines:
+        if re.search(r"(报告日期|发布日期)\s*[:：]", ln):
+            continue
+        kept.append(ln)
+    body = "\n".join(kept).lstrip()
+    header = f"报告日期（数据截止）: {cutoff_date}"
+    if body.startswith(header):
+        return body
+    return f"{header}\n\n{body}"
+
+
+_FONT_READY = False
+
+
+def _ensure_pdf_font():
+    """CID 字体注册开销较大，每个进程只做一次"""
+    global _FONT_READY
+    if not _FONT_READY:
+        from reportlab.pdfbase import pdfmetrics
+        from reportlab.pdfbase.cidfonts import UnicodeCIDFont
+
+        pdfmetrics.registerFont(UnicodeCIDFont(PDF_FONT))
+        _FONT_READY = True
+
+
+def build_pdf_bytes(text, title=REPORT_TITLE):
+    try:
+        from reportlab.pdfgen import canvas
+        from reportlab.lib.pagesizes import A4
+
+        _ensure_pdf_font()
+        buffer = io.BytesIO()
+        c = canvas.Canvas(buffer, pagesize=A4)
+        width, height = A4
+        c.setFont(PDF_FONT, 16)
+        c.drawString(50, height - 50, title)
+        c.setFont(PDF_FONT, 10)
+        y = height - 80
+        for line in text.split("\n"):
+            wrapped = textwrap.wrap(line, width=90) or [""]
+            for wline in wrapped:
+                if y < 50:
+                    c.showPage()
+                    c.setFont(PDF_FONT, 10)
+                    y = height - 50
+                c.drawString(50, y, wline)
+                y -= 14
+        c.save()
+        buffer.seek(0)
+        return buffer.getvalue()
+    except Exception:
+        # 兜底：返回空字节
+        return b""
+
+
+# ---------- 按报告文本哈希缓存 PDF ----------
+PDF_CACHE_SIZE = 8
+_PDF_CACHE = OrderedDict()
+_PDF_LOCK = threading.Lock()
+
+
+def cached_pdf_bytes(raw_text, title=REPORT_TITLE):
+    """清洗 + 排版结果按 (标题, 原文) sha1 缓存，同一份报告只渲染一次"""
+    key = hashlib.sha1(f"{title}\n{raw_text}".encode('utf-8')).hexdigest()
+    with _PDF_LOCK:
+        pdf = _PDF_CACHE.get(key)
+        if pdf is not None:
+            _PDF_CACHE.move_to_end(key)
+            return pdf
+    pdf = build_pdf_bytes(clean_text_for_pdf(raw_text), title=title)
+    if pdf:
+        with _PDF_LOCK:
+            _PDF_CACHE[key] = pdf
+            while len(_PDF_CACHE) > PDF_CACHE_SIZE:
+                _PDF_CACHE.popitem(last=False)
+    return pdf
+
+
+def lazy_pdf(raw_text, title=REPORT_TITLE):
+    """供 st.download_button(data=...) 使用：点击下载时才渲染"""
+    def render():
+        return cached_pdf_bytes(raw_text, title)
+    return render
+
+
+# ==========================================
+# 1. 结构化上下文
+# ==========================================
+def _safe_hist_value(series, days_back):
+    try:
+        target = series.index[-1] - pd.Timedelta(days=days_back)
+        idx = series.index.get_indexer([target], method='nearest')[0]
+        return float(series.iloc[idx])
+    except Exception:
+        return float(series.iloc[-1])
+
+
+def _classify_regime(val):
+    if val < 30: return "Crisis"
+    if val < 45: return "Weak"
+    if val < 60: return "Neutral"
+    return "Strong"
+
+
+def _percentile_rank(series):
+    try:
+        return float(series.rank(pct=True).iloc[-1] * 100)
+    except Exception:
+        return 50.0
+
+
+def module_scores(frames):
+    """各模块最新得分（F/G 缺失时按 50 处理，与仪表盘一致）"""
+    scores = latest_module_scores(frames)
+    return {key: scores[key] for key in MODULE_WEIGHTS}
+
+
+def total_score_history(frames):
+    """综合得分历史：按 B 模块日频索引对齐，口径同 build_score_cube 的 Total"""
+    return build_score_cube(frames, frames['B'].index)['D']['Total'].dropna()
+
+
+def _top_drivers(mod, df_all, frames):
+    df_a, df_c, df_e, df_f, df_g = frames['A'], frames['C'], frames['E'], frames['F'], frames['G']
+    if mod == "A":
+        return [
+            f"TGA {df_all['WTREGEN'].iloc[-1]:.0f}B",
+            f"RRP {df_all['RRPONTSYD'].iloc[-1]:.1f}B",
+            f"NetLiqAdj {df_a['Score_NetLiq_Adj'].iloc[-1]:.1f}"
+        ]
+    if mod == "B":
+        return [
+            f"SOFR {df_all['SOFR'].iloc[-1]:.2f}",
+            f"IORB {df_all['IORB'].iloc[-1]:.2f}",
+            f"SRF {df_all['RPONTSYD'].iloc[-1]:.1f}B"
+        ]
+    if mod == "C":
+        return [
+            f"10Y-2Y {df_all['T10Y2Y'].iloc[-1]:.2f}",
+            f"10Y {df_all['DGS10'].iloc[-1]:.2f}",
+            f"Penalty {df_c['Penalty_Factor'].iloc[-1]:.1f}x"
+        ]
+    if mod == "D":
+        return [
+            f"10Y Real {df_all['DFII10'].iloc[-1]:.2f}",
+            f"Breakeven {df_all['T10YIE'].iloc[-1]:.2f}"
+        ]
+    if mod == "E":
+        return [
+            f"DXY chg {df_e['Chg_DXY'].iloc[-1]:.2%}",
+            f"Oil chg {df_e['Chg_Oil'].iloc[-1]:.2%}"
+        ]
+    if mod == "F":
+        return [
+            f"HY {df_f['HY_Spread'].iloc[-1]:.2f}%",
+            f"BAA10Y {df_f['BAA10Y'].iloc[-1]:.2f}%"
+        ] if not df_f.empty else ["data limited"]
+    if mod == "G":
+        return [
+            f"VIX {_last_valid(df_g, 'VIX', 0.0):.1f}",
+            f"VIX/VXV {_last_valid(df_g, 'VIX_VXV', 1.0):.2f}",
+            f"SPX mom {df_g['Score_Mom'].iloc[-1]:.1f}" if not df_g.empty else "SPX mom n/a"
+        ]
+    return []
+
+
+MODULE_NAMES = [
+    ("A", "Liquidity (A)"), ("B", "Funding (B)"), ("C", "Yield Curve (C)"), ("D", "Real Rates (D)"),
+    ("E", "External (E)"), ("F", "Credit (F)"), ("G", "Risk Appetite (G)"),
+]
+
+
+def build_report_context(df_all, frames, analog_ctx=None):
+    """以 df_all 最后一行为截止日，生成 AI 报告所需的结构化上下文"""
+    scores = latest_module_scores(frames)
+    total_score = scores['Total']
+    total_series = total_score_history(frames).reindex(df_all.index, method='ffill').dropna()
+    total_now = float(total_series.iloc[-1]) if not total_series.empty else total_score
+    total_1m = _safe_hist_value(total_series, 30) if not total_series.empty else total_score
+    total_3m = _safe_hist_value(total_series, 90) if not total_series.empty else total_score
+    total_1y = _safe_hist_value(total_series, 365) if not total_series.empty else total_score
+
+    breakdown = []
+    for key, name in MODULE_NAMES:
+        frame = frames.get(key)
+        if key in 'FG' and (frame is None or frame.empty):
+            hist_ctx = "n/a"
+        else:
+            hist_ctx = f"Score pct {_percentile_rank(frame['Total_Score']):.0f}"
+        breakdown.append({
+            "name": name,
+            "score": round(scores[key], 1),
+            "key_drivers": _top_drivers(key, df_all, frames),
+            "historical_context": hist_ctx,
+        })
+
+    return {
+        "meta": {
+            "data_cutoff_date": df_all.index[-1].strftime('%Y-%m-%d'),
+            "data_cutoff_month": df_all.index[-1].strftime('%Y年%m月'),
+        },
+        "summary": {
+            "overall_score": round(total_now, 1),
+            "vs_1m": round(total_now - total_1m, 1),
+            "vs_3m": round(total_now - total_3m, 1),
+            "vs_1y": round(total_now - total_1y, 1)
+        },
+        "module_breakdown": breakdown,
+        "regime_analysis": {
+            "current": _classify_regime(total_now),
+            **(analog_ctx or {})
+        },
+        "cross_asset_implications": {
+            "equities": "High real rates + inverted curve → Bearish",
+            "bonds": "Rising TGA + falling RRP → Duration risk",
+            "commodities": "Strong USD + energy spike → Mixed"
+        }
+    }
+
+
+def build_report_prompt(context_obj):
+    report_cutoff_date = context_obj["meta"]["data_cutoff_date"]
+    report_cutoff_month = context_obj["meta"]["data_cutoff_month"]
+    return f"""
+            你是一位顶级宏观策略师。基于以下结构化数据写一份Deep Research 市场分析报告:
+            {json.dumps(context_obj, ensure_ascii=False, indent=2)}
+
+            强约束:
+            1. 报告日期必须使用数据截止日：{report_cutoff_date}
+            2. 如果你写月度表达，只能写：{report_cutoff_month}
+            3. 不允许自行推断或虚构其它日期
+            4. 报告第一行必须是：报告日期（数据截止）: {report_cutoff_date}
+
+            请提供:
+            1. 当前宏观环境定性 (1句话)
+            2. 核心驱动因素分析 (Top 3)
+            3. 历史相似情境对比
+            4. 资产配置建议 (股/债/商品/现金/BTC)
+            5. 关键风险点及触发条件
+            6. 风格：专业、犀利、数据驱动
+            """
+
+
+# ==========================================
+# 2. LLM 调用 (落盘缓存 / 本地桩)
+# ==========================================
+def call_gemini_new_sdk(prompt, api_key):
+    from google import genai
+
+    client = genai.Client(api_key=api_key, http_options={'api_version': 'v1alpha'})
+    response = client.models.generate_content(
+        model='gemini-3-flash-preview',
+        contents=prompt
+    )
+    return response.text
+
+
+def stub_report(context_obj):
+    """本地桩：不调用 LLM，直接把结构化上下文排版成文本（离线批量 / 测试用）"""
+    summary = context_obj["summary"]
+    regime = context_obj["regime_analysis"]
+    lines = [
+        f"宏观综合得分 {summary['overall_score']} ({regime['current']})，"
+        f"较1月 {summary['vs_1m']:+.1f} / 较3月 {summary['vs_3m']:+.1f} / 较1年 {summary['vs_1y']:+.1f}",
+        "",
+        "模块拆解:",
+    ]
+    for mod in context_obj["module_breakdown"]:
+        lines.append(f"- {mod['name']}: {mod['score']}  [{mod['historical_context']}]  " + " | ".join(mod['key_drivers']))
+    if regime.get("last_similar"):
+        lines += ["", "历史相似情景: " + ", ".join(regime["last_similar"]), regime.get("what_happened_next", "")]
+    return "\n".join(lines)
+
+
+class ReportLLM:
+    """
+    mode = 'stub'  : 本地桩，不联网
+    mode = 'gemini': 调用 Gemini；结果按提示词 sha1 缓存在 cache_dir，重跑同一截止日不再计费
+    """
+
+    def __init__(self, mode='stub', api_key=None, cache_dir=DEFAULT_CACHE_DIR):
+        self.mode = mode
+        self.api_key = api_key
+        self.cache_dir = cache_dir
+
+    def _cache_path(self, prompt):
+        digest = hashlib.sha1(f"{self.mode}\n{prompt}".encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, f"{digest}.txt")
+
+    def generate(self, context_obj):
+        if self.mode == 'stub':
+            return stub_report(context_obj)
+        prompt = build_report_prompt(context_obj)
+        path = self._cache_path(prompt) if self.cache_dir else None
+        if path and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                return f.read()
+        text = call_gemini_new_sdk(prompt, self.api_key)
+        if path:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(text)
+        return text
+
+
+# ==========================================
+# 3. 批量生成
+# ==========================================
+def _panel_prices(df_all):
+    prices = pd.DataFrame(index=df_all.index)
+    prices["SPX"] = df_all["SP500"] if "SP500" in df_all.columns else np.nan
+    prices["BTC"] = df_all["CBBTCUSD"] if "CBBTCUSD" in df_all.columns else np.nan
+    return prices
+
+
+def resolve_cutoffs(index, dates):
+    """把请求日期对齐到当日或之前最近的交易日，去重保序"""
+    pos = index.get_indexer(pd.DatetimeIndex(dates), method='pad')
+    return list(dict.fromkeys(index[p] for p in pos if p >= 0))
+
+
+def point_in_time_context(df_all, cutoff, with_analogs=True):
+    """
+    截止日上下文：在截断到 cutoff 的面板上重算模块得分，只使用当时可见的数据
+    （A 模块按周重采样，直接切片全量结果会错过截止日所在的未完整周）。
+    截止日之前模块尚无有效得分时返回 None。
+    """
+    panel = df_all.loc[:cutoff]
+    frames = compute_module_frames(panel)
+    if any(_last_valid(frames.get(key), 'Total_Score', None) is None for key in 'ABCDE'):
+        return None
+    analog_ctx = None
+    if with_analogs:
+        analog_ctx = analog_context(*find_analogs(analog_index(frames, panel.index), _panel_prices(panel)))
+    return build_report_context(panel, frames, analog_ctx)
+
+
+# ---------- 进程池 worker：面板与 LLM 配置在初始化时传入一次 ----------
+_WORKER = {}
+
+
+def _init_worker(df_all, llm):
+    _WORKER['panel'] = df_all
+    _WORKER['llm'] = llm
+    _ensure_pdf_font()
+
+
+def _report_worker(job):
+    cutoff, out_dir = job
+    cutoff_date = cutoff.strftime('%Y-%m-%d')
+    context_obj = point_in_time_context(_WORKER['panel'], cutoff)
+    if context_obj is None:
+        return cutoff_date, None, 0
+    text = _WORKER['llm'].generate(context_obj)
+    body = clean_text_for_pdf(normalize_report_date(text, cutoff_date))
+    pdf = build_pdf_bytes(body, title=REPORT_TITLE)
+    path = os.path.join(out_dir, f"macro_report_{cutoff_date}.pdf")
+    with open(path, 'wb') as f:
+        f.write(pdf)
+    return cutoff_date, path, len(pdf)
+
+
+def generate_reports(df_all, dates, out_dir='reports', llm=None, workers=None, log=print):
+    """
+    批量生成：每个截止日在 worker 进程内完成 上下文 → 报告文本 → PDF。
+    返回 [(截止日, PDF 路径或 None, 字节数)]。
+    """
+    llm = llm or ReportLLM('stub')
+    os.makedirs(out_dir, exist_ok=True)
+    cutoffs = resolve_cutoffs(df_all.index, dates)
+    t0 = time.time()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(df_all, llm)) as pool:
+        results = list(pool.map(_report_worker, [(c, out_dir) for c in cutoffs]))
+    done = sum(1 for _, path, size in results if path and size)
+    log(f"报告 {done}/{len(cutoffs)} 份 ({llm.mode})，用时 {time.time() - t0:.1f}s")
+    return results
+
+
+def _panel_loader(args):
+    if args.panel_file:
+        from config import SERIES_UNITS, SOURCE_RULES
+        path = args.panel_file
+        panel = pd.read_pickle(path) if path.endswith('.pkl') else pd.read_csv(path, index_col=0, parse_dates=True)
+        return ingest_panel(panel, SERIES_UNITS, SOURCE_RULES)
+
+    from config import API_KEY, SERIES_IDS
+    from data_engine import fetch_mixed_data
+    return fetch_mixed_data(API_KEY, SERIES_IDS, start_date=args.start_date)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="批量生成 AI 宏观报告 PDF")
+    parser.add_argument('--dates', help="逗号分隔的截止日期")
+    parser.add_argument('--start', help="区间起点 (与 --end / --freq 配合)")
+    parser.add_argument('--end', help="区间终点，默认最新数据日")
+    parser.add_argument('--freq', default='W-WED', help="区间频率，默认每周三")
+    parser.add_argument('--llm', choices=['stub', 'gemini'], default='stub')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR)
+    parser.add_argument('--out', default='reports')
+    parser.add_argument('--workers', type=int, default=None, help="进程数，默认 CPU 核数")
+    parser.add_argument('--start-date', default='2010-01-01', help="在线拉取数据的起始日")
+    parser.add_argument('--panel-file', help="离线面板文件 (.pkl / .csv)")
+    args = parser.parse_args(argv)
+
+    df_all = _panel_loader(args).sort_index()
+    if args.dates:
+        dates = [d.strip() for d in args.dates.split(',') if d.strip()]
+    elif args.start:
+        dates = pd.date_range(args.start, args.end or df_all.index[-1], freq=args.freq)
+    else:
+        parser.error("需要 --dates 或 --start")
+
+    api_key = None
+    if args.llm == 'gemini':
+        from config import GEMINI_API_KEY
+        api_key = GEMINI_API_KEY
+    llm = ReportLLM(args.llm, api_key=api_key, cache_dir=args.cache_dir)
+    for cutoff_date, path, size in generate_reports(df_all, dates, args.out, llm, args.workers):
+        if path is None:
+            print(f"{cutoff_date}: 模块数据不足，跳过")
+        elif not size:
+            print(f"{cutoff_date}: PDF 渲染失败")
+
+
+if __name__ == '__main__':
+    main()
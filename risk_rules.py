@@ -0,0 +1,215 @@
+# risk_rules.py
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from analog_engine import forward_return_table
+from score_engine import align_weekly
+from shared_store import versioned_cache
+
+# ==========================================
+# 风险雷达规则：全历史向量化回放
+# ==========================================
+# 仪表盘“风险雷达”原先只对最新一行做标量 if 判断。这里把同一套规则写成整段历史上的
+# 布尔列 (日期 × 规则)，一次得到：
+# - 最新一行的触发状态（驱动雷达展示，与原标量判断口径一致）
+# - 每条规则的触发 / 解除日期（episode）
+# - 首次触发后 SPX 前瞻收益的命中率统计
+# 结果按数据版本缓存。
+
+RISK_RULES = OrderedDict([
+    ('tga_penalty', {'module': 'A', 'level': 'orange', 'name': 'TGA 水位 ≥ 800B'}),
+    ('liquidity_weak', {'module': 'A', 'level': 'red', 'name': 'A模块得分 < 40'}),
+    ('srf_usage', {'module': 'B', 'level': 'red', 'name': 'SRF 用量 > 10B'}),
+    ('sofr_above_iorb', {'module': 'B', 'level': 'orange', 'name': 'SOFR > IORB'}),
+    ('long_end_slope', {'module': 'C', 'level': 'red', 'name': '长端斜率惩罚'}),
+    ('deep_inversion', {'module': 'C', 'level': 'orange', 'name': '2s10s < -0.50'}),
+    ('real_rate_high', {'module': 'D', 'level': 'orange', 'name': '10Y 实际利率 > 2.0%'}),
+    ('yen_carry_unwind', {'module': 'E', 'level': 'red', 'name': 'USDJPY 5日跌幅 > 3%'}),
+    ('oil_spike', {'module': 'E', 'level': 'orange', 'name': 'WTI 20日涨幅 > 15%'}),
+    ('credit_stress', {'module': 'F', 'level': 'red', 'name': '信用压力 (F<40 / HY>6% / BAA>3%)'}),
+    ('risk_off', {'module': 'G', 'level': 'red', 'name': '风险厌恶 (G<40 / VIX>25 / 期限倒挂)'}),
+])
+
+RULE_HORIZONS = {'1M': 21, '3M': 63}
+
+
+def _col(df, col, index):
+    if df is None or df.empty or col not in df.columns:
+        return pd.Series(np.nan, index=index)
+    return df[col].reindex(index, method='ffill')
+
+
+def rule_matrix(df_all, frames):
+    """
+    规则 × 日期 布尔矩阵（index 与 df_all 一致）。
+    各模块表按日期前向对齐（只用当日已有的数据），周频 A 最后一天取 A 表最后一行；最新一行与雷达原有标量判断逐条一致（含 elif 互斥关系）。
+    """
+    idx = df_all.index
+
+    def raw(col):
+        return df_all[col] if col in df_all.columns else pd.Series(np.nan, index=idx)
+
+    df_c, df_f, df_g = frames.get('C'), frames.get('F'), frames.get('G')
+
+    # A 为周频：历史日期前向填充，最后一天与页面 score_a（A 表最后一行）一致
+    df_a = frames.get('A')
+    score_a = align_weekly(df_a['Total_Score'] if df_a is not None and not df_a.empty else None, idx)
+
+    srf = raw('RPONTSYD') > 10
+    long_end = _col(df_c, 'Penalty_Factor', idx) < 1.0
+
+    if df_f is not None and not df_f.empty:
+        score_f = df_f['Total_Score'].fillna(50.0).reindex(idx, method='ffill')
+        credit = (score_f < 40) | (_col(df_f, 'HY_Spread', idx) > 6.0) | (_col(df_f, 'BAA10Y', idx) > 3.0)
+    else:
+        credit = pd.Series(False, index=idx)
+
+    if df_g is not None and not df_g.empty:
+        score_g = df_g['Total_Score'].dropna().reindex(idx, method='ffill').fillna(50.0)
+        risk_off = (score_g < 40) | (_col(df_g, 'VIX', idx) > 25) | (_col(df_g, 'VIX_VXV', idx) > 1.0)
+    else:
+        risk_off = pd.Series(False, index=idx)
+
+    matrix = pd.DataFrame({
+        'tga_penalty': raw('WTREGEN') >= 800,
+        'liquidity_weak': score_a < 40,
+        'srf_usage': srf,
+        'sofr_above_iorb': ~srf & (raw('SOFR') > raw('IORB')),
+        'long_end_slope': long_end,
+        'deep_inversion': ~long_end & (raw('T10Y2Y') < -0.5),
+        'real_rate_high': raw('DFII10') > 2.0,
+        'yen_carry_unwind': raw('DEXJPUS').pct_change(5) < -0.03,
+        'oil_spike': raw('DCOILWTICO').pct_change(20) > 0.15,
+        'credit_stress': credit,
+        'risk_off': risk_off,
+    }, index=idx)
+    return matrix[list(RISK_RULES)].fillna(False).astype(bool)
+
+
+def _last(df, col, fallback=np.nan):
+    if df is None or df.empty or col not in df.columns:
+        return fallback
+    return df[col].iloc[-1]
+
+
+def latest_rule_state(df_all, frames):
+    """
+    只评估最新一行（雷达原有的标量判断）：各模块取自身表的最后一行。
+    告警进程只需最新状态时使用；也作为 rule_matrix 最新一行的对照。
+    """
+    def raw(col):
+        return df_all[col] if col in df_all.columns else pd.Series(np.nan, index=df_all.index)
+
+    def last_change(col, periods):
+        series = raw(col)
+        return series.pct_change(periods).iloc[-1] if len(series) > periods else np.nan
+
+    df_f, df_g = frames.get('F'), frames.get('G')
+    srf = raw('RPONTSYD').iloc[-1] > 10
+    long_end = _last(frames.get('C'), 'Penalty_Factor') < 1.0
+
+    credit = False
+    if df_f is not None and not df_f.empty:
+        score_f = _last(df_f, 'Total_Score', 50.0)
+        score_f = 50.0 if pd.isna(score_f) else score_f
+        credit = score_f < 40 or _last(df_f, 'HY_Spread') > 6.0 or _last(df_f, 'BAA10Y') > 3.0
+    risk_off = False
+    if df_g is not None and not df_g.empty:
+        valid_g = df_g['Total_Score'].dropna()
+        score_g = float(valid_g.iloc[-1]) if len(valid_g) else 50.0
+        risk_off = score_g < 40 or _last(df_g, 'VIX') > 25 or _last(df_g, 'VIX_VXV') > 1.0
+
+    state = {
+        'tga_penalty': raw('WTREGEN').iloc[-1] >= 800,
+        'liquidity_weak': _last(frames.get('A'), 'Total_Score') < 40,
+        'srf_usage': srf,
+        'sofr_above_iorb': (not srf) and raw('SOFR').iloc[-1] > raw('IORB').iloc[-1],
+        'long_end_slope': long_end,
+        'deep_inversion': (not long_end) and raw('T10Y2Y').iloc[-1] < -0.5,
+        'real_rate_high': raw('DFII10').iloc[-1] > 2.0,
+        'yen_carry_unwind': last_change('DEXJPUS', 5) < -0.03,
+        'oil_spike': last_change('DCOILWTICO', 20) > 0.15,
+        'credit_stress': credit,
+        'risk_off': risk_off,
+    }
+    return {rule: bool(state[rule]) for rule in RISK_RULES}
+
+
+def radar_consistency(df_all, frames, matrix=None):
+    """rule_matrix 最新一行与标量判断不一致的规则列表（应为空）"""
+    if matrix is None:
+        matrix = rule_matrix(df_all, frames)
+    latest = latest_rule_state(df_all, frames)
+    return [rule for rule in RISK_RULES if bool(matrix[rule].iloc[-1]) != latest[rule]]
+
+
+def rule_episodes(matrix):
+    """每段连续触发：规则 / 首次触发日 / 解除日 (仍在触发则为空) / 持续天数"""
+    cols = ['规则', '触发日', '解除日', '持续天数']
+    if matrix.empty:
+        return pd.DataFrame(columns=cols)
+    vals = matrix.to_numpy(dtype=np.int8)
+    padded = np.vstack([np.zeros((1, vals.shape[1]), np.int8), vals, np.zeros((1, vals.shape[1]), np.int8)])
+    edges = np.diff(padded, axis=0)
+    start_r, start_c = np.nonzero(edges == 1)
+    end_r, end_c = np.nonzero(edges == -1)
+    # 按 (列, 行) 排序后起止一一对应
+    s_order = np.lexsort((start_r, start_c))
+    e_order = np.lexsort((end_r, end_c))
+    start_r, start_c, end_r = start_r[s_order], start_c[s_order], end_r[e_order]
+
+    dates = matrix.index
+    n = len(dates)
+    ongoing = end_r >= n
+    out = pd.DataFrame({
+        '规则': np.asarray(matrix.columns)[start_c],
+        '触发日': dates[start_r],
+        '解除日': pd.DatetimeIndex(np.where(ongoing, np.datetime64('NaT'), dates[np.minimum(end_r, n - 1)].values)),
+        '持续天数': end_r - start_r,
+    })
+    return out.sort_values(['触发日', '规则']).reset_index(drop=True)
+
+
+def rule_hit_stats(matrix, episodes, prices, horizons=None):
+    """
+    命中率：以每段首次触发日为锚，统计之后的 SPX 前瞻收益；
+    命中 = 前瞻收益为负（风险提示之后市场确实走弱）。
+    """
+    horizons = horizons or RULE_HORIZONS
+    rows = []
+    fwd = forward_return_table(prices, episodes['触发日'], horizons) if not episodes.empty else None
+    for rule, spec in RISK_RULES.items():
+        mask = (episodes['规则'] == rule).to_numpy() if not episodes.empty else np.zeros(0, bool)
+        row = {
+            '规则': spec['name'],
+            '模块': spec['module'],
+            '当前触发': bool(matrix[rule].iloc[-1]) if not matrix.empty else False,
+            '触发次数': int(mask.sum()),
+            '触发占比': float(matrix[rule].mean()) if not matrix.empty else np.nan,
+        }
+        for label in horizons:
+            vals = fwd.loc[mask, (prices.columns[0], label)].to_numpy() if fwd is not None else np.array([])
+            vals = vals[~np.isnan(vals)]
+            row[f'{label}均值(%)'] = float(vals.mean()) if len(vals) else np.nan
+            row[f'{label}命中率'] = float((vals < 0).mean()) if len(vals) else np.nan
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+# ---------- 按数据版本缓存 ----------
+_REPLAY_CACHE = versioned_cache('risk_replay')
+
+
+def _replay(df_all, frames):
+    matrix = rule_matrix(df_all, frames)
+    episodes = rule_episodes(matrix)
+    spx = df_all[['SP500']] if 'SP500' in df_all.columns else pd.DataFrame({'SP500': pd.Series(dtype=float)})
+    stats = rule_hit_stats(matrix, episodes, spx)
+    return {'matrix': matrix, 'episodes': episodes, 'stats': stats}
+
+
+def risk_replay(df_all, frames, version=None):
+    """一次计算 规则矩阵 / episode / 命中率；version 非空时进程内缓存"""
+    return _REPLAY_CACHE.get(version, lambda: _replay(df_all, frames))
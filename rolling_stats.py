@@ -0,0 +1,244 @@
+# rolling_stats.py
+import bisect
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+# ==========================================
+# 批量滚动统计 (多窗口 / 多列一次调用)
+# ==========================================
+# 各模块对同类序列反复做滚动分位排名：A 用 156 周，F/G 用 756 天，B/C/D/E 用 1260 天，
+# B 另有 180 天分位上限。这里把“窗口 × 规格”合并成一次调用：相关因子作为一个二维块，
+# 同一 (窗口, min_periods) 的规格共用一个 pandas rolling 对象；排名 / 分位数走 pandas 的
+# 有序窗口 (skiplist) 扫描，每行 O(log w)，取代原先逐窗口 apply(lambda) 的 rank().iloc[-1]。
+# 结果与 pandas rolling.rank(pct=True) / rolling.quantile(linear) 口径一致。
+
+_CHUNK_ROWS = 256
+
+
+def rank_spec(window, min_periods=1, ascending=True, name=None):
+    """滚动百分位排名规格（average 并列，pct = 排名 / 窗口有效样本数）"""
+    return {
+        'kind': 'rank', 'window': int(window), 'min_periods': int(min_periods),
+        'ascending': bool(ascending),
+        'name': name or f"rank_{window}{'' if ascending else '_desc'}",
+    }
+
+
+def quantile_spec(window, q, min_periods=1, name=None):
+    """滚动分位数规格（linear 插值）"""
+    return {
+        'kind': 'quantile', 'window': int(window), 'min_periods': int(min_periods),
+        'q': float(q), 'name': name or f"q{q:g}_{window}",
+    }
+
+
+def _as_block(data):
+    """统一成 (n, k) float64 块，并记录还原输出所需的索引/列信息"""
+    if isinstance(data, pd.Series):
+        return data.to_numpy(dtype=np.float64).reshape(-1, 1), ('series', data.index, data.name)
+    if isinstance(data, pd.DataFrame):
+        return data.to_numpy(dtype=np.float64), ('frame', data.index, data.columns)
+    arr = np.asarray(data, dtype=np.float64)
+    if arr.ndim == 1:
+        return arr.reshape(-1, 1), ('array1d', None, None)
+    return arr, ('array2d', None, None)
+
+
+def _restore(out, meta):
+    kind, index, cols = meta
+    if kind == 'series':
+        return pd.Series(out[:, 0], index=index, name=cols)
+    if kind == 'frame':
+        return pd.DataFrame(out, index=index, columns=cols)
+    if kind == 'array1d':
+        return out[:, 0]
+    return out
+
+
+_TAIL = threading.local()
+
+
+@contextmanager
+def tail_rows(rows):
+    """
+    上下文内（当前线程）rolling_batch 只计算最后 rows 行，更早的行保持 NaN。
+    只需要最新若干行结果的场景（告警进程）用它跳过整段历史：只取最后 rows + 窗口 - 1 行计算，
+    这些行的窗口仍然完整，结果与全量计算一致。rows 为 None 时恢复全量计算。
+    """
+    prev = getattr(_TAIL, 'rows', None)
+    _TAIL.rows = None if rows is None else int(rows)
+    try:
+        yield
+    finally:
+        _TAIL.rows = prev
+
+
+def rolling_batch(data, specs):
+    """
+    多窗口 / 多列滚动统计，一次调用返回全部规格的结果。
+
+    data: Series / DataFrame / ndarray(n,) / ndarray(n, k)
+    specs: rank_spec / quantile_spec 列表
+    返回 {规格名: 与输入同形的结果}；rank 结果为 0-1 百分位。
+    """
+    block, meta = _as_block(data)
+    n, k = block.shape
+    specs = list(specs)
+    outputs = {spec['name']: np.full((n, k), np.nan) for spec in specs}
+    if n == 0 or not specs:
+        return {name: _restore(out, meta) for name, out in outputs.items()}
+
+    tail = getattr(_TAIL, 'rows', None)
+    first = 0 if tail is None else max(n - tail, 0)
+    max_w = max(spec['window'] for spec in specs)
+    # 只算最后 tail 行时，截取能覆盖其完整窗口的最短尾部
+    offset = max(first - (max_w - 1), 0)
+    frame = pd.DataFrame(block[offset:])
+
+    rollers = {}
+    for spec in specs:
+        key = (spec['window'], max(spec['min_periods'], 1))
+        roll = rollers.get(key)
+        if roll is None:
+            roll = rollers[key] = frame.rolling(key[0], min_periods=key[1])
+        if spec['kind'] == 'rank':
+            res = roll.rank(pct=True, ascending=spec['ascending'])
+        else:
+            res = roll.quantile(spec['q'])
+        outputs[spec['name']][first:] = res.to_numpy(dtype=np.float64)[first - offset:]
+
+    return {name: _restore(out, meta) for name, out in outputs.items()}
+
+
+def rolling_pct_rank(data, window, min_periods=1, ascending=True):
+    """单窗口滚动百分位排名（0-1），支持多列一起计算"""
+    spec = rank_spec(window, min_periods=min_periods, ascending=ascending, name='rank')
+    return rolling_batch(data, [spec])['rank']
+
+
+# ==========================================
+# 滚动分位数 (精确 / 近似) + 增量状态
+# ==========================================
+# 精确模式复用上面的 pandas 有序窗口扫描；窗口很长 (数千行) 时可切换到近似模式：
+# 按列固定分箱，累计直方图相减即得任意窗口的分布，分位数在箱内线性插值，
+# 开销与窗口长度无关，误差不超过一个箱宽。
+# (t-digest 一类流式草图不支持删除旧样本，不适合定长滑窗，这里用可相减的直方图代替。)
+
+def _binned_order_stat(cdf, counts, edges, rank):
+    """第 rank 个 (0 起) 有序样本的箱内估计：假设样本在箱内均匀分布"""
+    rows = np.arange(cdf.shape[0])
+    b = np.argmax(cdf > rank[:, None], axis=1)
+    inside = counts[rows, b]
+    before = cdf[rows, b] - inside
+    with np.errstate(invalid='ignore', divide='ignore'):
+        frac = np.where(inside > 0, (rank - before + 0.5) / inside, 0.5)
+    return edges[b] + np.clip(frac, 0, 1) * (edges[b + 1] - edges[b])
+
+
+def _approx_quantile_column(col, window, q, min_periods, bins, chunk_rows):
+    n = col.shape[0]
+    out = np.full(n, np.nan)
+    valid = ~np.isnan(col)
+    if not valid.any():
+        return out
+    lo, hi = np.min(col[valid]), np.max(col[valid])
+    if hi <= lo:
+        hi = lo + 1.0
+    edges = np.linspace(lo, hi, bins + 1)
+    idx = np.clip(np.searchsorted(edges, col, side='right') - 1, 0, bins - 1)
+
+    # cum[t] = 前 t 行的分箱计数
+    onehot = np.zeros((n + 1, bins), dtype=np.int32)
+    onehot[np.nonzero(valid)[0] + 1, idx[valid]] = 1
+    cum = np.cumsum(onehot, axis=0, dtype=np.int32)
+
+    for start in range(0, n, chunk_rows):
+        stop = min(start + chunk_rows, n)
+        rows = np.arange(start, stop)
+        counts = cum[rows + 1] - cum[np.maximum(rows + 1 - window, 0)]
+        nobs = counts.sum(axis=1)
+        # linear 口径：在第 floor(pos) 与其后一个有序样本之间插值，两者各自在所属箱内估计
+        pos = q * np.maximum(nobs - 1, 0)
+        r_lo = np.floor(pos)
+        r_hi = np.minimum(r_lo + 1, np.maximum(nobs - 1, 0))
+        cdf = np.cumsum(counts, axis=1)
+        v_lo = _binned_order_stat(cdf, counts, edges, r_lo)
+        v_hi = _binned_order_stat(cdf, counts, edges, r_hi)
+        val = v_lo + (v_hi - v_lo) * (pos - r_lo)
+        out[start:stop] = np.where(nobs >= max(min_periods, 1), val, np.nan)
+    return out
+
+
+def rolling_quantile(data, window, q, min_periods=1, method='exact', bins=512, chunk_rows=_CHUNK_ROWS):
+    """
+    滚动分位数，多列一次计算。
+    method='exact'  : 与 pandas rolling.quantile(q) (linear) 完全一致
+    method='approx' : 分箱直方图近似，适合超长窗口
+    """
+    if method == 'exact':
+        spec = quantile_spec(window, q, min_periods=min_periods, name='quantile')
+        return rolling_batch(data, [spec])['quantile']
+    if method != 'approx':
+        raise ValueError(f"未知的分位数模式: {method}")
+
+    block, meta = _as_block(data)
+    out = np.full(block.shape, np.nan)
+    for j in range(block.shape[1]):
+        out[:, j] = _approx_quantile_column(block[:, j], int(window), float(q), int(min_periods), int(bins), chunk_rows)
+    return _restore(out, meta)
+
+
+class RollingQuantileState:
+    """
+    定长窗口分位数的增量状态：每追加一行只做一次有序插入/删除，
+    用于日更场景（不必重算整段历史）。结果与 rolling_quantile(exact) 一致。
+    """
+
+    def __init__(self, columns, window, q, min_periods=1):
+        self.columns = list(columns)
+        self.window = int(window)
+        self.q = float(q)
+        self.min_periods = int(min_periods)
+        self._history = {col: [] for col in self.columns}
+        self._sorted = {col: [] for col in self.columns}
+
+    @classmethod
+    def from_frame(cls, df, window, q, min_periods=1):
+        """用历史数据的最后一个窗口初始化状态"""
+        state = cls(df.columns, window, q, min_periods)
+        tail = df.iloc[-state.window:]
+        for col in state.columns:
+            vals = tail[col].to_numpy(dtype=np.float64).tolist()
+            state._history[col] = vals
+            state._sorted[col] = sorted(v for v in vals if not np.isnan(v))
+        return state
+
+    def _value(self, col):
+        s = self._sorted[col]
+        if len(s) < max(self.min_periods, 1):
+            return np.nan
+        pos = self.q * (len(s) - 1)
+        lo = int(np.floor(pos))
+        hi = min(lo + 1, len(s) - 1)
+        frac = pos - lo
+        return s[lo] if frac == 0 else s[lo] + (s[hi] - s[lo]) * frac
+
+    def update(self, row):
+        """追加一行 (dict / Series)，返回各列当前分位数 {列: 值}"""
+        for col in self.columns:
+            val = float(row.get(col, np.nan))
+            hist, srt = self._history[col], self._sorted[col]
+            hist.append(val)
+            if not np.isnan(val):
+                bisect.insort(srt, val)
+            if len(hist) > self.window:
+                old = hist.pop(0)
+                if not np.isnan(old):
+                    del srt[bisect.bisect_left(srt, old)]
+        return self.current()
+
+    def current(self):
+        return {col: self._value(col) for col in self.columns}
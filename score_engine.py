@@ -0,0 +1,711 @@
+# score_engine.py
+import numpy as np
+import pandas as pd
+
+from rolling_stats import rolling_pct_rank, rolling_quantile, tail_rows
+
+# ==========================================
+# 0. 模块输入声明 (Factor Frame)
+# ==========================================
+# 每个模块只读取自己声明的输入列，派生列写入模块自己的窄表，
+# 渲染页 / Dashboard / 回测共用同一份计算，不再 df_all.copy() 整张面板。
+MODULE_INPUTS = {
+    'A': ['WALCL', 'WTREGEN', 'RRPONTSYD', 'WRESBAL'],
+    'B': ['SOFR', 'IORB', 'RRPONTSYAWARD', 'TGCRRATE', 'RPONTSYD'],
+    'C': ['DGS1MO', 'DGS3MO', 'DGS6MO', 'DGS1', 'DGS2', 'DGS3', 'DGS5', 'DGS7',
+          'DGS10', 'DGS20', 'DGS30', 'T10Y2Y', 'T10Y3M'],
+    'D': ['DFII10', 'DFII5', 'T10YIE'],
+    'E': ['DTWEXBGS', 'DXY', 'DEXJPUS', 'IRSTCI01JPM156N', 'DCOILWTICO', 'DHHNGSP'],
+    'F': ['BAMLH0A0HYM2', 'BAA10Y'],
+    'G': ['SP500', 'VIX', 'VXV'],
+}
+
+# 行级必需列（任一缺失则该行不参与计算）
+MODULE_REQUIRED = {
+    'A': ['WALCL', 'WTREGEN', 'RRPONTSYD', 'WRESBAL'],
+    'B': ['SOFR', 'IORB', 'RRPONTSYAWARD', 'TGCRRATE', 'RPONTSYD'],
+    'C': ['DGS10', 'DGS2', 'DGS30', 'T10Y2Y', 'T10Y3M'],
+    'D': ['DFII10', 'DFII5', 'T10YIE'],
+    'E': ['DTWEXBGS', 'DXY', 'DEXJPUS', 'IRSTCI01JPM156N', 'DCOILWTICO', 'DHHNGSP'],
+    'F': ['BAMLH0A0HYM2', 'BAA10Y'],
+    'G': ['SP500', 'VIX', 'VXV'],
+}
+
+# 综合得分权重（与 Dashboard 一致）
+MODULE_WEIGHTS = {
+    'A': 0.20, 'B': 0.20, 'C': 0.15, 'D': 0.15, 'E': 0.15, 'F': 0.075, 'G': 0.075,
+}
+
+
+def factor_frame(df_all, cols, required=None):
+    """
+    按声明列切出模块窄表：只物化输入列，行过滤与列选择一次完成。
+    缺少必需列时返回空表。
+    """
+    if df_all is None or df_all.empty:
+        return pd.DataFrame()
+    required = list(required or [])
+    if any(col not in df_all.columns for col in required):
+        return pd.DataFrame()
+    cols = [col for col in cols if col in df_all.columns]
+    if required:
+        mask = df_all[required].notna().all(axis=1).to_numpy()
+        return df_all.loc[mask, cols]
+    return df_all.loc[:, cols]
+
+
+# ==========================================
+# 0.1 派生序列 (Derived Series)
+# ==========================================
+# 由原始列派生、被多处读取的公共序列按名称登记（输入列 / 行级必需列 / 计算式）。
+# 日频序列每个数据版本只算一次，快照内与原始面板并列缓存，模块按名称读取；
+# freq='W-WED' 的序列在周频流动性面板上计算，随流动性面板一起物化。
+# 登记顺序即计算顺序：依赖其他派生序列的条目须排在其后。
+def _max_slope(f):
+    # 10Y / 30Y 60 天涨幅取大者（在模块 C 的有效行上差分）
+    return pd.concat([f['DGS10'].diff(60), f['DGS30'].diff(60)], axis=1).max(axis=1)
+
+
+DERIVED_SERIES = {
+    # 模块 A (周频)：净流动性与流动性吸收 (十亿美元)
+    'Net_Liquidity': {'inputs': ['WALCL', 'WTREGEN', 'RRPONTSYD'], 'freq': 'W-WED',
+                      'calc': lambda f: f['WALCL'] - f['WTREGEN'] - f['RRPONTSYD']},
+    'Liquidity_Sink': {'inputs': ['WTREGEN', 'RRPONTSYD'], 'freq': 'W-WED',
+                       'calc': lambda f: f['WTREGEN'] + f['RRPONTSYD']},
+    'Liquidity_Sink_Ratio': {'inputs': ['Liquidity_Sink', 'WALCL'], 'freq': 'W-WED',
+                             'calc': lambda f: (f['Liquidity_Sink'] / f['WALCL']).clip(lower=0)},
+
+    # 模块 B：利率走廊宽度与三类摩擦利差 / 比值
+    'Corridor_Width': {'inputs': ['IORB', 'RRPONTSYAWARD'], 'required': ['IORB', 'RRPONTSYAWARD'],
+                       'calc': lambda f: (f['IORB'] - f['RRPONTSYAWARD']).abs().clip(lower=0.05)},
+    'F1_Spread': {'inputs': ['SOFR', 'IORB'], 'required': ['SOFR', 'IORB'],
+                  'calc': lambda f: f['SOFR'] - f['IORB']},
+    'F1_Ratio': {'inputs': ['F1_Spread', 'Corridor_Width'], 'required': ['F1_Spread', 'Corridor_Width'],
+                 'calc': lambda f: f['F1_Spread'].clip(lower=0) / f['Corridor_Width']},
+    'F2_Spread': {'inputs': ['SOFR', 'RRPONTSYAWARD'], 'required': ['SOFR', 'RRPONTSYAWARD'],
+                  'calc': lambda f: f['SOFR'] - f['RRPONTSYAWARD']},
+    'F2_Ratio': {'inputs': ['F2_Spread', 'Corridor_Width'], 'required': ['F2_Spread', 'Corridor_Width'],
+                 'calc': lambda f: f['F2_Spread'].abs() / f['Corridor_Width']},
+    'F3_Spread': {'inputs': ['TGCRRATE', 'SOFR'], 'required': ['TGCRRATE', 'SOFR'],
+                  'calc': lambda f: f['TGCRRATE'] - f['SOFR']},
+    'F3_Ratio': {'inputs': ['F3_Spread', 'Corridor_Width'], 'required': ['F3_Spread', 'Corridor_Width'],
+                 'calc': lambda f: f['F3_Spread'].abs() / f['Corridor_Width']},
+
+    # 模块 C：长端动量
+    'Max_Slope': {'inputs': ['DGS10', 'DGS30'], 'required': MODULE_REQUIRED['C'], 'calc': _max_slope},
+
+    # 模块 G：VIX 期限结构（VIX / VXV 入库时已按来源优先级合并）
+    'VIX_VXV': {'inputs': ['VIX', 'VXV'], 'required': ['VIX', 'VXV'],
+                'calc': lambda f: f['VIX'] / f['VXV']},
+}
+
+# 各模块读取的派生序列（列顺序即写入模块表的顺序）
+MODULE_DERIVED = {
+    'A': ['Net_Liquidity', 'Liquidity_Sink', 'Liquidity_Sink_Ratio'],
+    'B': ['Corridor_Width', 'F1_Spread', 'F1_Ratio', 'F2_Spread', 'F2_Ratio', 'F3_Spread', 'F3_Ratio'],
+    'C': ['Max_Slope'],
+    'G': ['VIX_VXV'],
+}
+
+
+def _with_dependencies(names):
+    """补齐依赖的派生序列，按登记顺序返回"""
+    needed = set()
+
+    def visit(name):
+        if name in needed:
+            return
+        for col in DERIVED_SERIES[name]['inputs']:
+            if col in DERIVED_SERIES:
+                visit(col)
+        needed.add(name)
+
+    for name in names:
+        visit(name)
+    return [name for name in DERIVED_SERIES if name in needed]
+
+
+def _derive(work, names):
+    """在 work 上按顺序计算派生序列并追加为列；输入不足的序列跳过"""
+    for name in _with_dependencies(names):
+        spec = DERIVED_SERIES[name]
+        src = factor_frame(work, spec['inputs'], spec.get('required'))
+        if src.empty:
+            continue
+        value = spec['calc'](src)
+        if value is not None:
+            work[name] = value
+    return work
+
+
+def build_derived_frame(df_all, names=None):
+    """
+    日频派生序列表（与面板同索引，列 = 序列名）。names 缺省时计算全部日频序列。
+    快照刷新时构建一次；模块缺省时按需现场构建。
+    """
+    if df_all is None or df_all.empty:
+        return pd.DataFrame()
+    if names is None:
+        names = [name for name, spec in DERIVED_SERIES.items() if spec.get('freq', 'D') == 'D']
+    work = _derive(df_all.copy(deep=False), names)
+    return work[[name for name in _with_dependencies(names) if name in work.columns]]
+
+
+# ==========================================
+# 1. 公共打分函数
+# ==========================================
+def _rolling_percentile(data, window, min_periods, ascending=True):
+    """滚动百分位得分 (0-100)；传入 DataFrame 时多列一次扫描"""
+    return rolling_pct_rank(data, window, min_periods=min_periods, ascending=ascending) * 100
+
+
+def _mid_best_score(series, target, tol):
+    dev = (series - target).abs()
+    return (100 - (dev / tol * 80)).clip(0, 100)
+
+
+def _bounded_score(series):
+    return series.clip(lower=0, upper=100)
+
+
+# ==========================================
+# 2. 模块 A: 系统流动性 (周频)
+# ==========================================
+def _tga_penalty(tga_b):
+    if tga_b < 800: return 1.0
+    elif tga_b < 850: return 0.8
+    elif tga_b < 900: return 0.6
+    else: return 0.5
+
+
+def _tga_trend_penalty(delta_b):
+    if delta_b <= 0: return 1.0
+    elif delta_b <= 50: return 0.95
+    elif delta_b <= 100: return 0.9
+    elif delta_b <= 150: return 0.8
+    else: return 0.7
+
+
+def _sink_penalty(r):
+    if r < 0.10: return 1.0
+    elif r < 0.15: return 0.9
+    elif r < 0.20: return 0.8
+    elif r < 0.25: return 0.7
+    else: return 0.6
+
+
+def build_liquidity_panel(df_all):
+    """
+    周频 (W-WED) 流动性面板：WALCL / TGA / RRP / 准备金 一次重采样，
+    附带净流动性、流动性吸收与各项惩罚（金额单位：十亿美元，入库时已归一）。
+    刷新时物化一次，存入快照供模块 A、页面与回测共用。
+    """
+    raw = factor_frame(df_all, MODULE_INPUTS['A'])
+    if raw.empty or any(col not in raw.columns for col in MODULE_REQUIRED['A']):
+        return pd.DataFrame()
+
+    # 周频 (Week-Ending Wednesday)
+    df = raw[raw.index >= '2020-01-01'].resample('W-WED').last().ffill().dropna()
+    if df.empty:
+        return df
+
+    # 金额列入库时已统一为十亿美元
+    df['TGA_Penalty_Level'] = df['WTREGEN'].apply(_tga_penalty)
+    df['TGA_Change_4W'] = df['WTREGEN'].diff(4).fillna(0)
+    df['TGA_Penalty_Trend'] = df['TGA_Change_4W'].apply(_tga_trend_penalty)
+    df['TGA_Penalty_Total'] = df['TGA_Penalty_Level'] * df['TGA_Penalty_Trend']
+
+    # 净流动性、流动性吸收（TGA + RRP）及惩罚
+    df = _derive(df, MODULE_DERIVED['A'])
+    df['Sink_Penalty'] = df['Liquidity_Sink_Ratio'].apply(_sink_penalty)
+    return df
+
+
+# 周频模块（W-WED，标签为周三）：最后一行的标签可能晚于面板截止日
+WEEKLY_MODULES = ('A',)
+
+
+def align_weekly(series, index):
+    """
+    周频 (W-WED) 序列对齐到日频：历史日期前向填充（只用当日已公布的周度行，不看所在周尚未结束的数据）。
+    面板未止于周三时，序列最后一行的标签晚于面板末日，但它正是用截至末日的数据算出的，
+    所以最后一天取序列最后一行（与页面 iloc[-1] 一致）。
+    """
+    if series is None or series.empty:
+        return pd.Series(np.nan, index=index)
+    vals = series.reindex(index, method='ffill').to_numpy(dtype=float)
+    if len(index) and series.index[-1] >= index[-1]:
+        vals[-1] = float(series.iloc[-1])
+    return pd.Series(vals, index=index, name=series.name)
+
+
+def compute_module_a(df_all, liquidity=None):
+    """liquidity 为已物化的周频流动性面板（快照内共享），缺省时现场构建"""
+    weekly = build_liquidity_panel(df_all) if liquidity is None else liquidity
+    if weekly is None or weekly.empty:
+        return pd.DataFrame()
+    df = weekly.copy()
+
+    # 13周变化量的 156 周分位（四个因子一次扫描）
+    trend = pd.DataFrame({
+        'Score_Reserves': df['WRESBAL'].diff(13),
+        'Score_NetLiq': df['Net_Liquidity'].diff(13),
+        'Score_TGA': (-df['WTREGEN']).diff(13),
+        'Score_RRP': (-df['RRPONTSYD']).diff(13),
+    }, index=df.index)
+    scores = _rolling_percentile(trend, 156, 20)
+    for col in scores.columns:
+        df[col] = scores[col]
+
+    df['Score_NetLiq_Adj'] = df['Score_NetLiq'] * df['Sink_Penalty']
+    df['Total_Score'] = (
+        df['Score_NetLiq_Adj'] * 0.45 +
+        df['Score_TGA'] * 0.2 +
+        df['Score_RRP'] * 0.25 +
+        df['Score_Reserves'] * 0.1
+    ) * df['TGA_Penalty_Total']
+    return df
+
+
+# ==========================================
+# 3. 模块 B: 资金价格与走廊摩擦
+# ==========================================
+def _regime_bonus(sofr):
+    """根据利率绝对水平给予奖惩"""
+    if sofr < 1.0: return 20
+    elif sofr < 2.5: return 10
+    elif sofr > 5.0: return -20
+    elif sofr > 4.0: return -10
+    else: return 0
+
+
+def _ratio_to_score(series, max_ratio_series):
+    denom = max_ratio_series.replace(0, np.nan).ffill().fillna(0.5)
+    scaled = (series / denom).clip(lower=0, upper=1)
+    return (1 - scaled**1.6) * 100
+
+
+def compute_module_b(df_all, derived=None):
+    """derived 为已物化的日频派生序列表（快照内共享），缺省时现场构建"""
+    df = factor_frame(df_all, MODULE_INPUTS['B'], MODULE_REQUIRED['B'])
+    if df.empty:
+        return df
+    if derived is None:
+        derived = build_derived_frame(df_all, MODULE_DERIVED['B'])
+
+    # Part 1: 政策利率制度
+    df['SOFR_MA13'] = df['SOFR'].rolling(65, min_periods=1).mean()  # 13周*5天
+    df['SOFR_Trend'] = df['SOFR_MA13'].diff(21)
+    df['Score_Trend'] = _rolling_percentile(df['SOFR_Trend'], 1260, 1, ascending=False)
+    df['Regime_Bonus'] = df['SOFR'].apply(_regime_bonus)
+    df['Score_Policy'] = (df['Score_Trend'] + df['Regime_Bonus']).clip(0, 100)
+
+    # Part 2: 走廊摩擦（走廊宽度 / 利差 / 比值取自派生序列）
+    for col in MODULE_DERIVED['B']:
+        df[col] = derived[col]
+
+    # 高敏：滚动 180 天 85% 分位作为动态上限
+    # 上限为 0 时向前沿用最近的非零上限（可追溯任意远），因此始终全量计算
+    with tail_rows(None):
+        caps = rolling_quantile(df[['F1_Ratio', 'F2_Ratio', 'F3_Ratio']], 180, 0.85, min_periods=60)
+    df['F1_Max'] = caps['F1_Ratio']
+    df['F2_Max'] = caps['F2_Ratio']
+    df['F3_Max'] = caps['F3_Ratio']
+    df['Score_F1'] = _ratio_to_score(df['F1_Ratio'], df['F1_Max'])
+    df['Score_F2'] = _ratio_to_score(df['F2_Ratio'], df['F2_Max'])
+    df['Score_F3'] = _ratio_to_score(df['F3_Ratio'], df['F3_Max'])
+
+    # SRF 连续惩罚 (中心点 5B) + 动态权重
+    df['SRF_Penalty_Base'] = 100 / (1 + np.exp(-0.6 * (df['RPONTSYD'] - 5)))
+    df['SRF_Accel'] = df['RPONTSYD'].diff(3).clip(lower=0)
+    df['SRF_Penalty'] = (df['SRF_Penalty_Base'] + (df['SRF_Accel'] / 20).clip(0, 1) * 35).clip(0, 100)
+    df['Score_SRF'] = 100 - df['SRF_Penalty']
+    df['SRF_Weight'] = 0.10 + 0.15 * (df['SRF_Penalty'] / 100)
+    residual = 1 - df['SRF_Weight']
+    df['Score_Friction'] = (
+        df['Score_F1'] * residual * 0.4 +
+        df['Score_F2'] * residual * 0.3 +
+        df['Score_F3'] * residual * 0.3 +
+        df['Score_SRF'] * df['SRF_Weight']
+    )
+
+    # Part 3: 综合得分
+    df['Total_Score'] = df['Score_Policy'] * 0.40 + df['Score_Friction'] * 0.60
+    return df
+
+
+# ==========================================
+# 4. 模块 C: 国债曲线与期限结构
+# ==========================================
+def _slope_penalty(s):
+    # s = 60天内利率上涨了多少
+    if s > 0.50: return 0.2
+    elif s > 0.30: return 0.6
+    elif s > 0.15: return 0.8
+    else: return 1.0
+
+
+def compute_module_c(df_all, derived=None):
+    df = factor_frame(df_all, MODULE_INPUTS['C'], MODULE_REQUIRED['C'])
+    if df.empty:
+        return df
+    if derived is None:
+        derived = build_derived_frame(df_all, MODULE_DERIVED['C'])
+
+    # 绝对利率得分 (越低越好)：2Y/10Y/30Y 同块排名
+    levels = _rolling_percentile(df[['DGS10', 'DGS2', 'DGS30']], 1260, 1, ascending=False)
+    df['Score_10Y'] = levels['DGS10']
+    df['Score_2Y'] = levels['DGS2']
+    df['Score_30Y'] = levels['DGS30']
+    df['Score_Curve_2s10s'] = _mid_best_score(df['T10Y2Y'], 0.5, 1.5)
+    df['Score_Curve_3m10s'] = _mid_best_score(df['T10Y3M'], 0.75, 2.0)
+    df['Total_Score1'] = (
+        df['Score_Curve_2s10s'] * 0.30 +
+        df['Score_Curve_3m10s'] * 0.30 +
+        df['Score_10Y'] * 0.20 +
+        df['Score_2Y'] * 0.10 +
+        df['Score_30Y'] * 0.10
+    )
+
+    # 10Y/30Y 双重动量惩罚
+    df['Max_Slope'] = derived['Max_Slope']
+    df['Penalty_Factor'] = df['Max_Slope'].apply(_slope_penalty)
+    df['Total_Score'] = df['Total_Score1'] * df['Penalty_Factor']
+    return df
+
+
+# ==========================================
+# 5. 模块 D: 实际利率与通胀预期
+# ==========================================
+def compute_module_d(df_all):
+    df = factor_frame(df_all, MODULE_INPUTS['D'], MODULE_REQUIRED['D'])
+    if df.empty:
+        return df
+
+    real = _rolling_percentile(df[['DFII10', 'DFII5']], 1260, 1, ascending=False)
+    df['Score_Real_10Y'] = real['DFII10']
+    df['Score_Real_5Y'] = real['DFII5']
+    df['Score_Breakeven'] = _mid_best_score(df['T10YIE'], 2.1, 0.6)
+    df['Total_Score'] = (
+        df['Score_Real_10Y'] * 0.40 +
+        df['Score_Real_5Y'] * 0.30 +
+        df['Score_Breakeven'] * 0.30
+    )
+    return df
+
+
+# ==========================================
+# 6. 模块 E: 外部冲击与汇率
+# ==========================================
+def compute_module_e(df_all):
+    df = factor_frame(df_all, MODULE_INPUTS['E'])
+    if df.empty or any(col not in df.columns for col in MODULE_REQUIRED['E']):
+        return pd.DataFrame()
+    df = df.ffill().dropna(subset=MODULE_REQUIRED['E'])
+    if df.empty:
+        return df
+
+    # 美元 (涨=坏) / 日元 (USD/JPY 跌 = 坏) / 日本隔夜利率 (高=坏) / 能源 (涨=坏)
+    df['Chg_USD'] = df['DTWEXBGS'].pct_change(63)
+    df['Chg_DXY'] = df['DXY'].pct_change(63)
+    df['Yen_Appreciation'] = -1 * df['DEXJPUS'].pct_change(63)
+    df['Chg_Oil'] = df['DCOILWTICO'].pct_change(63)
+    df['Chg_Gas'] = df['DHHNGSP'].pct_change(63)
+
+    # 六个因子 1260 天分位一次扫描
+    factor_cols = ['Chg_USD', 'Chg_DXY', 'Yen_Appreciation', 'IRSTCI01JPM156N', 'Chg_Oil', 'Chg_Gas']
+    ranks = rolling_pct_rank(df[factor_cols], 1260, min_periods=1)
+    inverse = (1 - ranks) * 100
+
+    df['Score_USD'] = inverse['Chg_USD']
+    df['Score_DXY'] = inverse['Chg_DXY']
+    df['Score_Yen_FX'] = inverse['Yen_Appreciation']
+    df['Score_BoJ_Rate'] = inverse['IRSTCI01JPM156N']
+    df['Score_Yen_Total'] = df['Score_Yen_FX'] * 0.7 + df['Score_BoJ_Rate'] * 0.3
+    df['Score_Oil'] = inverse['Chg_Oil']
+    df['Score_Gas'] = inverse['Chg_Gas']
+    df['Score_Energy'] = df['Score_Oil'] * 0.5 + df['Score_Gas'] * 0.5
+
+    df['Total_Score'] = (
+        df['Score_USD'] * 0.2 +
+        df['Score_DXY'] * 0.2 +
+        df['Score_Yen_Total'] * 0.3 +
+        df['Score_Energy'] * 0.3
+    )
+    return df
+
+
+# ==========================================
+# 7. 模块 F: 信用压力
+# ==========================================
+def compute_module_f(df_all):
+    df = factor_frame(df_all, MODULE_INPUTS['F'], MODULE_REQUIRED['F'])
+    if df.empty:
+        return df
+
+    # 高收益利差 (高=坏) + BAA10Y(企业利差，作为稳态参考)
+    df['HY_Spread'] = df['BAMLH0A0HYM2']
+    pct = _rolling_percentile(pd.DataFrame({
+        'level': df['HY_Spread'],
+        'trend': -df['HY_Spread'].diff(13),
+        'baa': df['BAA10Y'],
+    }, index=df.index), 756, 30)
+    df['Score_HY_Level'] = 100 - pct['level']
+    df['Score_HY_Trend'] = pct['trend']
+    df['Score_BAA_Level'] = 100 - pct['baa']
+    df['Total_Score'] = _bounded_score(
+        df['Score_HY_Level'] * 0.5 +
+        df['Score_HY_Trend'] * 0.3 +
+        df['Score_BAA_Level'] * 0.2
+    )
+    return df
+
+
+# ==========================================
+# 8. 模块 G: 风险偏好
+# ==========================================
+def compute_module_g(df_all, derived=None):
+    df = factor_frame(df_all, MODULE_INPUTS['G'], MODULE_REQUIRED['G'])
+    if df.empty:
+        return df
+    if derived is None:
+        derived = build_derived_frame(df_all, MODULE_DERIVED['G'])
+    df['VIX_VXV'] = derived['VIX_VXV']
+
+    df['SPX'] = df['SP500']
+    pct = _rolling_percentile(pd.DataFrame({
+        'vix': df['VIX'],
+        'term': df['VIX_VXV'],
+        'mom': df['SPX'].diff(65),
+    }, index=df.index), 756, 30)
+    df['Score_VIX'] = _bounded_score(100 - pct['vix'])
+    df['Score_Term'] = _bounded_score(100 - pct['term'])
+    df['Score_Mom'] = _bounded_score(pct['mom'])
+    df['Total_Score'] = _bounded_score(
+        df['Score_Term'] * 0.4 +
+        df['Score_VIX'] * 0.3 +
+        df['Score_Mom'] * 0.3
+    )
+    return df
+
+
+# ==========================================
+# 9. 汇总
+# ==========================================
+MODULE_COMPUTERS = {
+    'A': compute_module_a,
+    'B': compute_module_b,
+    'C': compute_module_c,
+    'D': compute_module_d,
+    'E': compute_module_e,
+    'F': compute_module_f,
+    'G': compute_module_g,
+}
+
+
+def compute_module_frames(df_all, compact=None, liquidity=None, derived=None):
+    """
+    计算 A-G 全部模块窄表，返回 {模块: DataFrame}。
+    compact=None 时跟随面板精度：面板已压缩为 float32 则模块表同样压缩。
+    liquidity 为已物化的周频流动性面板，传入时模块 A 直接复用；
+    derived 为已物化的日频派生序列表，缺省时在此构建一次供 B / C / G 共用。
+    """
+    if compact is None:
+        compact = is_compact_frame(df_all)
+    if derived is None:
+        derived = build_derived_frame(df_all)
+    frames = {}
+    for key, func in MODULE_COMPUTERS.items():
+        if key == 'A':
+            frames[key] = func(df_all, liquidity)
+        elif key in MODULE_DERIVED:
+            frames[key] = func(df_all, derived)
+        else:
+            frames[key] = func(df_all)
+    if compact:
+        frames = {key: compact_frame(frame) for key, frame in frames.items()}
+    return frames
+
+
+def build_score_frame(frames, index):
+    """
+    将各模块窄表对齐到统一日期索引，合成总分与关键风险特征（回测 / 历史比对口径）。
+    """
+    def align(frame, col, fallback):
+        if frame is None or frame.empty or col not in frame.columns:
+            return pd.Series(fallback, index=index, dtype=float)
+        return frame[col].reindex(index, method='ffill').fillna(fallback).astype(float)
+
+    score_frame = pd.DataFrame(index=index)
+    total = pd.Series(0.0, index=index)
+    for key, weight in MODULE_WEIGHTS.items():
+        s_mod = align(frames.get(key), 'Total_Score', 50.0).clip(0, 100)
+        score_frame[f'Score_{key}'] = s_mod
+        total = total + s_mod * weight
+    score_frame.insert(0, 'Total_Score', total.clip(0, 100).astype(float))
+
+    # 关键惩罚机制（来自现有宏观模块）
+    score_frame['A_TGA_Penalty'] = align(frames.get('A'), 'TGA_Penalty_Total', 1.0).clip(0, 1.2)
+    score_frame['A_Sink_Penalty'] = align(frames.get('A'), 'Sink_Penalty', 1.0).clip(0, 1.0)
+    score_frame['B_SRF_Penalty'] = (align(frames.get('B'), 'SRF_Penalty', 0.0) / 100.0).clip(0, 1.0)
+    score_frame['G_VIXVXV'] = align(frames.get('G'), 'VIX_VXV', 1.0)
+    return score_frame
+
+
+def _last_valid(frame, col, fallback):
+    if frame is None or frame.empty or col not in frame.columns:
+        return fallback
+    s = frame[col].dropna()
+    return float(s.iloc[-1]) if len(s) else fallback
+
+
+def latest_module_scores(frames):
+    """
+    各模块最新得分：取各模块表自身的最后一行（与仪表盘卡片一致；周频 A 不经日频对齐），
+    模块表为空（数据尚未覆盖）或 F/G 缺失时按 50 处理。返回 {'A'..'G': 分数, 'Total': 加权综合分}。
+    """
+    scores = {}
+    for key in 'ABCDE':
+        frame = frames.get(key)
+        empty = frame is None or frame.empty or 'Total_Score' not in frame.columns
+        scores[key] = 50.0 if empty else float(frame['Total_Score'].iloc[-1])
+    scores['F'] = _last_valid(frames.get('F'), 'Total_Score', 50.0)
+    scores['G'] = _last_valid(frames.get('G'), 'Total_Score', 50.0)
+    scores['Total'] = sum(scores[key] * weight for key, weight in MODULE_WEIGHTS.items())
+    return scores
+
+
+def latest_penalties(frames):
+    """最新惩罚项：口径同 build_score_frame 的惩罚列，但取各模块表自身的最后一个有效值"""
+    return {
+        'A_TGA_Penalty': float(np.clip(_last_valid(frames.get('A'), 'TGA_Penalty_Total', 1.0), 0, 1.2)),
+        'A_Sink_Penalty': float(np.clip(_last_valid(frames.get('A'), 'Sink_Penalty', 1.0), 0, 1.0)),
+        'B_SRF_Penalty': float(np.clip(_last_valid(frames.get('B'), 'SRF_Penalty', 0.0) / 100.0, 0, 1.0)),
+        'G_VIXVXV': _last_valid(frames.get('G'), 'VIX_VXV', 1.0),
+    }
+
+
+# 得分立方的汇总频率：日频对齐一次，周 / 月频由日频 rollup（取期末值）
+SCORE_CUBE_FREQS = {'D': None, 'W': 'W-FRI', 'M': 'ME'}
+
+
+def build_score_cube(frames, index):
+    """
+    日期 × 模块 得分立方：各模块 Total_Score 前向对齐到 index 一次（模块表为空时记 50），
+    附带趋势口径的综合分 Total，并预先汇总周 / 月频。返回 {'D': 日频, 'W': 周频, 'M': 月频}。
+    """
+    daily = pd.DataFrame(index=index)
+    for key in MODULE_WEIGHTS:
+        frame = frames.get(key)
+        if frame is None or frame.empty or 'Total_Score' not in frame.columns:
+            daily[key] = 50.0
+        else:
+            daily[key] = frame['Total_Score'].reindex(index, method='ffill')
+
+    # 综合分：A 以外的模块缺失按 50 计；A 缺失、或日频 B 表尚未开始的日期记为缺失
+    total = daily['A'] * MODULE_WEIGHTS['A']
+    for key, weight in MODULE_WEIGHTS.items():
+        if key != 'A':
+            total = total + daily[key].fillna(50.0) * weight
+    frame_b = frames.get('B')
+    if frame_b is not None and not frame_b.empty:
+        total[index < frame_b.index[0]] = np.nan
+    daily.insert(0, 'Total', total)
+
+    cube = {'D': daily}
+    for freq, rule in SCORE_CUBE_FREQS.items():
+        if rule is not None:
+            cube[freq] = daily.resample(rule).last()
+    return cube
+
+
+# ==========================================
+# 10. 紧凑模式 (float32) 与内存报告
+# ==========================================
+# 分数有界 0-100，利率最多 4 位有效小数，float32 足够；
+# 面板与模块表统一压成单块连续 float32 内存（列名即列索引），内存减半。
+COMPACT_DTYPE = np.float32
+
+
+def compact_frame(df):
+    """将数值列压缩为一个连续的 float32 块，非数值列原样保留"""
+    if df is None or df.empty:
+        return df
+    num_cols = df.select_dtypes(include='number').columns
+    if len(num_cols) == 0:
+        return df
+    block = np.ascontiguousarray(df[num_cols].to_numpy(dtype=COMPACT_DTYPE))
+    out = pd.DataFrame(block, index=df.index, columns=num_cols, copy=False)
+    if len(num_cols) < df.shape[1]:
+        other = df.drop(columns=num_cols)
+        out = pd.concat([out, other], axis=1)[df.columns]
+    return out
+
+
+def is_compact_frame(df):
+    """面板的浮点列是否已全部为 float32"""
+    if df is None or df.empty:
+        return False
+    float_dtypes = df.select_dtypes(include='floating').dtypes
+    return len(float_dtypes) > 0 and bool((float_dtypes == COMPACT_DTYPE).all())
+
+
+def frame_memory_bytes(df):
+    if df is None or df.empty:
+        return 0
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+def memory_report(df_all, frames):
+    """按模块输出内存占用（面板 + A-G 模块表）"""
+    rows = [{
+        '对象': '面板 df_all',
+        '行数': 0 if df_all is None else len(df_all),
+        '列数': 0 if df_all is None else df_all.shape[1],
+        '精度': 'float32' if is_compact_frame(df_all) else 'float64',
+        '内存(MB)': frame_memory_bytes(df_all) / 1024 ** 2,
+    }]
+    for key, frame in frames.items():
+        rows.append({
+            '对象': f'模块 {key}',
+            '行数': 0 if frame is None else len(frame),
+            '列数': 0 if frame is None else frame.shape[1],
+            '精度': 'float32' if is_compact_frame(frame) else 'float64',
+            '内存(MB)': frame_memory_bytes(frame) / 1024 ** 2,
+        })
+    report = pd.DataFrame(rows)
+    total = report['内存(MB)'].sum()
+    report.loc[len(report)] = ['合计', np.nan, np.nan, '', total]
+    return report
+
+
+def validate_compact_mode(df_all):
+    """
+    校验紧凑模式：分别以 float64 / float32 计算全部模块，
+    返回 (偏差表, 内存对比表)。偏差 = 对齐到日频后 Total_Score 的最大绝对差。
+    """
+    index = df_all.sort_index().index
+    frames_64 = compute_module_frames(df_all, compact=False)
+    panel_32 = compact_frame(df_all)
+    frames_32 = compute_module_frames(panel_32, compact=True)
+    score_64 = build_score_frame(frames_64, index)
+    score_32 = build_score_frame(frames_32, index)
+
+    rows = []
+    for key in MODULE_WEIGHTS:
+        col = f'Score_{key}'
+        diff = (score_32[col] - score_64[col]).abs()
+        rows.append({'模块': key, '最大偏差': float(diff.max()), '平均偏差': float(diff.mean())})
+    diff_total = (score_32['Total_Score'] - score_64['Total_Score']).abs()
+    rows.append({'模块': '综合 Total_Score', '最大偏差': float(diff_total.max()), '平均偏差': float(diff_total.mean())})
+    deviation = pd.DataFrame(rows)
+
+    mem_64 = memory_report(df_all, frames_64)
+    mem_32 = memory_report(panel_32, frames_32)
+    memory = pd.DataFrame({
+        '对象': mem_64['对象'],
+        'float64(MB)': mem_64['内存(MB)'],
+        'float32(MB)': mem_32['内存(MB)'],
+    })
+    memory['节省比例'] = 1 - memory['float32(MB)'] / memory['float64(MB)'].replace(0, np.nan)
+    return deviation, memory
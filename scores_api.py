@@ -0,0 +1,343 @@
+# scores_api.py
+"""
+本地只读打分 API：执行 / 风控系统直接拉取 A-G 模块分、综合分与惩罚项，不必抓取 Streamlit 页面。
+
+接口 (GET):
+    /v1/health                              数据版本 / 截止日期
+    /v1/scores/latest                       最新综合分 + A-G 分 + 惩罚项
+    /v1/scores/history?start=&end=&format=  区间历史；format = json (默认) | arrow | parquet
+    /v1/factors?module=A&date=              模块因子细分 (默认全部模块、最新日期)
+
+所有响应带 ETag（数据版本 + 请求参数），命中 If-None-Match 返回 304；
+JSON 在客户端声明 Accept-Encoding: gzip 时压缩返回；arrow / parquet 需要 pyarrow。
+
+用法:
+    python scores_api.py --port 8600
+    python scores_api.py --port 8600 --panel-file panel.pkl        # 离线面板
+    python scores_api.py --bench http://127.0.0.1:8600/v1/scores/latest -n 2000 -c 16
+"""
+import argparse
+import gzip
+import hashlib
+import io
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+
+from score_engine import MODULE_WEIGHTS, WEEKLY_MODULES, latest_module_scores, latest_penalties
+from shared_store import SharedPanelStore, SourceMerger, ingest_panel
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow 为可选依赖
+    pa = None
+    pq = None
+
+# ==========================================
+# 0. 版本化响应
+# ==========================================
+RESPONSE_CACHE_SIZE = 256
+_MIN_GZIP_BYTES = 1024
+
+
+def _factor_columns(frame):
+    return [c for c in frame.columns if c == 'Total_Score' or c.startswith('Score_') or 'Penalty' in c]
+
+
+def _clean(value):
+    if value is None:
+        return None
+    if isinstance(value, (float, np.floating)):
+        return None if np.isnan(value) else round(float(value), 4)
+    if isinstance(value, np.integer):
+        return int(value)
+    return value
+
+
+def _row_dict(row):
+    return {key: _clean(val) for key, val in row.items()}
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class ScoreResponder:
+    """
+    基于快照生成响应体。同一数据版本下相同请求只序列化一次（进程内 LRU），
+    版本变化时缓存整体失效。
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._cache_version = None
+
+    # ---------- 缓存 ----------
+    def _cached(self, version, key, build):
+        with self._lock:
+            if self._cache_version != version:
+                self._cache.clear()
+                self._cache_version = version
+            hit = self._cache.get(key)
+            if hit is not None:
+                self._cache.move_to_end(key)
+                return hit
+        body, content_type = build()
+        gz = gzip.compress(body, 5) if content_type.startswith('application/json') and len(body) >= _MIN_GZIP_BYTES else None
+        etag = '"%s-%s"' % (version, hashlib.sha1(repr(key).encode('utf-8')).hexdigest()[:10])
+        entry = (etag, content_type, body, gz)
+        with self._lock:
+            if self._cache_version == version:
+                self._cache[key] = entry
+                while len(self._cache) > RESPONSE_CACHE_SIZE:
+                    self._cache.popitem(last=False)
+        return entry
+
+    # ---------- 路由 ----------
+    def respond(self, path, query):
+        snapshot = self.store.get()
+        if snapshot is None or snapshot.empty:
+            raise ApiError(503, '数据尚未就绪')
+        version = snapshot.version
+        if path == '/v1/health':
+            return self._cached(version, ('health',), lambda: self._json({
+                'version': version,
+                'as_of': snapshot.score_frame.index[-1].strftime('%Y-%m-%d'),
+                'loaded_at': snapshot.loaded_at,
+                'compact': snapshot.compact,
+            }))
+        if path == '/v1/scores/latest':
+            return self._cached(version, ('latest',), lambda: self._latest(snapshot))
+        if path == '/v1/scores/history':
+            start, end = query.get('start'), query.get('end')
+            fmt = (query.get('format') or 'json').lower()
+            return self._cached(version, ('history', start, end, fmt), lambda: self._history(snapshot, start, end, fmt))
+        if path == '/v1/factors':
+            module = (query.get('module') or '').upper() or None
+            date = query.get('date')
+            return self._cached(version, ('factors', module, date), lambda: self._factors(snapshot, module, date))
+        raise ApiError(404, f'未知接口: {path}')
+
+    # ---------- 具体响应 ----------
+    @staticmethod
+    def _json(obj):
+        return json.dumps(obj, ensure_ascii=False).encode('utf-8'), 'application/json; charset=utf-8'
+
+    def _latest(self, snapshot):
+        # 模块分取各模块表自身的最后一行（与仪表盘一致），不用总分表里前向填充的周频 A
+        scores = latest_module_scores(snapshot.frames)
+        return self._json({
+            'version': snapshot.version,
+            'date': snapshot.score_frame.index[-1].strftime('%Y-%m-%d'),
+            'total': _clean(scores['Total']),
+            'modules': {key: _clean(scores[key]) for key in MODULE_WEIGHTS},
+            'weights': MODULE_WEIGHTS,
+            'penalties': {col: _clean(val) for col, val in latest_penalties(snapshot.frames).items()},
+        })
+
+    @staticmethod
+    def _slice(frame, start, end):
+        try:
+            start = pd.Timestamp(start) if start else None
+            end = pd.Timestamp(end) if end else None
+        except ValueError:
+            raise ApiError(400, 'start / end 需为 YYYY-MM-DD')
+        return frame.loc[start:end]
+
+    def _history(self, snapshot, start, end, fmt):
+        hist = self._slice(snapshot.score_frame, start, end)
+        if fmt == 'json':
+            body = hist.to_json(orient='split', date_format='iso', date_unit='s', double_precision=4)
+            return body.encode('utf-8'), 'application/json; charset=utf-8'
+        if fmt not in ('arrow', 'parquet'):
+            raise ApiError(400, 'format 仅支持 json / arrow / parquet')
+        if pa is None:
+            raise ApiError(406, '服务端未安装 pyarrow，无法输出列式格式')
+
+        table = pa.Table.from_pandas(hist.rename_axis('date').reset_index(), preserve_index=False)
+        buf = io.BytesIO()
+        if fmt == 'arrow':
+            with pa.ipc.new_stream(buf, table.schema, options=pa.ipc.IpcWriteOptions(compression='zstd')) as writer:
+                writer.write_table(table)
+            return buf.getvalue(), 'application/vnd.apache.arrow.stream'
+        pq.write_table(table, buf, compression='zstd')
+        return buf.getvalue(), 'application/vnd.apache.parquet'
+
+    def _factors(self, snapshot, module, date):
+        """
+        各模块截至 date（默认数据截止日）的因子行，只用当日已有的数据。
+        数据截止日当天周频模块取其最后一行（标签可能晚于截止日）：返回的 date 不晚于截止日，周标签另给 period_end。
+        """
+        keys = [module] if module else list(MODULE_WEIGHTS)
+        if module and module not in snapshot.frames:
+            raise ApiError(404, f'未知模块: {module}')
+        data_end = as_of = snapshot.score_frame.index[-1]
+        if date:
+            try:
+                as_of = min(pd.Timestamp(date), as_of)
+            except ValueError:
+                raise ApiError(400, 'date 需为 YYYY-MM-DD')
+        out = {}
+        for key in keys:
+            frame = snapshot.frames.get(key)
+            if frame is None or frame.empty:
+                out[key] = None
+                continue
+            upto = as_of.to_period('W-WED').end_time.normalize() if key in WEEKLY_MODULES and as_of == data_end else as_of
+            view = frame.loc[:upto]
+            if view.empty:
+                out[key] = None
+                continue
+            label = view.index[-1]
+            entry = {
+                'date': min(label, as_of).strftime('%Y-%m-%d'),
+                'factors': _row_dict(view[_factor_columns(view)].iloc[-1]),
+            }
+            if label > as_of:
+                entry['period_end'] = label.strftime('%Y-%m-%d')
+            out[key] = entry
+        return self._json({'version': snapshot.version, 'modules': out})
+
+
+# ==========================================
+# 1. HTTP 服务
+# ==========================================
+def make_handler(responder):
+    class ScoresHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            parsed = urlparse(self.path)
+            query = {k: v[-1] for k, v in parse_qs(parsed.query).items()}
+            try:
+                etag, content_type, body, gz = responder.respond(parsed.path.rstrip('/') or '/', query)
+            except ApiError as e:
+                return self._send(e.status, json.dumps({'error': e.message}, ensure_ascii=False).encode('utf-8'),
+                                  'application/json; charset=utf-8')
+
+            if etag in [t.strip() for t in self.headers.get('If-None-Match', '').split(',')]:
+                return self._send(304, b'', None, etag=etag)
+            use_gzip = gz is not None and 'gzip' in self.headers.get('Accept-Encoding', '')
+            self._send(200, gz if use_gzip else body, content_type, etag=etag, gzip_encoded=use_gzip)
+
+        def _send(self, status, body, content_type, etag=None, gzip_encoded=False):
+            self.send_response(status)
+            if content_type:
+                self.send_header('Content-Type', content_type)
+            if etag:
+                self.send_header('ETag', etag)
+                self.send_header('Cache-Control', 'no-cache')
+            if gzip_encoded:
+                self.send_header('Content-Encoding', 'gzip')
+            self.send_header('Vary', 'Accept-Encoding')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            if body:
+                self.wfile.write(body)
+
+        def log_message(self, fmt, *args):
+            pass
+
+    return ScoresHandler
+
+
+def make_server(store, host='127.0.0.1', port=8600):
+    server = ThreadingHTTPServer((host, port), make_handler(ScoreResponder(store)))
+    server.daemon_threads = True
+    return server
+
+
+# ==========================================
+# 2. 本地压测
+# ==========================================
+def bench(url, requests=1000, concurrency=8, etag=False):
+    """简单并发压测：返回 请求数 / 失败数 / QPS / p50 / p95 (ms)"""
+    headers = {'Accept-Encoding': 'gzip'}
+    if etag:
+        with urllib.request.urlopen(url) as resp:
+            headers['If-None-Match'] = resp.headers.get('ETag', '')
+
+    def one(_):
+        t0 = time.perf_counter()
+        try:
+            with urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=10) as resp:
+                resp.read()
+            ok = True
+        except urllib.error.HTTPError as e:
+            ok = e.code == 304
+        except Exception:
+            ok = False
+        return ok, (time.perf_counter() - t0) * 1000
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(requests)))
+    elapsed = time.perf_counter() - started
+    lat = np.array([r[1] for r in results])
+    return {
+        'requests': requests,
+        'failed': int(sum(1 for r in results if not r[0])),
+        'qps': round(requests / elapsed, 1),
+        'p50_ms': round(float(np.percentile(lat, 50)), 2),
+        'p95_ms': round(float(np.percentile(lat, 95)), 2),
+    }
+
+
+def _panel_loader(args):
+    if args.panel_file:
+        from config import SERIES_UNITS, SOURCE_RULES
+        path = args.panel_file
+        read = lambda: pd.read_pickle(path) if path.endswith('.pkl') else pd.read_csv(path, index_col=0, parse_dates=True)
+        return lambda: ingest_panel(read(), SERIES_UNITS, SOURCE_RULES)
+
+    from config import API_KEY, SERIES_IDS, SOURCE_RULES
+    from data_engine import fetch_mixed_data
+    merger = SourceMerger(SOURCE_RULES)
+    return lambda: fetch_mixed_data(API_KEY, SERIES_IDS, start_date=args.start_date, merger=merger)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="宏观打分本地 API")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8600)
+    parser.add_argument('--ttl', type=int, default=3600, help="数据刷新间隔 (秒)")
+    parser.add_argument('--start-date', default='2010-01-01')
+    parser.add_argument('--panel-file', help="离线面板文件 (.pkl / .csv)")
+    parser.add_argument('--compact', action='store_true', help="float32 紧凑模式")
+    parser.add_argument('--bench', metavar='URL', help="对指定 URL 压测后退出")
+    parser.add_argument('-n', type=int, default=1000, help="压测请求数")
+    parser.add_argument('-c', type=int, default=8, help="压测并发数")
+    parser.add_argument('--etag', action='store_true', help="压测时携带 If-None-Match")
+    args = parser.parse_args(argv)
+
+    if args.bench:
+        print(json.dumps(bench(args.bench, args.n, args.c, args.etag), ensure_ascii=False))
+        return
+
+    store = SharedPanelStore(_panel_loader(args), ttl=args.ttl, compact=args.compact)
+    store.get()
+    server = make_server(store, args.host, args.port)
+    print(f"scores api on http://{args.host}:{args.port} (version {store.version})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
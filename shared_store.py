@@ -0,0 +1,420 @@
+# shared_store.py
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from score_engine import (
+    compute_module_frames, build_score_frame, build_score_cube, build_liquidity_panel, build_derived_frame,
+    compact_frame,
+)
+
+# ==========================================
+# 进程级共享面板 (所有 Streamlit 会话共用)
+# ==========================================
+# st.cache_data 会把 df_all 反序列化进每个会话：N 个用户 = N 份面板 + N 套模块表。
+# 这里在进程内只保留一份只读快照，各会话拿到的是零拷贝浅视图；
+# 刷新在后台构建新快照，完成后整体替换引用（原子切换），读者不会看到半成品。
+# 快照内各表的 attrs 带有数据版本，视图及其派生表会沿用，供图表缓存等按版本失效。
+
+DATA_VERSION_ATTR = 'data_version'
+UNITS_ATTR = 'units'
+
+# 原始单位 → (规范单位, 换算系数)；未列出的单位原样保留
+UNIT_CONVERSIONS = {
+    'USD_mn': ('USD_bn', 1e-3),
+    'USD_bn': ('USD_bn', 1.0),
+    'USD_tn': ('USD_bn', 1e3),
+    'bp': ('pct', 0.01),
+    'pct': ('pct', 1.0),
+}
+
+
+def normalize_units(df, units):
+    """
+    入库单位归一：按声明的原始单位把各列一次换算到规范单位（十亿美元 / 百分比），
+    换算后的单位记录在 attrs['units']；已记录的列不会重复换算。
+    """
+    if df is None or df.empty:
+        return df
+    done = dict(df.attrs.get(UNITS_ATTR) or {})
+    out = df.copy(deep=False)
+    for col in df.columns:
+        if col in done or col not in units:
+            continue
+        canonical, factor = UNIT_CONVERSIONS.get(units[col], (units[col], 1.0))
+        if factor != 1.0:
+            out[col] = df[col] * factor
+        done[col] = canonical
+    out.attrs[UNITS_ATTR] = done
+    return out
+
+
+def frame_units(df):
+    """读取面板各列的规范单位（未经 normalize_units 的表返回空字典）"""
+    if df is None:
+        return {}
+    return dict(df.attrs.get(UNITS_ATTR) or {})
+
+
+# ==========================================
+# 多源合并 (Yahoo / FRED 等重叠序列)
+# ==========================================
+# 同一概念有多个来源时，逐日按优先级取第一个“未过期”的来源：来源最近一次观测距今
+# 不超过 max_stale_days 天即视为有效；全部来源过期时沿用上一合并值并打过期标记。
+# 每个概念输出一列规范序列 + 一列来源位掩码 (<概念>_SRC)：
+# bit i = 取自第 i 个来源（按声明顺序），STALE_BIT = 全部来源过期、沿用旧值。
+PROVENANCE_SUFFIX = '_SRC'
+STALE_BIT = 0x80
+
+
+def _source_latest(values, dates, stale):
+    """各行该来源最近一次观测的值，及该观测是否仍在有效期内"""
+    pos = np.maximum.accumulate(np.where(np.isnan(values), -1, np.arange(len(values))))
+    seen = pos >= 0
+    pos = np.maximum(pos, 0)
+    fresh = seen & (dates - dates[pos] <= stale)
+    return values[pos], fresh
+
+
+def _merge_concept(raw, rule, head=None):
+    """
+    合并单个概念，返回 (值, 位掩码)。head 为上次合并结果中可直接沿用的前缀行
+    (列 = [值, 掩码])，此时只重算其后的行。
+    """
+    index = raw.index
+    dates = index.values
+    stale = np.timedelta64(int(rule.get('max_stale_days', 3)), 'D')
+    start = 0 if head is None else len(head)
+    # 有效期判断只需回看 max_stale_days
+    lo = index.searchsorted(index[start] - pd.Timedelta(stale)) if start < len(index) else start
+    m = len(index) - start
+
+    value = np.full(m, np.nan)
+    mask = np.zeros(m, dtype=np.uint8)
+    for bit, src in enumerate(rule['sources']):
+        if src not in raw.columns:
+            continue
+        latest, fresh = _source_latest(raw[src].to_numpy(dtype=float)[lo:], dates[lo:], stale)
+        latest, fresh = latest[start - lo:], fresh[start - lo:]
+        take = np.isnan(value) & fresh
+        value[take] = latest[take]
+        mask[take] = 1 << bit
+
+    # 全部来源过期：沿用上一合并值（含 head 的最后一行）
+    seed_val, seed_mask = np.nan, 0
+    if start:
+        seed_val, seed_mask = head.iloc[-1, 0], int(head.iloc[-1, 1])
+    value = np.concatenate([[seed_val], value])
+    mask = np.concatenate([[seed_mask], mask]).astype(np.uint8)
+    missing = np.isnan(value)
+    if missing.any():
+        last = np.maximum.accumulate(np.where(missing, 0, np.arange(len(value))))
+        carried = missing & ~np.isnan(value[last])
+        value = value[last]
+        mask = np.where(carried, mask[last] | STALE_BIT, mask).astype(np.uint8)
+    value, mask = value[1:], mask[1:]
+
+    if start:
+        value = np.concatenate([head.iloc[:, 0].to_numpy(dtype=float), value])
+        mask = np.concatenate([head.iloc[:, 1].to_numpy(dtype=np.uint8), mask])
+    return value, mask
+
+
+def _reusable_head(previous, raw, concept, rule):
+    """
+    上次合并结果中可沿用的前缀（末尾 max_stale_days 内的行需重算）；无法沿用时返回 None。
+    除日期前缀一致外，还要求来源组成相同且各来源列在前缀内逐值不变：
+    某次刷新缺了一个来源（如 Yahoo 下载失败）或来源历史被回补 / 修订时，整列重新合并。
+    """
+    cols = [concept, concept + PROVENANCE_SUFFIX]
+    if previous is None or previous.empty or any(col not in previous.columns for col in cols):
+        return None
+    sources = [src for src in rule['sources'] if src in raw.columns]
+    if sources != [src for src in rule['sources'] if src in previous.columns]:
+        return None
+    index = raw.index
+    stale = pd.Timedelta(days=int(rule.get('max_stale_days', 3)))
+    keep = previous.index.searchsorted(previous.index[-1] - stale)
+    if keep == 0 or keep > len(index) or not index[:keep].equals(previous.index[:keep]):
+        return None
+    if not raw[sources].iloc[:keep].equals(previous[sources].iloc[:keep]):
+        return None
+    return previous[cols].iloc[:keep]
+
+
+def merge_sources(raw, rules, previous=None):
+    """
+    多源合并：rules = {概念: {'sources': [优先级从高到低], 'max_stale_days': N}}。
+    来源列被替换为规范列 + 来源位掩码列。previous 为上次的合并状态
+    （规范列 + 掩码列 + 当时的来源列，见 SourceMerger）时增量更新，来源前缀有变化则整列重算。
+    """
+    if raw is None or raw.empty:
+        return raw
+    units = frame_units(raw)
+    out = raw.copy(deep=False)
+    consumed = []
+    for concept, rule in rules.items():
+        sources = [src for src in rule['sources'] if src in raw.columns]
+        if not sources:
+            continue
+        head = _reusable_head(previous, raw, concept, rule)
+        value, mask = _merge_concept(raw, rule, head)
+        out[concept] = value
+        out[concept + PROVENANCE_SUFFIX] = mask
+        consumed.extend(src for src in sources if src != concept)
+        if units:
+            units[concept] = units.get(sources[0])
+            units[concept + PROVENANCE_SUFFIX] = 'mask'
+    out = out.drop(columns=consumed)
+    if units:
+        out.attrs[UNITS_ATTR] = {col: unit for col, unit in units.items() if col not in consumed}
+    return out
+
+
+class SourceMerger:
+    """保留上次合并结果的多源合并器：新一轮数据到达时只重算末尾窗口"""
+
+    def __init__(self, rules):
+        self.rules = rules
+        self._last = None
+
+    def merge(self, raw):
+        merged = merge_sources(raw, self.rules, previous=self._last)
+        cols = [col for concept in self.rules for col in (concept, concept + PROVENANCE_SUFFIX)
+                if col in merged.columns]
+        # 连同本轮的来源列一起保存，下一轮据此判断前缀能否沿用
+        sources = [src for rule in self.rules.values() for src in rule['sources']
+                   if raw is not None and src in raw.columns and src not in cols]
+        self._last = pd.concat([merged[cols], raw[sources]], axis=1) if cols else None
+        return merged
+
+
+def ingest_panel(raw, units, rules, merger=None):
+    """入库流水线：单位归一 → 多源合并（来源优先级 / 过期规则）→ 前向填充"""
+    if raw is None or raw.empty:
+        return raw
+    panel = normalize_units(raw.sort_index(), units)
+    panel = merger.merge(panel) if merger is not None else merge_sources(panel, rules)
+    return panel.ffill()
+
+
+def freeze_frame(df):
+    """将数值列重建为只读的连续内存块（会话侧任何原地写入都会报错）"""
+    if df is None or df.empty:
+        return df
+    num_cols = df.select_dtypes(include='number').columns
+    if len(num_cols) < df.shape[1]:
+        return df
+    dtype = np.float32 if (df.dtypes == np.float32).all() else np.float64
+    block = np.array(df.to_numpy(dtype=dtype), copy=True, order='C')
+    block.flags.writeable = False
+    return pd.DataFrame(block, index=df.index, columns=df.columns, copy=False)
+
+
+def data_version(df):
+    """读取视图上的数据版本（仅快照视图带有，本地计算的表返回 None）"""
+    if df is None:
+        return None
+    return df.attrs.get(DATA_VERSION_ATTR)
+
+
+def _stamp(df, version):
+    if df is not None:
+        df.attrs[DATA_VERSION_ATTR] = version
+    return df
+
+
+def panel_version(df):
+    """数据版本：面板内容哈希（索引 + 数值），用作各类缓存键"""
+    if df is None or df.empty:
+        return 'empty'
+    digest = hashlib.sha1(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    digest.update(','.join(map(str, df.columns)).encode('utf-8'))
+    return digest.hexdigest()[:12]
+
+
+class PanelSnapshot:
+    """
+    一次刷新的完整结果（全部只读）：原始面板 + 日频派生序列 + 周频流动性面板 + A-G 模块表
+    + 对齐后的总分表 + 日 / 周 / 月 得分立方
+    """
+
+    def __init__(self, panel, frames, score_frame, version, compact=False, liquidity=None, units=None, derived=None,
+                 score_cube=None):
+        self.panel = panel
+        self.units = units or {}
+        self.derived = pd.DataFrame() if derived is None else derived
+        self.liquidity = pd.DataFrame() if liquidity is None else liquidity
+        self.frames = frames
+        self.score_frame = score_frame
+        self.score_cube = score_cube or {}
+        self.version = version
+        self.compact = compact
+        self.loaded_at = time.time()
+
+    @property
+    def empty(self):
+        return self.panel is None or self.panel.empty
+
+    def panel_view(self):
+        """零拷贝视图：共享底层只读数组，新增列只影响当前会话"""
+        return self.panel.copy(deep=False)
+
+    def derived_view(self):
+        """派生序列（与面板同索引），按名称读取"""
+        return self.derived.copy(deep=False)
+
+    def liquidity_view(self):
+        return self.liquidity.copy(deep=False)
+
+    def frame_view(self, key):
+        frame = self.frames.get(key)
+        return pd.DataFrame() if frame is None else frame.copy(deep=False)
+
+    def frames_view(self):
+        return {key: self.frame_view(key) for key in self.frames}
+
+    def score_view(self):
+        return self.score_frame.copy(deep=False)
+
+    def cube_view(self):
+        """得分立方 {'D' / 'W' / 'M': 日期 × 模块}，浅视图"""
+        return {freq: frame.copy(deep=False) for freq, frame in self.score_cube.items()}
+
+
+def build_snapshot(panel, compact=False):
+    """由原始面板构建只读快照（模块表 / 总分表只计算一次）"""
+    if panel is None or panel.empty:
+        return PanelSnapshot(pd.DataFrame(), {}, pd.DataFrame(columns=['Total_Score']), 'empty', compact)
+    units = frame_units(panel)
+    panel = panel.sort_index()
+    if compact:
+        panel = compact_frame(panel)
+    derived = build_derived_frame(panel)
+    liquidity = build_liquidity_panel(panel)
+    frames = compute_module_frames(panel, compact=compact, liquidity=liquidity, derived=derived)
+    score_frame = build_score_frame(frames, panel.index).dropna(subset=['Total_Score'])
+    score_cube = build_score_cube(frames, panel.index)
+    version = panel_version(panel)
+    if compact:
+        liquidity = compact_frame(liquidity)
+    panel = _stamp(freeze_frame(panel), version)
+    panel.attrs[UNITS_ATTR] = units
+    return PanelSnapshot(
+        panel=panel,
+        derived=_stamp(freeze_frame(derived), version),
+        liquidity=_stamp(freeze_frame(liquidity), version),
+        frames={key: _stamp(freeze_frame(frame), version) for key, frame in frames.items()},
+        score_frame=_stamp(freeze_frame(score_frame), version),
+        score_cube={freq: _stamp(freeze_frame(cube), version) for freq, cube in score_cube.items()},
+        version=version,
+        compact=compact,
+        units=units,
+    )
+
+
+class SharedPanelStore:
+    """
+    进程级快照仓库：
+    - 过期后只由一个会话负责刷新，其余会话继续读取旧快照（不阻塞）
+    - 新快照构建完成后一次性替换引用
+    - 刷新失败（返回空面板）时保留旧快照，稍后重试
+    """
+
+    def __init__(self, loader, ttl=3600, retry=300, compact=False):
+        self._loader = loader
+        self._ttl = ttl
+        self._retry = retry
+        self._compact = compact
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._next_refresh = 0.0
+
+    def _stale(self):
+        return self._snapshot is None or time.time() >= self._next_refresh
+
+    def _refresh(self):
+        snapshot = build_snapshot(self._loader(), compact=self._compact)
+        if snapshot.empty and self._snapshot is not None and not self._snapshot.empty:
+            self._next_refresh = time.time() + self._retry
+            return
+        self._snapshot = snapshot
+        self._next_refresh = time.time() + (self._retry if snapshot.empty else self._ttl)
+
+    def get(self):
+        """返回当前快照；首次加载阻塞等待，之后的刷新不阻塞其他会话"""
+        if not self._stale():
+            return self._snapshot
+        blocking = self._snapshot is None
+        if not self._lock.acquire(blocking=blocking):
+            return self._snapshot
+        try:
+            if self._stale():
+                self._refresh()
+        finally:
+            self._lock.release()
+        return self._snapshot
+
+    def invalidate(self):
+        """强制下次读取时刷新"""
+        self._next_refresh = 0.0
+
+    @property
+    def version(self):
+        return None if self._snapshot is None else self._snapshot.version
+
+
+# ==========================================
+# 按数据版本的进程内缓存
+# ==========================================
+# 各引擎的版本级结果 (Regime 表 / 相似期索引 / 规则回放 / 归因矩阵) 共用同一套 LRU：
+# 键为数据版本，version 为 None (本地计算的表) 时不缓存；同名缓存全进程只建一份。
+VERSIONED_CACHE_SIZE = 4
+_VERSIONED_CACHES = {}
+_VERSIONED_CACHES_LOCK = threading.Lock()
+
+
+class VersionedCache:
+    """按数据版本缓存单个结果，最多保留 size 个版本 (最近最少使用者先淘汰)"""
+
+    def __init__(self, name, size=VERSIONED_CACHE_SIZE):
+        self.name = name
+        self.size = size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, version, build):
+        """命中则返回缓存结果，否则调用 build() 计算并缓存"""
+        if version is None:
+            return build()
+        with self._lock:
+            hit = self._items.get(version)
+            if hit is not None:
+                self._items.move_to_end(version)
+        if hit is not None:
+            return hit
+
+        result = build()
+
+        with self._lock:
+            self._items[version] = result
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+def versioned_cache(name, size=VERSIONED_CACHE_SIZE):
+    """按名称取 (或新建) 一个版本缓存"""
+    with _VERSIONED_CACHES_LOCK:
+        cache = _VERSIONED_CACHES.get(name)
+        if cache is None:
+            cache = _VERSIONED_CACHES[name] = VersionedCache(name, size)
+        return cache